@@ -0,0 +1,38 @@
+import os
+
+import pygame
+
+from utils import get_baked_path, get_resource_path, load_manifest
+
+
+# Этот файл отвечает за подготовку ресурсов перед запуском игры:
+# изображения из манифеста уменьшаются до размеров, в которых они показываются в игре,
+# и сохраняются в кэш сборки, откуда их затем загружает load_image
+
+
+def bake():
+    """Подготовка всех изображений из манифеста"""
+
+    manifest = load_manifest()
+
+    for asset_name, sizes in manifest['images'].items():
+        # Загружаем исходное изображение один раз для всех его размеров
+        source = pygame.image.load(get_resource_path('image', asset_name))
+
+        for size in sizes:
+            size = tuple(size)
+            baked_path = get_baked_path(asset_name, size)
+
+            # Если подготовленное изображение новее исходного, то пропускаем его
+            if os.path.exists(baked_path) and \
+                    os.path.getmtime(baked_path) >= os.path.getmtime(get_resource_path('image', asset_name)):
+                continue
+
+            # Уменьшаем изображение и сохраняем его в кэш сборки
+            os.makedirs(os.path.dirname(baked_path), exist_ok=True)
+            pygame.image.save(pygame.transform.scale(source, size), baked_path)
+            print(f"{asset_name} -> {os.path.relpath(baked_path)}")
+
+
+if __name__ == "__main__":
+    bake()
@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+
+# Бенчмарк можно запускать без окна и звука
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+import utils
+from quest import QuestRoom
+
+
+# Этот файл сравнивает время отрисовки каждой стены основной комнаты
+# с изображениями в исходном формате и в формате экрана
+# Запуск: python -m benchmarks.blit [количество кадров]
+
+
+def measure(screen: pygame.Surface, convert: bool, frames: int) -> list[float]:
+    """Измерение среднего времени отрисовки каждой стены
+
+    :param screen: экран, на котором отрисовывается комната
+    :param convert: приводить ли изображения к формату экрана
+    :param frames: количество кадров для каждой стены
+    :return: среднее время отрисовки кадра в миллисекундах для каждой стены"""
+
+    # Загружаем комнату заново, чтобы изображения загрузились в нужном формате
+    utils.asset_cache.clear()
+    utils.convert_images = convert
+    room = QuestRoom()
+
+    results = []
+    for wall in range(4):
+        room.current_wall = wall
+        start = time.perf_counter()
+        for _ in range(frames):
+            # Каждый кадр собираем стену заново, чтобы измерять отрисовку всех объектов, а не кэша
+            room.invalidate_composite()
+            room.full_redraw = True
+            room.draw(screen)
+        results.append((time.perf_counter() - start) / frames * 1000)
+    return results
+
+
+def main():
+    """Запуск бенчмарка"""
+
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    pygame.mixer.pre_init(44100, -16, 1, 512)
+    pygame.init()
+    screen = pygame.display.set_mode((1086, 720))
+
+    before = measure(screen, False, frames)
+    after = measure(screen, True, frames)
+
+    print(f"{'стена':<8}{'исходный, мс':>16}{'формат экрана, мс':>20}{'ускорение':>12}")
+    for wall, (b, a) in enumerate(zip(before, after)):
+        print(f"{wall:<8}{b:>16.3f}{a:>20.3f}{b / a:>11.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+# Бенчмарк можно запускать без окна и звука
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+import utils
+from inventory import Item
+from main import Game
+
+
+# Этот файл измеряет скорость игры на основной комнате: время запуска, время обновления
+# и отрисовки каждой стены, поворот, меню паузы, инвентарь и память изображений.
+# Результаты сохраняются в JSON и могут сравниваться с результатами прошлой версии
+# Запуск: python -m benchmarks.suite [--frames N] [--output файл] [--baseline файл] [--threshold доля]
+
+# Изменения меньше этого значения в миллисекундах считаются шумом и не проверяются
+NOISE_FLOOR_MS = 0.25
+
+
+def timed_frame(game: Game) -> tuple[float, float]:
+    """Один кадр безголовой игры с измерением времени обновления и отрисовки
+
+    :param game: игра в безголовом режиме
+    :return: время обновления (вместе с обработкой событий) и отрисовки в миллисекундах"""
+
+    game.advance_time()
+    start = time.perf_counter()
+    game.events()
+    game.update()
+    middle = time.perf_counter()
+    game.draw()
+    return (middle - start) * 1000, (time.perf_counter() - middle) * 1000
+
+
+def summarize(samples: list[float]) -> dict:
+    """Сводка по измерениям
+
+    :param samples: время кадров в миллисекундах
+    :return: среднее, 95-й перцентиль и максимум"""
+
+    ordered = sorted(samples)
+    return {
+        'mean_ms': sum(ordered) / len(ordered),
+        'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'max_ms': ordered[-1]
+    }
+
+
+def measure_frames(game: Game, frames: int) -> dict:
+    """Измерение нескольких кадров подряд
+
+    :param game: игра в безголовом режиме
+    :param frames: количество кадров
+    :return: сводки по времени обновления, отрисовки и всего кадра"""
+
+    updates, draws = [], []
+    for _ in range(frames):
+        update_time, draw_time = timed_frame(game)
+        updates.append(update_time)
+        draws.append(draw_time)
+    return {
+        'update': summarize(updates),
+        'draw': summarize(draws),
+        'frame': summarize([u + d for u, d in zip(updates, draws)])
+    }
+
+
+def measure_redraws(game: Game, frames: int) -> dict:
+    """Измерение отрисовки всего экрана и сборки изображения стены
+
+    Кадры без изменений почти ничего не рисуют, поэтому отдельно измеряется перерисовка всего экрана
+    по готовому изображению стены и пересборка этого изображения вместе с перерисовкой
+
+    :param game: игра в безголовом режиме
+    :param frames: количество измерений каждого вида
+    :return: сводки по времени перерисовки экрана и пересборки изображения стены"""
+
+    room = game.room
+    redraws, rebuilds = [], []
+    for _ in range(frames):
+        room.full_redraw = True
+        start = time.perf_counter()
+        game.draw()
+        redraws.append((time.perf_counter() - start) * 1000)
+
+        room.invalidate_composite()
+        room.full_redraw = True
+        start = time.perf_counter()
+        game.draw()
+        rebuilds.append((time.perf_counter() - start) * 1000)
+    return {'full_redraw': summarize(redraws), 'composite_rebuild': summarize(rebuilds)}
+
+
+def surface_memory(game: Game) -> int:
+    """Оценка памяти всех изображений, до которых можно добраться из игры и кэшей
+
+    :param game: игра
+    :return: размер изображений в байтах, каждое изображение считается один раз"""
+
+    surfaces = {}
+
+    def add(value):
+        if isinstance(value, pygame.Surface):
+            surfaces[id(value)] = value
+        elif isinstance(value, pygame.sprite.Sprite):
+            add(getattr(value, 'image', None))
+        elif isinstance(value, dict):
+            for item in value.values():
+                add(item)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                add(item)
+
+    add(game.screen)
+    add([asset for asset, _ in utils.asset_cache.entries.values()])
+    add(utils.text_cache.entries)
+    add(utils.text_cache.glyphs)
+
+    room = game.room
+    add(room.composites)
+    add(room.backgrounds)
+    for obj in [*room.overlays, *(obj for wall in room.walls for obj in wall)]:
+        add(vars(obj))
+
+    return sum(utils.get_surface_size(surface) for surface in surfaces.values())
+
+
+def run_suite(frames: int) -> dict:
+    """Запуск всех измерений
+
+    :param frames: количество измеряемых кадров в каждом сценарии
+    :return: результаты"""
+
+    results = {}
+    peak_memory = 0
+
+    # Холодный запуск: инициализация pygame, загрузка ресурсов и создание комнаты
+    start = time.perf_counter()
+    game = Game(headless=True)
+    results['cold_start_ms'] = (time.perf_counter() - start) * 1000
+    room = game.room
+    game.step(10)
+
+    # Обновление и отрисовка каждой стены без действий игрока, перерисовка всего экрана
+    # и пересборка изображения стены
+    results['walls'] = []
+    for wall in range(4):
+        room.rotate(wall - room.current_wall)
+        game.step(2)
+        results['walls'].append({**measure_frames(game, frames), **measure_redraws(game, frames)})
+        peak_memory = max(peak_memory, surface_memory(game))
+
+    # Поворот через оверлей перехода, пока анимация не закончится
+    room.rotate(-room.current_wall)
+    game.step(2)
+    game.inject(pygame.KEYDOWN, key=pygame.K_RIGHT)
+    samples = []
+    while True:
+        samples.append(sum(timed_frame(game)))
+        if not room.needs_update() or len(samples) >= 600:
+            break
+    results['rotation'] = {'frames': len(samples), 'total_ms': sum(samples), **summarize(samples)}
+    peak_memory = max(peak_memory, surface_memory(game))
+
+    # Открытие меню паузы, кадры с открытым меню и закрытие
+    game.inject(pygame.KEYDOWN, key=pygame.K_ESCAPE)
+    open_time = sum(timed_frame(game))
+    paused = measure_frames(game, frames)
+    game.inject(pygame.KEYDOWN, key=pygame.K_ESCAPE)
+    close_time = sum(timed_frame(game))
+    results['pause_menu'] = {'open_ms': open_time, 'close_ms': close_time, 'paused': paused['frame']}
+    peak_memory = max(peak_memory, surface_memory(game))
+
+    # Инвентарь с восемью предметами: первая перерисовка и выбор предмета в каждом кадре
+    image = utils.load_image("paper.png", (24, 24))
+    for i in range(room.inventory.size):
+        room.inventory.add(Item(f"benchmark_{i}", f"предмет {i}", image))
+    fill_time = sum(timed_frame(game))
+    samples = []
+    for i in range(frames):
+        room.inventory.select(i % room.inventory.size)
+        samples.append(sum(timed_frame(game)))
+    results['inventory'] = {'items': len(room.inventory.items), 'fill_ms': fill_time, 'select': summarize(samples)}
+    peak_memory = max(peak_memory, surface_memory(game))
+
+    results['peak_surface_bytes'] = peak_memory
+    return results
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    """Преобразование вложенных результатов в плоский словарь
+
+    :param results: результаты
+    :param prefix: путь до текущего уровня
+    :return: словарь путь -> число"""
+
+    flat = {}
+    items = enumerate(results) if isinstance(results, list) else results.items()
+    for key, value in items:
+        path = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, (dict, list)):
+            flat.update(flatten(value, path))
+        elif isinstance(value, (int, float)):
+            flat[path] = value
+    return flat
+
+
+def find_regressions(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Поиск замедлений и роста памяти относительно прошлых результатов
+
+    :param results: текущие результаты
+    :param baseline: прошлые результаты
+    :param threshold: допустимый рост в долях (0.2 - на 20%)
+    :return: описания регрессий"""
+
+    current = flatten(results)
+    regressions = []
+    for path, old in flatten(baseline).items():
+        # Сравниваем только время и память, количество кадров и предметов не важно,
+        # а максимум одного кадра слишком зависит от случайных задержек системы
+        if not (path.endswith("_ms") or path.endswith("_bytes")) or path.endswith("max_ms") or path not in current:
+            continue
+        new = current[path]
+        if path.endswith("_ms") and new - old < NOISE_FLOOR_MS:
+            continue
+        if new > old * (1 + threshold):
+            regressions.append(f"{path}: {old:.3f} -> {new:.3f} (+{(new / old - 1) * 100 if old else float('inf'):.0f}%)")
+    return regressions
+
+
+def main():
+    """Запуск бенчмарка"""
+
+    parser = argparse.ArgumentParser(description="Бенчмарк основной комнаты")
+    parser.add_argument("--frames", type=int, default=120, help="количество кадров в каждом сценарии")
+    parser.add_argument("--output", help="файл, в который сохраняются результаты в JSON")
+    parser.add_argument("--baseline", help="файл с результатами прошлой версии для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимый рост времени и памяти в долях")
+    args = parser.parse_args()
+
+    results = {
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'frames': args.frames,
+        'results': run_suite(args.frames)
+    }
+
+    report = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(report)
+    else:
+        print(report)
+
+    # Сравниваем с прошлой версией и завершаемся с ошибкой, если есть регрессии
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = find_regressions(results['results'], baseline['results'], args.threshold)
+        for regression in regressions:
+            print("регрессия:", regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -36,6 +36,9 @@ class Inventory:
         self.selected = None
         self.room = room
 
+        # Счётчик изменений инвентаря, по нему интерфейс узнаёт, что его нужно перерисовать
+        self.version = 0
+
         # Загружаем звуки
         self.__pickup_sound = load_sound("pickup.mp3")
         self.__drop_sound = load_sound("drop.mp3")
@@ -49,6 +52,7 @@ class Inventory:
         if len(self.items) < self.size and self.get(item.uid) is None:
             # Если есть свободное место, то добавляем предмет
             self.items.append(item)
+            self.changed()
             self.room.channel.play(self.__pickup_sound)
             self.room.send_message("text", f"Вы подобрали {item.name}")
 
@@ -63,6 +67,7 @@ class Inventory:
             if item.uid == item_uid:
                 # Удаляем предмет из инвентаря
                 self.items.remove(item)
+                self.changed()
                 # Выходим из цикла
                 break
 
@@ -72,6 +77,7 @@ class Inventory:
         if self.selected is not None:
             self.items.pop(self.selected)
             self.selected = None
+            self.changed()
             self.room.channel.play(self.__drop_sound)
 
     def get(self, item_uid: str) -> Item:
@@ -103,6 +109,13 @@ class Inventory:
             self.selected = None
         else:
             self.selected = i
+        self.changed()
+
+    def changed(self):
+        """Отметка изменения инвентаря, будит подписанный на канал "inventory" интерфейс"""
+
+        self.version += 1
+        self.room.send_message("inventory", self.version)
 
     def get_selected(self) -> Item:
         """Получение выбранного предмета
@@ -1,14 +1,43 @@
+from __future__ import annotations
+
+import argparse
+import atexit
+import os
+import time
+
 import pygame
 import sys
+
+import utils
+from profiler import Profiler
 from quest import QuestRoom
-from utils import load_image
+from replay import InputRecorder, InputReplay, state_checksum
+from ui import apply_profiler_ui
+from utils import load_image, render_text, convert_pending_images, get_manifest_keys, AssetLoader
 
 
 class Game:
     """Основной класс игры, который отвечает за обработку событий, обновление и отрисовку"""
 
-    def __init__(self):
-        """Инициализация игры"""
+    def __init__(self, timings: bool = False, headless: bool = False, delta_time: float = 1 / 60,
+                 profile: bool = False, trace: str | None = None, record: str | None = None):
+        """Инициализация игры
+
+        :param timings: вывести ли время загрузки каждого ресурса
+        :param headless: запустить ли игру без окна и звука с фиксированным временем кадра
+        :param delta_time: время кадра в секундах в безголовом режиме
+        :param profile: включить ли профилировщик с оверлеем (показывается по F3)
+        :param trace: файл, в который при выходе сохраняется трассировка профилировщика
+        :param record: файл, в который записывается ввод игрока"""
+
+        # В безголовом режиме используем драйверы без окна и звука, а время идёт только по кадрам
+        self.headless = headless
+        self.fixed_delta_time = delta_time
+        self.simulated_time = 0
+        if headless:
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+            os.environ["SDL_AUDIODRIVER"] = "dummy"
+            utils.simulated_ticks = 0
 
         # Инициализация pygame
         pygame.mixer.pre_init(44100, -16, 1, 512)
@@ -20,30 +49,221 @@ class Game:
         pygame.display.set_caption("Ленина, 17")
         pygame.display.set_icon(load_image("teapot.png"))
 
+        # Приводим к формату экрана изображения, загруженные до создания окна
+        convert_pending_images()
+
         # Создание часов
         self.clock = pygame.time.Clock()
         self.delta_time = 0
 
+        # Номер текущего кадра
+        self.frame_index = 0
+
+        # Комната обновляется с фиксированным шагом независимо от частоты кадров: накопленное время
+        # расходуется шагами, но не больше max_catch_up шагов за кадр, чтобы медленная машина не отставала всё сильнее
+        self.tick = 1 / 60
+        self.accumulator = 0
+        self.max_catch_up = 5
+
+        # Максимальная частота кадров, пока в комнате что-то происходит
+        self.max_fps = 120
+
+        # Максимальное время ожидания события в миллисекундах, когда в комнате ничего не происходит
+        self.idle_timeout = 500
+
+        # Событие, которое разбудило игру при ожидании, оно обрабатывается раньше остальных
+        self.waited_event = None
+
+        # Текущий курсор мыши
+        self.cursor = pygame.SYSTEM_CURSOR_ARROW
+
+        # Загрузка ресурсов с экраном загрузки
+        self.load_assets(timings)
+
         # Создание комнаты
         self.room = QuestRoom()
 
-    def run(self):
-        """Основной игровой цикл"""
+        # Включение профилировщика
+        self.profiler = None
+        if profile or trace is not None:
+            self.profiler = Profiler(trace=trace is not None)
+            apply_profiler_ui(self.room, self.profiler)
+            if trace is not None:
+                atexit.register(self.profiler.dump_trace, trace)
+
+        # Запись ввода, которая завершается контрольной суммой состояния при выходе
+        self.recorder = None
+        if record is not None:
+            self.recorder = InputRecorder(record)
+            atexit.register(lambda: self.recorder.close(self.frame_index, self.room))
+
+    def load_assets(self, timings: bool):
+        """Параллельная загрузка общих ресурсов и ресурсов стен, которые загружены на старте,
+        с отображением прогресса
+
+        Комната при показе первой стены загружает и соседние с ней, поэтому их ресурсы тоже
+        загружаются здесь. Ресурсы противоположной стены загружаются комнатой при повороте
+
+        :param timings: вывести ли время загрузки каждого ресурса"""
+
+        loader = AssetLoader(get_manifest_keys(walls=(3, 0, 1)))
+
+        while not loader.finished:
+            # Окно должно отвечать на события, пока идёт загрузка
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    sys.exit()
+
+            # Добавляем в кэш загруженные ресурсы и рисуем полосу загрузки
+            progress = loader.poll()
+            self.screen.fill((0, 0, 0))
+            self.screen.blit(render_text("arkhip.ttf", 24, "Загрузка..."), (140, 300))
+            pygame.draw.rect(self.screen, (96, 96, 96), (140, 340, 806, 16), 1)
+            pygame.draw.rect(self.screen, (255, 255, 255), (142, 342, 802 * progress, 12))
+            pygame.display.flip()
+
+            # Ждём следующего ресурса, но не дольше кадра, чтобы окно продолжало отвечать
+            loader.wait(1 / 60)
+
+        if timings:
+            print(loader.report())
+
+    def run(self, frames: int | None = None):
+        """Основной игровой цикл
+
+        :param frames: количество кадров в безголовом режиме, None - бесконечно"""
+
+        # В безголовом режиме кадры идут без ожидания с фиксированным временем кадра
+        if self.headless:
+            while frames is None or frames > 0:
+                self.step()
+                if frames is not None:
+                    frames -= 1
+            return
 
         while True:
-            # Обновление часов (60 FPS)
-            # delta_time - время, прошедшее с прошлого кадра
-            self.delta_time = self.clock.tick(60) / 1000
+            if self.room.needs_update():
+                # Обновление часов
+                # delta_time - время, прошедшее с прошлого кадра
+                self.delta_time = self.clock.tick(self.max_fps) / 1000
+            else:
+                # Если ничего не анимируется, то ждём события вместо того, чтобы рисовать кадры впустую
+                self.wait_for_event()
+
+            self.frame()
+
+    def step(self, frames: int = 1):
+        """Продвижение безголовой игры на несколько кадров с фиксированным временем кадра
+
+        :param frames: количество кадров"""
+
+        for _ in range(frames):
+            self.advance_time()
+            self.frame()
 
-            # Вызов методов для обработки событий, обновления и отрисовки
+    def frame(self):
+        """Обработка событий, обновление и отрисовка одного кадра"""
+
+        self.frame_index += 1
+
+        # При записи игровое время не меняется внутри кадра, а время кадра записывается,
+        # чтобы воспроизведение прошло теми же шагами обновления и увидело те же таймеры
+        if self.recorder is not None:
+            if not self.headless:
+                utils.simulated_ticks = pygame.time.get_ticks()
+            self.recorder.record_frame(self.frame_index, self.delta_time)
+
+        if self.profiler is None:
             self.events()
             self.update()
             self.draw()
+            return
+
+        # С профилировщиком замеряем время каждой фазы кадра
+        self.profiler.frame()
+        for name, phase in (("events", self.events), ("update", self.update), ("draw", self.draw)):
+            start = time.perf_counter()
+            phase()
+            self.profiler.record(name, "phase", start)
+
+    def advance_time(self):
+        """Продвижение времени симуляции на один кадр в безголовом режиме"""
+
+        # Время симуляции считается в секундах, чтобы не накапливалась ошибка округления
+        self.simulated_time += self.fixed_delta_time
+        utils.simulated_ticks = round(self.simulated_time * 1000)
+        self.delta_time = self.fixed_delta_time
+
+    def replay(self, path: str, render: bool = True) -> tuple[str, str | None]:
+        """Воспроизведение записанного ввода в безголовой игре без ожидания
+
+        Каждый кадр получает записанное время кадра и игровое время, поэтому комната
+        обновляется столько же раз, сколько при записи, с какой бы частотой кадров она ни шла
+
+        :param path: путь к записи
+        :param render: отрисовывать ли кадры (без отрисовки проверяется только логика)
+        :return: контрольная сумма состояния после воспроизведения и сохранённая в записи"""
+
+        replay = InputReplay(path)
+        start_ticks = utils.get_ticks()
+        for frame in range(1, replay.frames + 1):
+            self.frame_index = frame
+            self.delta_time, ticks = replay.timings[frame]
+            utils.simulated_ticks = start_ticks + ticks
+            self.simulated_time = utils.simulated_ticks / 1000
+
+            # События передаются в комнату напрямую, а выход из игры завершает воспроизведение
+            try:
+                replay.apply(frame, self.room)
+            except SystemExit:
+                break
+            self.update()
+            if render:
+                self.draw()
+
+        return state_checksum(self.room), replay.checksum
+
+    def inject(self, event_type: int, **attributes):
+        """Добавление события ввода, которое будет обработано в следующем кадре
+
+        :param event_type: тип события pygame
+        :param attributes: атрибуты события (например, pos, button или key)"""
+
+        pygame.event.post(pygame.event.Event(event_type, **attributes))
+
+    def wait_for_event(self):
+        """Ожидание события ввода, пока в комнате ничего не происходит"""
+
+        # Ждём не дольше, чем до ближайшего таймера пробуждения объектов
+        timeout = self.idle_timeout
+        wake_time = self.room.time_until_wake()
+        if wake_time is not None:
+            timeout = max(1, min(timeout, wake_time))
+
+        event = pygame.event.wait(timeout)
+
+        # Запоминаем событие, чтобы его обработал метод events (если вернуть его в очередь,
+        # то оно окажется после событий, которые пришли вместе с ним)
+        if event.type != pygame.NOEVENT:
+            self.waited_event = event
+
+        # Время ожидания не считается временем кадра, иначе анимации, запущенные событием, перескочили бы
+        self.clock.tick()
+        self.delta_time = 0
 
     def events(self):
         """Обработка событий"""
 
-        for event in pygame.event.get():
+        events = pygame.event.get()
+        if self.waited_event is not None:
+            events.insert(0, self.waited_event)
+            self.waited_event = None
+
+        for event in events:
+            if self.recorder is not None:
+                self.recorder.record(self.frame_index, event)
+
             # Выход из игры
             if event.type == pygame.QUIT:
                 pygame.quit()
@@ -51,29 +271,80 @@ class Game:
             # Нажатие на кнопку мыши
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 self.room.click(event.pos)
+            # Движение мыши перетаскивает объект, а курсор над интерактивным объектом становится рукой
+            elif event.type == pygame.MOUSEMOTION:
+                cursor = pygame.SYSTEM_CURSOR_HAND if self.room.mouse_move(event.pos) else pygame.SYSTEM_CURSOR_ARROW
+                if cursor != self.cursor:
+                    self.cursor = cursor
+                    # Без оконной системы (например, с драйвером dummy) системных курсоров нет
+                    try:
+                        pygame.mouse.set_cursor(cursor)
+                    except pygame.error:
+                        pass
+            # Отпускание кнопки мыши завершает перетаскивание
+            elif event.type == pygame.MOUSEBUTTONUP:
+                self.room.mouse_up(event.pos)
             # Нажатие на клавишу
             elif event.type == pygame.KEYDOWN:
                 self.room.key_down(event.key)
 
     def update(self):
-        """Обновление состояния игры"""
+        """Обновление состояния игры фиксированными шагами"""
+
+        # Обновляем текущую комнату столько шагов, сколько накопилось времени
+        self.accumulator += self.delta_time
+        ticks = 0
+        while self.accumulator >= self.tick and ticks < self.max_catch_up:
+            self.room.update(self.tick)
+            self.accumulator -= self.tick
+            ticks += 1
+
+        # Если не успеваем, то отбрасываем лишнее время, анимации при этом замедляются, но не проскакивают
+        if self.accumulator >= self.tick:
+            self.accumulator %= self.tick
 
-        # Обновляем текущую комнату
-        self.room.update(self.delta_time)
+        # Объекты рисуются между двумя последними шагами
+        self.room.interpolate(self.accumulator / self.tick)
 
     def draw(self):
         """Отрисовка игры"""
 
-        # Заполнение экрана черным цветом
-        self.screen.fill((0, 0, 0))
-
         # Отрисовываем текущую комнату
-        self.room.draw(self.screen)
+        rects = self.room.draw(self.screen)
 
-        # Обновление экрана
-        pygame.display.flip()
+        # Обновление экрана (целиком или только изменившихся областей)
+        start = time.perf_counter()
+        if rects is None:
+            pygame.display.flip()
+        elif rects:
+            pygame.display.update(rects)
+        if self.profiler is not None:
+            self.profiler.record("display update", "phase", start)
 
 
 if __name__ == "__main__":
-    game = Game()
-    game.run()
+    parser = argparse.ArgumentParser(description="Ленина, 17")
+    parser.add_argument("--timings", action="store_true", help="вывести время загрузки каждого ресурса")
+    parser.add_argument("--headless", action="store_true", help="запустить без окна и звука с фиксированным временем кадра")
+    parser.add_argument("--frames", type=int, help="количество кадров в безголовом режиме")
+    parser.add_argument("--profile", action="store_true", help="включить профилировщик, оверлей показывается по F3")
+    parser.add_argument("--trace", help="сохранить при выходе трассировку для chrome://tracing или Perfetto")
+    parser.add_argument("--record", help="записать ввод игрока в файл")
+    parser.add_argument("--replay", help="воспроизвести запись ввода без окна и проверить состояние")
+    args = parser.parse_args()
+
+    # Воспроизведение записи всегда идёт без окна и завершается проверкой контрольной суммы
+    if args.replay:
+        game = Game(timings=args.timings, headless=True, profile=args.profile, trace=args.trace)
+        start = time.perf_counter()
+        checksum, expected = game.replay(args.replay)
+        print(f"кадров: {game.frame_index}, время: {time.perf_counter() - start:.2f} с")
+        print(f"контрольная сумма: {checksum}")
+        if expected is not None and checksum != expected:
+            print(f"ожидалась: {expected}")
+            sys.exit(1)
+        sys.exit(0)
+
+    game = Game(timings=args.timings, headless=args.headless, profile=args.profile, trace=args.trace,
+                record=args.record)
+    game.run(args.frames)
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import json
+import time
+from collections import deque
+
+
+# Этот файл отвечает за встроенный профилировщик, который включает в себя:
+# - Замер времени фаз кадра, обновлений объектов, хуков и обработчиков сообщений
+# - Скользящую статистику и гистограмму по последним замерам каждой метки
+# - Сохранение замеров в формате trace event для chrome://tracing и Perfetto
+
+
+class Profiler:
+    """Профилировщик, который собирает время выполнения участков кода по меткам"""
+
+    def __init__(self, window: int = 240, trace: bool = False, trace_limit: int = 500000):
+        """Создание профилировщика
+
+        :param window: количество последних замеров каждой метки для статистики
+        :param trace: записывать ли каждый замер для сохранения трассировки
+        :param trace_limit: максимальное количество записанных замеров"""
+
+        self.window = window
+
+        # Последние замеры в секундах для каждой метки: метка -> очередь
+        self.samples = {}
+
+        # Категория каждой метки (фаза, объект, хук, сообщение)
+        self.categories = {}
+
+        # Записанные замеры для трассировки
+        self.trace = trace
+        self.trace_limit = trace_limit
+        self.events = []
+        self.start_time = time.perf_counter()
+
+        # Количество кадров
+        self.frames = 0
+
+    def record(self, name: str, category: str, start: float, end: float | None = None):
+        """Запись замера
+
+        :param name: метка участка кода
+        :param category: категория метки
+        :param start: время начала по time.perf_counter
+        :param end: время конца по time.perf_counter, по умолчанию текущее время"""
+
+        if end is None:
+            end = time.perf_counter()
+
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen=self.window)
+            self.categories[name] = category
+        samples.append(end - start)
+
+        # Записываем замер в формате trace event (время в микросекундах)
+        if self.trace and len(self.events) < self.trace_limit:
+            self.events.append({
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': (start - self.start_time) * 1000000,
+                'dur': (end - start) * 1000000,
+                'pid': 0,
+                'tid': 0
+            })
+
+    def frame(self):
+        """Отметка начала нового кадра"""
+
+        self.frames += 1
+        if self.trace and len(self.events) < self.trace_limit:
+            self.events.append({
+                'name': 'frame',
+                'ph': 'i',
+                's': 'g',
+                'ts': (time.perf_counter() - self.start_time) * 1000000,
+                'pid': 0,
+                'tid': 0,
+                'args': {'frame': self.frames}
+            })
+
+    def stats(self, name: str) -> dict:
+        """Статистика по последним замерам метки
+
+        :param name: метка
+        :return: количество замеров, среднее, максимум и сумма в миллисекундах"""
+
+        samples = self.samples[name]
+        total = sum(samples)
+        return {
+            'count': len(samples),
+            'mean_ms': total / len(samples) * 1000,
+            'max_ms': max(samples) * 1000,
+            'total_ms': total * 1000
+        }
+
+    def histogram(self, name: str) -> list[tuple[int, int]]:
+        """Гистограмма последних замеров метки по степеням двойки
+
+        :param name: метка
+        :return: пары (верхняя граница в микросекундах, количество замеров) до последней непустой"""
+
+        counts = []
+        for duration in self.samples[name]:
+            # Номер корзины - количество бит во времени в микросекундах
+            bucket = int(duration * 1000000).bit_length()
+            if bucket >= len(counts):
+                counts.extend([0] * (bucket + 1 - len(counts)))
+            counts[bucket] += 1
+        return [(1 << bucket, count) for bucket, count in enumerate(counts)]
+
+    def worst(self, count: int = 8, category: str | None = None) -> list[tuple[str, dict]]:
+        """Метки, на которые ушло больше всего времени за последние замеры
+
+        :param count: количество меток
+        :param category: категория меток, None - все, кроме фаз
+        :return: пары (метка, статистика), начиная с самой долгой"""
+
+        names = [
+            name for name, name_category in self.categories.items()
+            if name_category == category or category is None and name_category != 'phase'
+        ]
+        stats = [(name, self.stats(name)) for name in names]
+        stats.sort(key=lambda item: item[1]['total_ms'], reverse=True)
+        return stats[:count]
+
+    def dump_trace(self, path: str):
+        """Сохранение записанных замеров в файл для chrome://tracing или Perfetto
+
+        :param path: путь к файлу"""
+
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, file)
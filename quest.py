@@ -3,7 +3,7 @@ import pygame
 from inventory import Item
 from room import Room, RoomObject
 from ui import apply_ui
-from utils import load_image, load_music, load_font
+from utils import load_image, load_music, blit_glyphs, preload_assets, load_asset
 from typing import Tuple, Union
 from pygame.surface import SurfaceType
 
@@ -19,126 +19,91 @@ class QuestRoom(Room):
         # Применение интерфейса к комнате
         apply_ui(self)
 
-        # Создание переменных
-        self.font = load_font("arkhip.ttf", 12)
+        # Закрепляем в кэше картинки, которые загружаются в обработчиках кликов
+        preload_assets(('image', "paper.png"), ('image', "tea.png"), ('image', "key.png"), pin=True)
 
         # Добавление объектов
         self.apply_objects()
 
+        # Загрузка стены, к которой повёрнут игрок, и её соседей
+        self.show_wall(self.current_wall)
+
         # Запуск музыки
-        load_music("bg.mp3")
-        pygame.mixer.music.set_volume(0.2)
-        pygame.mixer.music.play(-1)
+        if load_music("bg.mp3"):
+            pygame.mixer.music.set_volume(0.2)
+            pygame.mixer.music.play(-1)
 
     def apply_objects(self):
-        """Добавление объектов"""
-
-        # Загружаем картинки
-        paper_image = load_image("paper.png")
-        paper_image = pygame.transform.scale(paper_image, (24, 24))
-
-        tea_image = load_image("tea.png")
-        tea_image = pygame.transform.scale(tea_image, (100, 67))
-
-        cup_image = load_image("cup.png")
-        cup_image = pygame.transform.scale(cup_image, (50, 36))
-
-        book1_image = load_image("book1.png")
-        book1_image = pygame.transform.scale(book1_image, (25, 67))
-
-        book2_image = load_image("book2.png")
-        book2_image = pygame.transform.scale(book2_image, (50, 70))
-
-        book3_image = load_image("book3.png")
-        book3_image = pygame.transform.scale(book3_image, (33, 65))
-
-        book4_image = load_image("book4.png")
-        book4_image = pygame.transform.scale(book4_image, (33, 65))
-
-        solved_book_image = load_image("number_three.png")
-        solved_book_image = pygame.transform.scale(solved_book_image, (48, 65))
-
-        matryoshka_top_image = load_image("matryoshka_top.png")
-        matryoshka_top_image = pygame.transform.scale(matryoshka_top_image, (32, 32))
-
-        matryoshka_bottom_image = load_image("matryoshka_bottom.png")
-        matryoshka_bottom_image = pygame.transform.scale(matryoshka_bottom_image, (32, 32))
-
-        frame_of_picture = load_image("frame_2.png")
-        frame_of_picture = pygame.transform.scale(frame_of_picture, (280, 210))
-
-        piece_size = tuple(n / 2 for n in (215, 110))
-
-        first_piece_of_picture = load_image("first_piece_of_picture.png")
-        first_piece_of_picture = pygame.transform.scale(first_piece_of_picture, piece_size)
-
-        second_piece_of_picture = load_image("second_piece_of_picture.png")
-        second_piece_of_picture = pygame.transform.scale(second_piece_of_picture, piece_size)
-
-        third_piece_of_picture = load_image("third_piece_of_picture.png")
-        third_piece_of_picture = pygame.transform.scale(third_piece_of_picture, piece_size)
-
-        fourth_piece_of_picture = load_image("fourth_piece_of_picture.png")
-        fourth_piece_of_picture = pygame.transform.scale(fourth_piece_of_picture, piece_size)
+        """Добавление объектов
 
-        back_of_picture = load_image("number_five.png")
-        back_of_picture = pygame.transform.scale(back_of_picture, (215, 110))
+        Объекты каждой стены создаются при её первой загрузке"""
 
-        case_image = load_image("case.png")
-        case_image = pygame.transform.scale(case_image, (125, 80))
+        self.add_wall_builder(0, self.apply_front_wall)
+        self.add_wall_builder(1, self.apply_right_wall)
+        self.add_wall_builder(2, self.apply_back_wall)
+        self.add_wall_builder(3, self.apply_left_wall)
 
-        door_image = load_image("door.png")
-        door_image = pygame.transform.scale(door_image, (376 * 0.83, 657 * 0.83))
+    def apply_front_wall(self):
+        """Добавление объектов на стену 0 (переднюю)"""
 
-        teapot_image = load_image("teapot.png")
-        teapot_image = pygame.transform.scale(teapot_image, (100, 100))
-
-        lamp_off_image = load_image("lamp_off.png")
-        lamp_off_image = pygame.transform.scale(lamp_off_image, (100, 150))
-
-        lamp_on_image = load_image("lamp_on.png")
-        lamp_on_image = pygame.transform.scale(lamp_on_image, (100, 150))
-
-        lamp_on_empty_image = load_image("lamp_on_empty.png")
-        lamp_on_empty_image = pygame.transform.scale(lamp_on_empty_image, (100, 150))
-
-        sink_on_image = load_image("kran_on.png")
-        sink_on_image = pygame.transform.scale(sink_on_image, (64, 75))
-
-        sink_off_image = load_image("kran_off.png")
-        sink_off_image = pygame.transform.scale(sink_off_image, (50, 75))
+        # Загружаем картинки
+        paper_image = load_image("paper.png", (24, 24))
+        tea_image = load_image("tea.png", (100, 67))
+        teapot_image = load_image("teapot.png", (100, 100))
+        sink_on_image = load_image("kran_on.png", (64, 75))
+        sink_off_image = load_image("kran_off.png", (50, 75))
 
         # Создаем объект чая и привязываем к нему функцию по клику
         tea_object = RoomObject(tea_image, (400, 320))
         tea_object.click_hook = self.click_tea
+        tea_object.static = True
 
         # Создаём прозрачный объект раковины
         sink_object = RoomObject(sink_off_image, (560, 305))
         sink_object.click_hook = self.click_sink
         sink_object.off_image = sink_off_image
         sink_object.on_image = sink_on_image
+        sink_object.set_image_hook(('running',), self.compose_sink)
+        sink_object.static = True
 
         # Создаем объект чайника и привязываем к нему функцию по клику
         teapot_object = RoomObject(teapot_image, (200, 290))
         teapot_object.click_hook = self.click_teapot
+        teapot_object.static = True
 
         # Создаем кусочек картинки 3
         paper_piece3 = RoomObject(pygame.transform.rotate(paper_image, 90), (720, 220))
-        paper_piece3.update_hook = self.update_piece
+        paper_piece3.subscribe('taken', self.hide_piece)
         paper_piece3.click_hook = self.get_piece_click_handler(3)
+        paper_piece3.static = True
 
         # Добавляем объекты в комнату на стену 0 (переднюю)
         self.add_objects(tea_object, paper_piece3, teapot_object, sink_object, wall=0)
 
+    def apply_right_wall(self):
+        """Добавление объектов на стену 1 (правую)"""
+
+        # Загружаем картинки
+        paper_image = load_image("paper.png", (24, 24))
+        back_of_picture = load_image("number_five.png", (215, 110))
+
+        frame_of_picture = load_image("frame_2.png", (280, 210))
+
+        piece_size = (107, 55)
+        first_piece_of_picture = load_image("first_piece_of_picture.png", piece_size)
+        second_piece_of_picture = load_image("second_piece_of_picture.png", piece_size)
+        third_piece_of_picture = load_image("third_piece_of_picture.png", piece_size)
+        fourth_piece_of_picture = load_image("fourth_piece_of_picture.png", piece_size)
+
         # Создаем кусочек картинки 4
         paper_piece4 = RoomObject(pygame.transform.rotate(paper_image, 90), (600, 400))
-        paper_piece4.update_hook = self.update_piece
+        paper_piece4.subscribe('taken', self.hide_piece)
         paper_piece4.click_hook = self.get_piece_click_handler(4)
+        paper_piece4.static = True
 
         # Создаём рамку
         frame_of_picture_obj = RoomObject(frame_of_picture, (800, 260))
         frame_of_picture_obj.click_hook = self.click_frame
-        frame_of_picture_obj.update_hook = self.update_frame
         frame_of_picture_obj.frame = frame_of_picture
         frame_of_picture_obj.flipped = back_of_picture
         frame_of_picture_obj.pieces = [
@@ -147,34 +112,73 @@ class QuestRoom(Room):
             third_piece_of_picture,
             fourth_piece_of_picture
         ]
+        frame_of_picture_obj.set_image_hook(
+            ('flipped', 'piece_1', 'piece_2', 'piece_3', 'piece_4'),
+            self.compose_frame
+        )
+        frame_of_picture_obj.static = True
 
         # Добавляем объекты в комнату на стену 1 (правую)
         self.add_objects(paper_piece4, frame_of_picture_obj, wall=1)
 
+    def apply_back_wall(self):
+        """Добавление объектов на стену 2 (заднюю)"""
+
+        # Загружаем картинки
+        case_image = load_image("case.png", (125, 80))
+        lamp_off_image = load_image("lamp_off.png", (100, 150))
+        lamp_on_image = load_image("lamp_on.png", (100, 150))
+        lamp_on_empty_image = load_image("lamp_on_empty.png", (100, 150))
+
         # Создаем лампу
         lamp = RoomObject(lamp_off_image, (864, 300))
         lamp.click_hook = self.click_lamp
+        # Верёвка лампы тонкая, поэтому клик проверяется по всей области, а не по пикселям
+        lamp.pixel_hit = False
         lamp.off_image = lamp_off_image
         lamp.on_image = lamp_on_image
         lamp.on_empty_image = lamp_on_empty_image
+        lamp.set_image_hook(('on', 'piece_taken'), self.compose_lamp)
+        lamp.static = True
 
         # Создаем объект шкатулки и привязываем к нему функцию по клику
         case_object = RoomObject(case_image, (620, 375))
         case_object.click_hook = self.click_case
-        case_object.update_hook = self.update_case
+        # Поля цифр кода проверяются по своим областям, а не по пикселям
+        case_object.pixel_hit = False
         case_object.storage = {
             'first_digit': 0,
             'second_digit': 0,
             'third_digit': 0
         }
         case_object.original_image = case_image
+        case_object.set_image_hook(('first_digit', 'second_digit', 'third_digit'), self.compose_case)
+        for key in ('first_digit', 'second_digit', 'third_digit'):
+            case_object.subscribe(key, self.check_case_code)
+        case_object.static = True
 
         # Добавляем объекты на стену 2 по часовой стрелке (заднюю)
         self.add_objects(lamp, case_object, wall=2)
 
+    def apply_left_wall(self):
+        """Добавление объектов на стену 3 (левую)"""
+
+        # Загружаем картинки
+        paper_image = load_image("paper.png", (24, 24))
+        cup_image = load_image("cup.png", (50, 36))
+        book1_image = load_image("book1.png", (25, 67))
+        book2_image = load_image("book2.png", (50, 70))
+        book3_image = load_image("book3.png", (33, 65))
+        book4_image = load_image("book4.png", (33, 65))
+        solved_book_image = load_image("number_three.png", (48, 65))
+        matryoshka_top_image = load_image("matryoshka_top.png", (32, 32))
+        matryoshka_bottom_image = load_image("matryoshka_bottom.png", (32, 32))
+        door_image = load_image("door.png", (312, 545))
+
         # Создаем объект чашки и привязываем к нему функцию по клику
         cup_object = RoomObject(cup_image, (420, 385))
         cup_object.click_hook = self.click_cup
+        cup_object.static = True
 
         # Создаем объект книг
         book_puzzle = BookPuzzle([
@@ -190,13 +194,15 @@ class QuestRoom(Room):
         paper_piece2 = RoomObject(paper_image, (400, 200))
 
         matryoshka_top.click_hook = self.click_matryoshka_top
-        matryoshka_top.update_hook = self.update_matryoshka_top
-        paper_piece2.update_hook = self.update_piece
+        paper_piece2.subscribe('taken', self.hide_piece)
         paper_piece2.click_hook = self.get_piece_click_handler(2)
+        paper_piece2.static = True
+        matryoshka_bottom.static = True
 
         # Создаем объект двери и привязываем к ней функцию по клику
         door_object = RoomObject(door_image, (765, 359))
         door_object.click_hook = self.click_door
+        door_object.static = True
 
         self.add_objects(
             cup_object,
@@ -225,22 +231,19 @@ class QuestRoom(Room):
 
         if 25 < pos[0] < 40 and 20 < pos[1] < 35:
             # Если кликнули по полю для первой цифры кода
-            obj.storage['first_digit'] += 1
-            obj.storage['first_digit'] %= 10
+            obj.storage['first_digit'] = (obj.storage['first_digit'] + 1) % 10
         elif 55 < pos[0] < 70 and 20 < pos[1] < 35:
             # Если кликнули по полю для второй цифры кода
-            obj.storage['second_digit'] += 1
-            obj.storage['second_digit'] %= 10
+            obj.storage['second_digit'] = (obj.storage['second_digit'] + 1) % 10
         elif 90 < pos[0] < 105 and 20 < pos[1] < 35:
             # Если кликнули по полю для третьей цифры кода
-            obj.storage['third_digit'] += 1
-            obj.storage['third_digit'] %= 10
+            obj.storage['third_digit'] = (obj.storage['third_digit'] + 1) % 10
 
-    def update_case(self, obj, *_):
-        """Обработчик обновления шкатулки"""
+    def check_case_code(self, obj, *_):
+        """Проверка кода шкатулки при изменении цифры"""
 
         if obj.storage.get('opened', False):
-            # Если шкатулка открыта, то игнорируем обновление
+            # Если шкатулка открыта, то игнорируем проверку
             return
 
         # Проверяем правильность кода
@@ -249,11 +252,15 @@ class QuestRoom(Room):
             self.inventory.add(Item('key', 'Ключ', load_image("key.png")))
             obj.storage['opened'] = True
 
-        # Обновляем картинку шкатулки
-        obj.image = obj.original_image.copy()
-        obj.image.blit(self.font.render(str(obj.storage['first_digit']), True, (0, 0, 0)), (28, 20))
-        obj.image.blit(self.font.render(str(obj.storage['second_digit']), True, (0, 0, 0)), (60, 18))
-        obj.image.blit(self.font.render(str(obj.storage['third_digit']), True, (0, 0, 0)), (93, 22))
+    @staticmethod
+    def compose_case(obj, first_digit, second_digit, third_digit):
+        """Составление картинки шкатулки с цифрами кода"""
+
+        image = obj.original_image.copy()
+        blit_glyphs(image, (28, 20), "arkhip.ttf", 12, str(first_digit), (0, 0, 0))
+        blit_glyphs(image, (60, 18), "arkhip.ttf", 12, str(second_digit), (0, 0, 0))
+        blit_glyphs(image, (93, 22), "arkhip.ttf", 12, str(third_digit), (0, 0, 0))
+        return image
 
     def click_tea(self, obj, *_):
         """Обработчик клика по чаю"""
@@ -266,8 +273,8 @@ class QuestRoom(Room):
         # Добавляем чай в инвентарь
         self.inventory.add(Item("tea", "Чай", load_image("tea.png")))
 
-        # Удаляем картинку чая
-        obj.image = pygame.Surface((0, 0))
+        # Скрываем чай
+        obj.visible = False
 
         # Добавляем в хранилище объекта информацию о том, что чай уже брали
         obj.storage['used'] = True
@@ -317,7 +324,6 @@ class QuestRoom(Room):
 
         if not obj.storage.get('running', False):
             obj.storage['running'] = True
-            obj.image = obj.on_image
             return
 
         # Проверяем выделен ли какой-то предмет в инвентаре
@@ -335,10 +341,14 @@ class QuestRoom(Room):
                 self.send_message("text", "Чайник уже наполнен")
             else:
                 obj.storage['running'] = False
-                obj.image = obj.off_image
         else:
             obj.storage['running'] = False
-            obj.image = obj.off_image
+
+    @staticmethod
+    def compose_sink(obj, running):
+        """Выбор картинки раковины"""
+
+        return obj.on_image if running else obj.off_image
 
     def click_lamp(self, obj, pos):
         """Обработчик клика по лампе"""
@@ -348,44 +358,43 @@ class QuestRoom(Room):
 
         # Если мы нажали на верёвку лампы, то включаем/выключаем лампу
         if 70 < pos[0] < 90 and 100 < pos[1] < 140:
-            if lamp_on:
-                obj.image = obj.off_image
-                obj.storage['on'] = False
-            else:
-                obj.image = obj.on_empty_image if obj.storage.get('piece_taken', False) else obj.on_image
-                obj.storage['on'] = True
+            obj.storage['on'] = not lamp_on
 
         # Если лампа включена и был нажат кусок картинки, то берём его
         if lamp_on and not obj.storage.get('piece_taken', False) and 65 < pos[0] < 95 and 65 < pos[1] < 95:
             self.inventory.add(Item("piece_1", "Кусочек картинки", load_image("paper.png")))
             obj.storage['piece_taken'] = True
-            obj.image = obj.on_empty_image
+
+    @staticmethod
+    def compose_lamp(obj, on, piece_taken):
+        """Выбор картинки лампы"""
+
+        if not on:
+            return obj.off_image
+        return obj.on_empty_image if piece_taken else obj.on_image
 
     def click_matryoshka_top(self, obj, *_):
         """Обработчик клика по верхней части матрёшки"""
 
-        # Если верхняя часть матрёшки открыта, то ничего не делаем
-        if obj.storage.get('opened', False):
+        # Если верхняя часть матрёшки открыта или открывается, то ничего не делаем
+        if 'opened' in obj.storage:
             return
 
         # Добавляем в хранилище объекта информацию о том, что матрёшка начала открытие
         obj.storage['opened'] = False
 
-    def update_matryoshka_top(self, obj, dt):
-        """Обновление верхней части матрёшки"""
+        # Поднимаем верхнюю часть со скоростью 500 пикселей в секунду
+        y_target = 100
+        self.animate(obj, "position", (obj.rect.x, y_target), (obj.rect.y - y_target) / 500,
+                     on_complete=lambda: self.open_matryoshka_top(obj))
 
-        if obj.storage.get('opened', 12) != 12:
-            y_target = 100
+    @staticmethod
+    def open_matryoshka_top(obj):
+        """Завершение открытия матрёшки"""
 
-            # Если анимация не началась, начинаем её
-            if not obj.storage['opened']:
-                obj.rect.y -= 500 * dt
-            else:
-                obj.image = pygame.Surface((0, 0))
-
-            # Если верхняя часть матрёшки достигла цели, то сохраняем информацию о том, что она открыта
-            if obj.rect.y <= y_target:
-                obj.storage['opened'] = True
+        # Сохраняем информацию о том, что матрёшка открыта, и прячем верхнюю часть
+        obj.storage['opened'] = True
+        obj.visible = False
 
     def get_piece_click_handler(self, piece: int):
         """Возвращает обработчик клика по куску картинки"""
@@ -402,12 +411,12 @@ class QuestRoom(Room):
             self.inventory.add(Item(f"piece_{piece}", "Кусочек картинки", load_image("paper.png")))
         return click_piece
 
-    def update_piece(self, obj, *_):
-        """Обновление куска картинки"""
+    @staticmethod
+    def hide_piece(obj, taken):
+        """Скрытие куска картинки, когда его взяли"""
 
-        # Если кусок картинки брали, то удаляем его
-        if obj.storage.get('taken', False):
-            obj.image = pygame.Surface((0, 0))
+        if taken:
+            obj.visible = False
 
     def click_frame(self, obj, *_):
         """Обработчик клика по рамке"""
@@ -444,28 +453,30 @@ class QuestRoom(Room):
             # Добавляем в хранилище объекта информацию о том, что кусок картинки вставлен
             obj.storage['piece_4'] = True
 
-    def update_frame(self, obj, *_):
-        """Обновление рамки"""
+    @staticmethod
+    def compose_frame(obj, flipped, piece_1, piece_2, piece_3, piece_4):
+        """Составление картинки рамки со вставленными кусками"""
 
         tl = (34, 75)
 
-        # Сбрасываем изображение рамки
-        obj.image = obj.frame
+        # Рисуем на копии, чтобы не испортить общее изображение рамки
+        image = obj.frame.copy()
 
-        if obj.storage.get('flipped', False):
+        if flipped:
             # Если картинка перевернута, то рисуем ее
-            obj.image.blit(obj.flipped, tl)
-            return
+            image.blit(obj.flipped, tl)
+            return image
 
         # Рисуем куски, которые вставлены в рамку
-        if obj.storage.get('piece_1', False):
-            obj.image.blit(obj.pieces[0], tl)
-        if obj.storage.get('piece_2', False):
-            obj.image.blit(obj.pieces[1], (tl[0] + obj.pieces[0].get_width(), tl[1]))
-        if obj.storage.get('piece_3', False):
-            obj.image.blit(obj.pieces[2], (tl[0], tl[1] + obj.pieces[0].get_height()))
-        if obj.storage.get('piece_4', False):
-            obj.image.blit(obj.pieces[3], (tl[0] + obj.pieces[0].get_width(), tl[1] + obj.pieces[0].get_height()))
+        if piece_1:
+            image.blit(obj.pieces[0], tl)
+        if piece_2:
+            image.blit(obj.pieces[1], (tl[0] + obj.pieces[0].get_width(), tl[1]))
+        if piece_3:
+            image.blit(obj.pieces[2], (tl[0], tl[1] + obj.pieces[0].get_height()))
+        if piece_4:
+            image.blit(obj.pieces[3], (tl[0] + obj.pieces[0].get_width(), tl[1] + obj.pieces[0].get_height()))
+        return image
 
     def click_teapot(self, obj, *_):
         """Обработчик клика по чайнику"""
@@ -476,8 +487,8 @@ class QuestRoom(Room):
             self.inventory.add(Item("teapot", "Пустой чайник", obj.image))
             # Устанавливаем флаг, что чайник был взят
             obj.storage['taken'] = True
-            # Убираем текстуру чайника
-            obj.image = pygame.Surface((0, 0))
+            # Скрываем чайник
+            obj.visible = False
 
 
 class BookPuzzle(RoomObject):
@@ -488,17 +499,26 @@ class BookPuzzle(RoomObject):
             books: list[Tuple[int, Union[pygame.Surface, SurfaceType]]],
             solved_image: pygame.Surface, pos: Tuple[int, int]
     ):
-        """Создание объекта"""
+        """Создание объекта
 
-        # Находим ширину и высоту объекта
+        :param books: пары (место книги в правильном порядке, изображение книги) в начальном порядке
+        :param solved_image: изображение, которое заменяет первую книгу после решения
+        :param pos: координаты центра полки"""
+
+        # Находим ширину и высоту полки
         width = sum(book[1].get_width() for book in books)
         height = max(book[1].get_height() for book in books)
 
-        super().__init__(pygame.Surface((width, height), pygame.SRCALPHA, 32), pos)
+        # Изображение создаётся один раз с запасом под книгу, которая заменяется после решения
+        first_width = next(book[1].get_width() for book in books if book[0] == 0)
+        image_width = max(width, width - first_width + solved_image.get_width())
+        super().__init__(pygame.Surface((image_width, height), pygame.SRCALPHA, 32), pos)
+        self.rect = pygame.Rect(0, 0, width, height)
+        self.rect.center = pos
 
-        # Инициализируем книги
+        # Инициализируем книги в порядке на полке
         x = 0
-        self.books = pygame.sprite.Group()
+        self.books = []
         for book in books:
             # Создаём спрайт книги
             book_sprite = pygame.sprite.Sprite()
@@ -508,80 +528,146 @@ class BookPuzzle(RoomObject):
             book_sprite.rect.x = x
             book_sprite.rect.y = self.rect.height - book_sprite.rect.height
 
-            # Добавляем книгу в группу
-            self.books.add(book_sprite)
+            self.books.append(book_sprite)
             x += book_sprite.rect.width
 
+        # Считаем книги не на своих местах, головоломка решена, когда таких нет
+        self.misplaced = sum(book.right_x != i for i, book in enumerate(self.books))
+
         # Сохраняем информацию о том, что книги не перемещались
         self.grabbed_book = None
-        self.grabbed_book_offset = None
+        self.grabbed_index = None
+        self.slot_x = 0
+        self.drawn_x = None
 
         # Сохраняем изображение, которое будет отображаться, когда книги будут расставлены правильно
         self.solved_image = solved_image
 
-    def get_book_key(self, book: pygame.sprite.Sprite):
-        """Получение ключа книги для сортировки"""
+        # Ключи изображений книг, которые отпущены при выгрузке стены
+        self.released_books = []
+
+        # Рисуем книги в начальном порядке
+        self.compose()
+
+    def get_surfaces(self) -> list[pygame.Surface]:
+        """Получение всех изображений полки вместе с изображениями книг
+
+        :return: список изображений"""
+
+        return super().get_surfaces() + [book.image for book in self.books if book.image is not None]
 
-        if book is self.grabbed_book:
-            return pygame.mouse.get_pos()[0] - self.rect.x - self.grabbed_book_offset
-        return book.rect.x
+    def release_images(self, assets: dict[int, tuple]):
+        """Освобождение изображений полки и книг при выгрузке стены
 
-    def update(self, delta_time: float):
-        # Если головоломка не решена, то обрабатываем перемещение книг
-        if not self.storage.get('solved', False):
-            self.handle_drag()
-            sorted_books = sorted(self.books, key=self.get_book_key)
+        :param assets: ключи ресурсов стены по id их изображений"""
 
-            # Проверяем стоят ли книги на своих местах
-            if all(book.right_x == i for i, book in enumerate(sorted_books)):
-                self.storage['solved'] = True
-                self.grabbed_book = None
-                self.grabbed_book_offset = None
-                sorted_books[0].image = self.solved_image
-                sorted_books[0].rect.width = self.solved_image.get_width()
+        super().release_images(assets)
+        self.released_books = [assets.get(id(book.image)) for book in self.books]
+        for book, key in zip(self.books, self.released_books):
+            if key is not None:
+                book.image = None
 
-            # Обновляем позиции книг на основе их порядка
+    def restore_images(self):
+        """Загрузка изображений полки и книг, которые отпущены при выгрузке стены"""
+
+        super().restore_images()
+        for book, key in zip(self.books, self.released_books):
+            if key is not None:
+                book.image = load_asset(key)
+        self.released_books = []
+
+    def click(self, pos: tuple[int, int]):
+        """Захват книги под курсором
+
+        :param pos: координаты клика"""
+
+        if self.storage.get('solved', False):
+            return
+
+        # Находим книгу, которую хотим перетащить, и двигаем её только по горизонтали внутри полки
+        for i, book in enumerate(self.books):
+            if book.rect.collidepoint(pos):
+                self.grabbed_book = book
+                self.grabbed_index = i
+                self.slot_x = book.rect.x
+                self.room.start_drag(self, book.rect, pos, axis="x", bounds=pygame.Rect((0, 0), self.rect.size))
+                break
+
+    def drag(self, target: pygame.Rect, position: tuple[int, int]):
+        """Перестановка книг при перемещении захваченной книги
+
+        :param target: область захваченной книги
+        :param position: положение книги под курсором, по нему книга встаёт в очередь"""
+
+        i = self.grabbed_index
+        moved = target.x != self.drawn_x
+
+        # Меняем книгу местами с соседями, пока она левее левого или правее правого соседа
+        while i > 0 and position[0] < self.books[i - 1].rect.x:
+            neighbour = self.books[i - 1]
+            neighbour.rect.x += target.width
+            self.slot_x -= neighbour.rect.width
+            self.swap(i - 1, i)
+            i -= 1
+            moved = True
+        while i < len(self.books) - 1 and position[0] > self.books[i + 1].rect.x:
+            neighbour = self.books[i + 1]
+            neighbour.rect.x -= target.width
+            self.slot_x += neighbour.rect.width
+            self.swap(i, i + 1)
+            i += 1
+            moved = True
+        self.grabbed_index = i
+
+        # Перерисовываем, только если что-то сдвинулось
+        if moved:
+            self.compose()
+
+    def drop(self, target: pygame.Rect):
+        """Отпускание книги и проверка решения головоломки
+
+        :param target: область захваченной книги"""
+
+        # Ставим книгу в её ячейку
+        target.x = self.slot_x
+        self.grabbed_book = None
+        self.grabbed_index = None
+
+        # Если все книги стоят на своих местах, то заменяем первую книгу и сдвигаем остальные
+        if self.misplaced == 0:
+            self.storage['solved'] = True
+            self.books[0].image = self.solved_image
+            self.books[0].rect.width = self.solved_image.get_width()
             x = 0
-            for book in sorted_books:
-                if book != self.grabbed_book:
-                    book.rect.x = x
+            for book in self.books:
+                book.rect.x = x
                 x += book.rect.width
-            self.image = pygame.Surface((x, self.image.get_height()), pygame.SRCALPHA, 32)
 
-        # Очищаем поверхность прозрачным цветом
-        self.image.fill((0, 0, 0, 0))
+        self.compose()
 
-        # Отрисовываем книги
-        self.books.draw(self.image)
+    def swap(self, i: int, j: int):
+        """Обмен соседних книг местами с обновлением счётчика книг не на своих местах
 
-        # Вызываем метод родителя
-        super().update(delta_time)
+        :param i: индекс левой книги
+        :param j: индекс правой книги"""
 
-    def handle_drag(self):
-        """Обработка перетаскивания объекта"""
+        books = self.books
+        self.misplaced -= (books[i].right_x != i) + (books[j].right_x != j)
+        books[i], books[j] = books[j], books[i]
+        self.misplaced += (books[i].right_x != i) + (books[j].right_x != j)
 
-        # Если мышь нажата и не была нажата раньше
-        if pygame.mouse.get_pressed()[0] and self.grabbed_book is None:
-            # Получаем какую книгу мы хотим перетащить
-            for book in self.books:
-                if book.rect.collidepoint(
-                        (pygame.mouse.get_pos()[0] - self.rect.x, pygame.mouse.get_pos()[1] - self.rect.y)
-                ):
-                    self.grabbed_book = book
-                    self.grabbed_book_offset = pygame.mouse.get_pos()[0] - self.rect.x - book.rect.x
-                    break
-
-        # Если мышь отпущена
-        if not pygame.mouse.get_pressed()[0]:
-            # Сбрасываем информацию о том, что мы перетаскиваем книгу
-            self.grabbed_book = None
-
-        # Если книга перетаскивается
+    def compose(self):
+        """Перерисовка книг на изображении полки"""
+
+        # Очищаем поверхность прозрачным цветом
+        self.image.fill((0, 0, 0, 0))
+
+        # Отрисовываем книги, захваченную поверх остальных
+        for book in self.books:
+            if book is not self.grabbed_book:
+                self.image.blit(book.image, book.rect)
         if self.grabbed_book is not None:
-            # Перемещаем книгу под мышь
-            target_x = pygame.mouse.get_pos()[0] - self.rect.x - self.grabbed_book_offset
-            self.grabbed_book.rect.x = target_x
-            if self.grabbed_book.rect.x < 0:
-                self.grabbed_book.rect.x = 0
-            if self.grabbed_book.rect.x > self.rect.width - self.grabbed_book.rect.width:
-                self.grabbed_book.rect.x = self.rect.width - self.grabbed_book.rect.width
+            self.image.blit(self.grabbed_book.image, self.grabbed_book.rect)
+            self.drawn_x = self.grabbed_book.rect.x
+
+        self.mark_dirty()
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import hashlib
+import json
+
+import pygame
+
+from room import Room
+from utils import get_ticks
+
+
+# Этот файл отвечает за запись и воспроизведение ввода игрока:
+# - Запись кликов, движений мыши, нажатий клавиш и времени каждого кадра в текстовый файл
+# - Воспроизведение записи в комнату без ожидания с записанным временем кадров
+# - Контрольную сумму состояния объектов и инвентаря для проверки воспроизведения
+#
+# Формат файла: первая строка - заголовок, затем по строке на событие
+# "<кадр> <тип> <аргументы>", где тип t - время кадра в секундах и игровое время в миллисекундах
+# от начала записи (первая строка кадра), c - нажатие кнопки мыши, u - отпускание,
+# m - движение мыши (последнее за кадр), k - нажатие клавиши,
+# и последняя строка "end <количество кадров> <контрольная сумма>"
+
+REPLAY_HEADER = "lenina17-replay 2"
+
+
+def state_checksum(room: Room) -> str:
+    """Контрольная сумма хранилищ всех объектов комнаты и инвентаря
+
+    :param room: комната
+    :return: шестнадцатеричная строка SHA-256"""
+
+    state = {
+        'walls': [
+            [[i, dict(obj.storage)] for i, obj in enumerate(wall) if obj.storage]
+            for wall in room.walls
+        ],
+        'overlays': [[i, dict(obj.storage)] for i, obj in enumerate(room.overlays) if obj.storage],
+        'inventory': [item.uid for item in room.inventory.items],
+        'selected': room.inventory.selected
+    }
+    data = json.dumps(state, sort_keys=True, default=repr)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class InputRecorder:
+    """Запись ввода игрока в файл"""
+
+    def __init__(self, path: str):
+        """Создание записи
+
+        :param path: путь к файлу"""
+
+        self.file = open(path, "w", encoding="utf-8")
+        self.file.write(REPLAY_HEADER + "\n")
+
+        # Последнее движение мыши записывается один раз за кадр
+        self.motion = None
+        self.frame = 0
+
+        # Игровое время записывается от начала записи
+        self.start_ticks = get_ticks()
+
+    def record_frame(self, frame: int, delta_time: float):
+        """Запись времени кадра, вызывается в начале каждого кадра до его событий
+
+        :param frame: номер кадра
+        :param delta_time: время, прошедшее с прошлого кадра, в секундах"""
+
+        self.flush_motion()
+        self.frame = frame
+        self.file.write(f"{frame} t {delta_time!r} {get_ticks() - self.start_ticks}\n")
+
+    def record(self, frame: int, event: pygame.event.Event):
+        """Запись события ввода
+
+        :param frame: номер кадра, в котором обрабатывается событие
+        :param event: событие pygame"""
+
+        if frame != self.frame:
+            self.flush_motion()
+            self.frame = frame
+
+        if event.type == pygame.MOUSEMOTION:
+            self.motion = event.pos
+            return
+
+        # Движение перед нажатием или отпусканием кнопки должно попасть в запись раньше него
+        self.flush_motion()
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            self.file.write(f"{frame} c {event.pos[0]} {event.pos[1]}\n")
+        elif event.type == pygame.MOUSEBUTTONUP:
+            self.file.write(f"{frame} u {event.pos[0]} {event.pos[1]}\n")
+        elif event.type == pygame.KEYDOWN:
+            self.file.write(f"{frame} k {event.key}\n")
+
+    def flush_motion(self):
+        """Запись последнего движения мыши в кадре"""
+
+        if self.motion is not None:
+            self.file.write(f"{self.frame} m {self.motion[0]} {self.motion[1]}\n")
+            self.motion = None
+
+    def close(self, frames: int, room: Room):
+        """Завершение записи с количеством кадров и контрольной суммой состояния
+
+        :param frames: количество записанных кадров
+        :param room: комната, состояние которой проверяется при воспроизведении"""
+
+        if self.file.closed:
+            return
+        self.flush_motion()
+        self.file.write(f"end {frames} {state_checksum(room)}\n")
+        self.file.close()
+
+
+class InputReplay:
+    """Воспроизведение записанного ввода"""
+
+    def __init__(self, path: str):
+        """Загрузка записи
+
+        :param path: путь к файлу"""
+
+        # События по кадрам: кадр -> [(тип, аргументы)]
+        self.events = {}
+
+        # Время кадров: кадр -> (время кадра в секундах, игровое время в миллисекундах от начала записи)
+        self.timings = {}
+        self.frames = 0
+        self.checksum = None
+
+        with open(path, encoding="utf-8") as file:
+            if file.readline().strip() != REPLAY_HEADER:
+                raise ValueError(f"{path} не является записью ввода")
+
+            for line in file:
+                parts = line.split()
+                if not parts:
+                    continue
+
+                # Если запись завершилась штатно, то в конце есть количество кадров и контрольная сумма
+                if parts[0] == "end":
+                    self.frames = int(parts[1])
+                    self.checksum = parts[2]
+                    break
+
+                frame = int(parts[0])
+                self.frames = max(self.frames, frame)
+                if parts[1] == "t":
+                    self.timings[frame] = (float(parts[2]), int(parts[3]))
+                    continue
+                self.events.setdefault(frame, []).append((parts[1], tuple(map(int, parts[2:]))))
+
+    def apply(self, frame: int, room: Room):
+        """Передача событий кадра в комнату
+
+        :param frame: номер кадра
+        :param room: комната"""
+
+        for kind, args in self.events.get(frame, ()):
+            if kind == "c":
+                room.click(args)
+            elif kind == "u":
+                room.mouse_up(args)
+            elif kind == "m":
+                room.mouse_move(args)
+            elif kind == "k":
+                room.key_down(args[0])
@@ -1,12 +1,16 @@
 from __future__ import annotations
 
+import bisect
+import heapq
+import time
+from collections import OrderedDict
 from typing import Callable, Any
 
 import pygame
 from pygame.sprite import Sprite, Group
 
 from inventory import Inventory
-from utils import load_image, load_sound
+from utils import load_image, load_sound, load_asset, asset_cache, get_ticks, get_surface_size
 
 
 # Этот файл отвечает за фреймворк комнат, который включает в себя:
@@ -14,6 +18,41 @@ from utils import load_image, load_sound
 # - Создание объектов
 # - Добавление объектов на определенную стену комнаты или в оверлей
 # - Создание хуков для обработки событий объектов
+# - Ленивую загрузку содержимого стен и выгрузку давно не показанных стен
+# - Перерисовку только изменившихся областей экрана
+# - Кэширование неподвижных объектов стены вместе с фоном в одном изображении
+# - Хранилище состояния объектов, которое сообщает подписчикам об изменениях
+# - Планировщик, который обновляет только неспящие объекты
+# - Шину сообщений с обработчиками по каналам и отложенной доставкой раз в кадр
+# - Поиск объекта под курсором по сетке и попиксельным маскам
+# - Перетаскивание частей объектов мышью
+# - Замер времени обновлений, хуков и обработчиков сообщений включаемым профилировщиком
+# - Анимации прозрачности, положения и масштаба объектов, которые обновляются одним проходом
+# - Модальные окна поверх затемнённого снимка сцены
+
+
+def linear(t: float) -> float:
+    """Равномерная анимация"""
+
+    return t
+
+
+def ease_in(t: float) -> float:
+    """Анимация с разгоном"""
+
+    return t * t
+
+
+def ease_out(t: float) -> float:
+    """Анимация с торможением"""
+
+    return t * (2 - t)
+
+
+def ease_in_out(t: float) -> float:
+    """Анимация с разгоном и торможением"""
+
+    return 2 * t * t if t < 0.5 else 1 - 2 * (1 - t) * (1 - t)
 
 
 class Room:
@@ -24,6 +63,11 @@ class Room:
 
         self.paused = False
 
+        # Время создания комнаты, время, проведённое на паузе, и начало текущей паузы в миллисекундах
+        self.start_ticks = get_ticks()
+        self.paused_ticks = 0
+        self.pause_start = None
+
         # Создание групп спрайтов для каждой стены
         self.walls = (
             Group(),
@@ -33,23 +77,89 @@ class Room:
         )
         self.overlays = Group()
 
-        # Загрузка фонов для каждой стены
-        self.backgrounds = (
-            load_image("backgrounds/wall_0.png"),
-            load_image("backgrounds/wall_1.png"),
-            load_image("backgrounds/wall_2.png"),
-            load_image("backgrounds/wall_3.png")
-        )
+        # Фоны стен загружаются при первом показе стены или её соседки
+        self.background_names = tuple(f"backgrounds/wall_{i}.png" for i in range(4))
+        self.backgrounds = [None, None, None, None]
+
+        # Функции, которые создают объекты стены при её первой загрузке
+        self.wall_builders = ([], [], [], [])
+        self.built_walls = set()
+
+        # Ключи ресурсов, которые использует каждая стена
+        self.wall_assets = (set(), set(), set(), set())
+
+        # Загруженные стены в порядке последнего показа и ограничение памяти, которую они могут занимать
+        self.resident_walls = []
+        self.residency_budget = 12 * 1024 * 1024
 
         # Создание инвентаря
         self.inventory = Inventory(8, self)
 
-        # Создание списка обработчиков сообщений
-        self.message_handlers = []
+        # Обработчики сообщений по каналам, обработчики канала "*" получают все сообщения
+        self.message_handlers = {}
+
+        # Каналы с отложенной доставкой (значение - объединять ли сообщения канала за кадр),
+        # очередь отложенных сообщений и статистика доставки по каналам
+        self.deferred_channels = {}
+        self.message_queue = []
+        self.channel_stats = {}
 
         # Текущая стена, к которой повёрнут игрок
         self.current_wall = 0
 
+        # Перерисовывать ли только изменившиеся области экрана
+        self.dirty_rendering = True
+
+        # Нужно ли перерисовать весь экран в следующем кадре
+        self.full_redraw = True
+
+        # Области экрана, которые занимали объекты при последней отрисовке
+        self.drawn_rects = {}
+
+        # Изображения каждой стены с фоном и нарисованными на нём неподвижными объектами, актуальны ли они,
+        # множества этих объектов и порядок отрисовки всех объектов каждой стены
+        self.composites = [None] * 4
+        self.composite_valid = [False] * 4
+        self.baked_objects = [set() for _ in range(4)]
+        self.draw_orders = [{} for _ in range(4)]
+
+        # Неспящие объекты, которые обновляются каждый кадр, пока видны (словарь используется как
+        # упорядоченное множество), таймеры пробуждения и объекты, которые просыпаются от сообщений
+        self.awake_objects = {}
+        self.timers = []
+        self.timer_counter = 0
+        self.wake_channels = {}
+
+        # Объекты, которые изменились или обновлялись с последней отрисовки
+        self.changed_objects = set()
+
+        # Модальное окно, снимок затемнённой сцены под ним и степень затемнения
+        self.modal = None
+        self.modal_snapshot = None
+        self.modal_darkness = 0
+
+        # Идущие анимации и время последнего шага обновления
+        self.tweens = []
+        self.last_delta_time = 0
+
+        # Сетки для поиска объектов под курсором на каждой стене и в оверлеях, сетка каждого объекта
+        # и объекты, положение которых в сетке нужно обновить перед следующим поиском
+        self.wall_grids = [SpatialGrid() for _ in range(4)]
+        self.overlay_grid = SpatialGrid()
+        self.object_grids = {}
+        self.unindexed_objects = set()
+
+        # Профилировщик, None - время не замеряется
+        self.profiler = None
+
+        # Объект, над которым сейчас находится курсор, и текущее перетаскивание
+        self.hovered = None
+        self.drag = None
+
+        # Счётчики вызовов хуков объектов в текущем и в прошлом нарисованном кадре
+        self.hook_calls = 0
+        self.hook_calls_per_frame = 0
+
         # Загрузка звуков
         self.__click_sound = load_sound("click.mp3")
         self.channel = pygame.mixer.Channel(0)
@@ -59,46 +169,678 @@ class Room:
 
         :param delta_time: время, прошедшее с последнего обновления"""
 
+        # Доставляем отложенные сообщения
+        self.dispatch_messages()
+
+        # Будим объекты, у которых сработал таймер
+        now = get_ticks()
+        while self.timers and self.timers[0][0] <= now:
+            heapq.heappop(self.timers)[2].wake()
+
         if self.paused:
             return
 
-        self.walls[self.current_wall].update(delta_time)
-        self.overlays.update(delta_time)
+        # Обновляем только неспящие объекты на текущей стене и в оверлеях
+        for obj in list(self.awake_objects):
+            if not self.is_shown(obj):
+                continue
+            obj.previous_position = obj.rect.topleft
+            if self.profiler is None:
+                obj.update(delta_time)
+            else:
+                start = time.perf_counter()
+                obj.update(delta_time)
+                self.profiler.record(f"update {obj.name}", "object", start)
+            self.object_changed(obj)
+
+            # Если объекту больше не нужно обновление, то он засыпает
+            if not obj.needs_update():
+                obj.sleep()
+
+        # Продвигаем все анимации
+        self.last_delta_time = delta_time
+        if self.tweens:
+            if self.profiler is None:
+                self.update_tweens(delta_time)
+            else:
+                start = time.perf_counter()
+                self.update_tweens(delta_time)
+                self.profiler.record("tweens", "phase", start)
+
+    def update_tweens(self, delta_time: float):
+        """Продвижение всех анимаций одним проходом, закончившиеся анимации сразу удаляются
+
+        :param delta_time: время, прошедшее с последнего обновления"""
+
+        active = []
+        finished = []
+        for tween in self.tweens:
+            if tween.advance(delta_time):
+                finished.append(tween)
+            else:
+                active.append(tween)
+        self.tweens = active
+
+        # Обработчики завершения вызываются после прохода, потому что они могут запускать новые анимации
+        for tween in finished:
+            tween.finish()
+
+    def animate(self, obj: RoomObject, prop: str, target: Any, duration: float,
+                easing: Callable[[float], float] = linear, delay: float = 0,
+                on_complete: Callable[[], None] | None = None) -> Tween:
+        """Запуск анимации свойства объекта
+
+        Свойство изменяется методами объекта get_<свойство> и set_<свойство>,
+        у RoomObject есть свойства alpha, position и scale
+
+        :param obj: объект
+        :param prop: название свойства
+        :param target: конечное значение
+        :param duration: длительность в секундах
+        :param easing: функция плавности, которая переводит долю времени в долю изменения
+        :param delay: задержка перед началом в секундах
+        :param on_complete: обработчик завершения анимации
+        :return: анимация"""
+
+        tween = Tween(obj, prop, target, duration, easing, delay, on_complete)
+        self.tweens.append(tween)
+        return tween
+
+    def stop_animations(self, obj: RoomObject):
+        """Остановка всех анимаций объекта без вызова обработчиков завершения
+
+        :param obj: объект"""
+
+        self.tweens = [tween for tween in self.tweens if tween.obj is not obj]
+        obj.reset_draw_offset()
+
+    def interpolate(self, alpha: float):
+        """Подготовка неспящих объектов к отрисовке между двумя последними шагами обновления
+
+        :param alpha: доля шага, прошедшая после последнего обновления, от 0 до 1"""
+
+        for obj in self.awake_objects:
+            if self.is_shown(obj):
+                obj.interpolate(alpha)
+
+        # Анимации показываются на момент времени между двумя последними шагами
+        for tween in self.tweens:
+            tween.interpolate((1 - alpha) * self.last_delta_time)
+
+    def needs_update(self) -> bool:
+        """Проверка, нужно ли обновлять комнату каждый кадр (например, если идёт анимация)
+
+        :return: есть ли на текущей стене или в оверлеях неспящие объекты или сработавшие таймеры"""
+
+        if self.message_queue or self.timers and self.timers[0][0] <= get_ticks():
+            return True
 
-    def draw(self, screen: pygame.Surface):
+        if self.paused:
+            return False
+
+        return bool(self.tweens) or any(self.is_shown(obj) for obj in self.awake_objects)
+
+    def time_until_wake(self) -> int | None:
+        """Время до ближайшего таймера пробуждения
+
+        :return: время в миллисекундах или None, если таймеров нет"""
+
+        if not self.timers:
+            return None
+        return max(0, self.timers[0][0] - get_ticks())
+
+    def object_changed(self, obj: RoomObject):
+        """Отметка объекта, который изменился и должен быть перерисован и заново добавлен в сетку
+
+        :param obj: объект"""
+
+        self.changed_objects.add(obj)
+        self.unindexed_objects.add(obj)
+
+    def is_shown(self, obj: RoomObject) -> bool:
+        """Проверка, находится ли объект на текущей стене или в оверлеях
+
+        :param obj: объект
+        :return: виден ли объект игроку"""
+
+        return self.walls[self.current_wall].has(obj) or self.overlays.has(obj)
+
+    def wake_after(self, obj: RoomObject, seconds: float):
+        """Пробуждение объекта через заданное время
+
+        :param obj: объект
+        :param seconds: время в секундах"""
+
+        self.timer_counter += 1
+        heapq.heappush(self.timers, (get_ticks() + int(seconds * 1000), self.timer_counter, obj))
+
+    def wake_on(self, channel: str, obj: RoomObject):
+        """Пробуждение объекта при каждом сообщении в канале
+
+        :param channel: идентификатор канала
+        :param obj: объект"""
+
+        self.wake_channels.setdefault(channel, []).append(obj)
+
+    def draw(self, screen: pygame.Surface) -> list[pygame.Rect] | None:
         """Отрисовка комнаты
 
-        :param screen: экран, на котором отрисовывается комната"""
+        :param screen: экран, на котором отрисовывается комната
+        :return: список перерисованных областей экрана или None, если перерисован весь экран"""
+
+        # Если открыто модальное окно, то рисуем только его поверх снимка сцены
+        if self.modal is not None:
+            rects = self.draw_modal(screen)
+        else:
+            rects = self.draw_scene(screen)
+
+        # Кадр закончен: за него может пройти несколько шагов обновления или ни одного,
+        # поэтому счётчик вызовов хуков начинается заново здесь, а не при обновлении
+        self.hook_calls_per_frame = self.hook_calls
+        self.hook_calls = 0
+        return rects
+
+    def draw_scene(self, screen: pygame.Surface) -> list[pygame.Rect] | None:
+        """Отрисовка стены и оверлеев
+
+        :param screen: экран
+        :return: список перерисованных областей экрана или None, если перерисован весь экран"""
+
+        # Если текущая стена ещё не загружена, то загружаем её
+        if self.backgrounds[self.current_wall] is None:
+            self.show_wall(self.current_wall)
+
+        # Собираем изменившиеся области, заодно узнаём, нужно ли заново нарисовать изображение стены
+        if self.profiler is None:
+            damage = self.collect_damage()
+        else:
+            start = time.perf_counter()
+            damage = self.collect_damage()
+            self.profiler.record("collect damage", "phase", start)
+
+        # Если нужно, то перерисовываем весь экран
+        if not self.dirty_rendering or self.full_redraw:
+            self.full_redraw = False
+
+            # Запоминаем, где нарисованы все видимые объекты
+            self.drawn_rects = {
+                obj: obj.get_draw_rect()
+                for obj in [*self.walls[self.current_wall], *self.overlays] if not obj.is_culled()
+            }
+            screen.blit(self.get_composite(), (0, 0))
+            baked = self.baked_objects[self.current_wall]
+            for obj in self.walls[self.current_wall]:
+                if obj not in baked and not obj.is_culled():
+                    screen.blit(obj.image, obj.get_draw_rect())
+            for obj in self.overlays:
+                if not obj.is_culled():
+                    screen.blit(obj.image, obj.get_draw_rect())
+            return None
+
+        # Иначе перерисовываем только изменившиеся области
+        composite = self.get_composite()
+        baked = self.baked_objects[self.current_wall]
+        for rect in damage:
+            screen.set_clip(rect)
+            screen.blit(composite, rect, rect)
+            for obj in self.walls[self.current_wall]:
+                if obj not in baked and obj.get_draw_rect().colliderect(rect) and not obj.is_culled():
+                    screen.blit(obj.image, obj.get_draw_rect())
+            for obj in self.overlays:
+                if obj.get_draw_rect().colliderect(rect) and not obj.is_culled():
+                    screen.blit(obj.image, obj.get_draw_rect())
+        screen.set_clip(None)
+        return damage
+
+    def draw_modal(self, screen: pygame.Surface) -> list[pygame.Rect] | None:
+        """Отрисовка модального окна поверх затемнённого снимка сцены
+
+        :param screen: экран
+        :return: список перерисованных областей экрана или None, если перерисован весь экран"""
+
+        modal = self.modal
+
+        # Если снимка ещё нет, то один раз рисуем сцену без модального окна и затемняем её
+        if self.modal_snapshot is None:
+            self.modal = None
+            modal._visible = False
+            self.full_redraw = True
+            self.draw_scene(screen)
+            modal._visible = True
+            self.modal = modal
+
+            self.modal_snapshot = screen.copy()
+            shade = pygame.Surface(screen.get_size())
+            shade.set_alpha(self.modal_darkness)
+            self.modal_snapshot.blit(shade, (0, 0))
+
+            screen.blit(self.modal_snapshot, (0, 0))
+            screen.blit(modal.image, modal.get_draw_rect())
+            modal.dirty = False
+            return None
+
+        # Дальше перерисовываем окно, только если оно изменилось (например, при наведении на кнопку)
+        if not modal.dirty:
+            return []
+        rect = modal.get_draw_rect()
+        screen.blit(self.modal_snapshot, rect, rect)
+        screen.blit(modal.image, rect)
+        modal.dirty = False
+        return [rect]
+
+    def open_modal(self, obj: RoomObject, darkness: int = 172):
+        """Открытие модального окна: комната ставится на паузу, а сцена под окном замораживается
+
+        :param obj: объект окна из оверлеев комнаты
+        :param darkness: непрозрачность затемнения сцены от 0 до 255"""
+
+        # Отпускаем перетаскиваемое до снимка сцены, чтобы он показывал объект на месте
+        self.end_drag()
+
+        self.modal = obj
+        self.modal_snapshot = None
+        self.modal_darkness = darkness
+        self.paused = True
+        if self.pause_start is None:
+            self.pause_start = get_ticks()
+
+    def close_modal(self):
+        """Закрытие модального окна и возврат к обычной отрисовке"""
+
+        self.modal = None
+        self.modal_snapshot = None
+        self.full_redraw = True
+        self.paused = False
+        if self.pause_start is not None:
+            self.paused_ticks += get_ticks() - self.pause_start
+            self.pause_start = None
+
+    def get_play_time(self) -> int:
+        """Получение времени, которое игрок провёл в комнате, без времени на паузе
+
+        :return: время в миллисекундах"""
+
+        now = get_ticks()
+        paused = self.paused_ticks
+        if self.pause_start is not None:
+            paused += now - self.pause_start
+        return now - self.start_ticks - paused
+
+    def get_composite(self) -> pygame.Surface:
+        """Получение изображения текущей стены с фоном и неподвижными объектами
+
+        Изображение хранится для каждой стены, поэтому поворот к уже нарисованной стене его не сбрасывает.
+        Неподвижный объект рисуется в это изображение, только если под ним нет подвижных объектов,
+        иначе порядок отрисовки бы нарушился
+
+        :return: изображение размером с экран"""
+
+        wall = self.current_wall
+        composite = self.composites[wall]
+        if composite is not None and self.composite_valid[wall]:
+            return composite
+
+        start = time.perf_counter()
 
-        screen.blit(self.backgrounds[self.current_wall], (0, 0))
-        self.walls[self.current_wall].draw(screen)
-        self.overlays.draw(screen)
+        # Изображение создаётся при первой отрисовке стены, а потом перерисовывается на месте
+        if composite is None:
+            composite = self.composites[wall] = pygame.Surface((1086, 720)).convert()
+
+        # Рисуем фон
+        composite.fill((0, 0, 0))
+        composite.blit(self.backgrounds[wall], (0, 0))
+        self.composite_valid[wall] = True
+
+        # Рисуем неподвижные объекты, под которыми нет подвижных (невидимые объекты не рисуем вовсе)
+        baked = self.baked_objects[wall] = set()
+        draw_order = self.draw_orders[wall] = {}
+        dynamic = []
+        for i, obj in enumerate(self.walls[wall]):
+            draw_order[obj] = i
+            if obj.is_culled():
+                continue
+            draw_rect = obj.get_draw_rect()
+            if obj.static and draw_rect.collidelist([o.get_draw_rect() for o in dynamic]) == -1:
+                composite.blit(obj.image, draw_rect)
+                baked.add(obj)
+            else:
+                dynamic.append(obj)
+
+        if self.profiler is not None:
+            self.profiler.record("build composite", "phase", start)
+        return composite
+
+    def invalidate_composite(self, wall: int = None):
+        """Сброс изображения стены с неподвижными объектами, оно будет нарисовано заново при показе стены
+
+        :param wall: стена, None - текущая стена"""
+
+        self.composite_valid[self.current_wall if wall is None else wall] = False
+
+    def collect_damage(self) -> list[pygame.Rect]:
+        """Сбор областей экрана, которые изменились с последней отрисовки
+
+        Проверяются только объекты, которые изменились или обновлялись, поэтому
+        изменения на месте у спящих объектов нужно отмечать через mark_dirty
+
+        :return: список непересекающихся областей"""
+
+        damage = []
+
+        for obj in self.changed_objects:
+            old_rect = self.drawn_rects.pop(obj, None)
+
+            # Если объект исчез с экрана или стал невидимым, то перерисовываем его старую область,
+            # а изображение его стены рисуем заново, даже если эта стена сейчас не видна
+            if not self.is_shown(obj) or obj.is_culled():
+                if old_rect is not None:
+                    damage.append(old_rect)
+                if self.affects_composite(obj):
+                    self.invalidate_composite(obj.wall)
+                obj.dirty = False
+                continue
+
+            # Если объект изменился, сдвинулся или только что появился, то перерисовываем его старую и новую области
+            draw_rect = obj.get_draw_rect()
+            if obj.dirty or old_rect != draw_rect:
+                if old_rect is not None:
+                    damage.append(old_rect)
+                damage.append(draw_rect)
+                obj.dirty = False
+
+                # Если изменился объект из изображения стены или подвижный объект
+                # сдвинулся под неподвижный, то изображение стены нужно нарисовать заново
+                if self.affects_composite(obj):
+                    self.invalidate_composite(obj.wall)
+
+            self.drawn_rects[obj] = draw_rect
+
+        self.changed_objects.clear()
+
+        # Объединяем пересекающиеся области
+        merged = []
+        for rect in damage:
+            if not rect.width or not rect.height:
+                continue
+            i = rect.collidelist(merged)
+            while i != -1:
+                rect = rect.union(merged.pop(i))
+                i = rect.collidelist(merged)
+            merged.append(rect)
+        return merged
+
+    def affects_composite(self, obj: RoomObject) -> bool:
+        """Проверка, нужно ли заново нарисовать изображение стены после изменения объекта
+
+        :param obj: объект
+        :return: нарисован ли объект в изображение своей стены или оказался под объектом из него"""
+
+        return obj.wall is not None and (obj in self.baked_objects[obj.wall] or self.covers_baked(obj))
+
+    def covers_baked(self, obj: RoomObject) -> bool:
+        """Проверка, оказался ли подвижный объект под неподвижным объектом из изображения стены
+
+        :param obj: объект
+        :return: пересекается ли объект с неподвижным объектом, который рисуется после него"""
+
+        draw_order = self.draw_orders[obj.wall]
+        if obj not in draw_order:
+            return False
+
+        order = draw_order[obj]
+        return any(
+            draw_order[baked] > order and baked.get_draw_rect().colliderect(obj.get_draw_rect())
+            for baked in self.baked_objects[obj.wall]
+        )
 
     def rotate(self, amount: int):
         """Поворот пользователя на amount стен
 
         :param amount: количество стен, на которое поворачивается игрок, может быть отрицательным"""
 
+        # Перетаскивание не переживает поворот, объект остаётся на прежней стене
+        self.end_drag()
+
         # Поворачиваем игрока на amount стен
         self.current_wall += amount
 
         # Если игрок повернулся на стену, которой нет, то возвращаем его на первую стену
         self.current_wall %= 4
 
+        # Загружаем новую стену и её соседей
+        self.show_wall(self.current_wall)
+
+        # После поворота меняется весь экран
+        self.full_redraw = True
+
+    def add_wall_builder(self, wall: int, builder: Callable[[], None]):
+        """Добавление функции, которая создаёт объекты стены при её первой загрузке
+
+        :param wall: стена
+        :param builder: функция, которая создаёт объекты и добавляет их на стену"""
+
+        self.wall_builders[wall % 4].append(builder)
+
+    def show_wall(self, wall: int):
+        """Загрузка стены, которую видит игрок, и соседних стен, на которые он может повернуться
+
+        :param wall: стена, которую видит игрок"""
+
+        neighbours = ((wall - 1) % 4, (wall + 1) % 4)
+        for w in (*neighbours, wall):
+            self.load_wall(w)
+
+        # Выгружаем давно не показанные стены, пока не уложимся в ограничение памяти
+        for w in self.resident_walls[:]:
+            if self.get_residency_size() <= self.residency_budget:
+                break
+            if w != wall and w not in neighbours:
+                self.unload_wall(w)
+
+    def load_wall(self, wall: int):
+        """Загрузка фона и ресурсов стены
+
+        :param wall: стена"""
+
+        # Помечаем стену как недавно показанную
+        if wall in self.resident_walls:
+            self.resident_walls.remove(wall)
+            self.resident_walls.append(wall)
+            return
+
+        # Записываем все ресурсы, которые запрашиваются при загрузке стены
+        with asset_cache.record() as keys:
+            self.backgrounds[wall] = load_image(self.background_names[wall])
+
+            # Объекты стены создаются только один раз, после выгрузки стены они сохраняются
+            # и при повторной загрузке только получают обратно свои изображения
+            if wall not in self.built_walls:
+                self.built_walls.add(wall)
+                for builder in self.wall_builders[wall]:
+                    builder()
+            else:
+                for obj in self.walls[wall]:
+                    obj.restore_images()
+
+        self.wall_assets[wall].update(keys)
+
+        # Закрепляем ресурсы стены в кэше, пока она загружена
+        for key in self.wall_assets[wall]:
+            asset_cache.pin(key)
+        self.resident_walls.append(wall)
+
+    def unload_wall(self, wall: int):
+        """Выгрузка фона и ресурсов стены
+
+        Объекты стены и их состояние сохраняются, но отпускают изображения из кэша,
+        а ресурсы, которые больше не нужны ни одной загруженной стене, удаляются из кэша
+
+        :param wall: стена"""
+
+        # Объект стены не может перетаскиваться без своих изображений
+        if self.drag is not None and self.drag.obj in self.walls[wall]:
+            self.end_drag()
+
+        # Изображения ресурсов стены по их id, чтобы объекты могли заменить их ключами
+        assets = {}
+        for key in self.wall_assets[wall]:
+            if key in asset_cache.entries:
+                assets[id(asset_cache.entries[key][0])] = key
+        for obj in self.walls[wall]:
+            obj.release_images(assets)
+
+        # Изображение стены тоже освобождаем, при следующем показе оно будет создано заново
+        self.backgrounds[wall] = None
+        self.composites[wall] = None
+        self.composite_valid[wall] = False
+        self.resident_walls.remove(wall)
+
+        for key in self.wall_assets[wall]:
+            if asset_cache.unpin(key):
+                asset_cache.discard(key)
+
+    def get_residency_size(self) -> int:
+        """Подсчёт памяти, которую занимают изображения загруженных стен: фоны и все изображения
+        объектов стен, каждое изображение считается один раз
+
+        :return: размер в байтах"""
+
+        surfaces = {}
+        for wall in self.resident_walls:
+            background = self.backgrounds[wall]
+            surfaces[id(background)] = background
+            for obj in self.walls[wall]:
+                for surface in obj.get_surfaces():
+                    surfaces[id(surface)] = surface
+        return sum(get_surface_size(surface) for surface in surfaces.values())
+
     def click(self, pos: tuple[int, int]):
         """Обработка клика по объектам, с которыми можно взаимодействовать
 
         :param pos: позиция клика"""
 
-        # Проходим по всем объектам на текущей стене и оверлеях
-        for obj in [*self.overlays, *reversed([*self.walls[self.current_wall]])]:
-            # Проверяем, находится ли позиция клика внутри объекта и можно ли с ним взаимодействовать
-            if obj.rect.collidepoint(pos) and not obj.passthrough:
-                # Воспроизводим звук
-                self.channel.play(self.__click_sound)
-                # Вызываем обработчик клика
-                obj.click((pos[0] - obj.rect.x, pos[1] - obj.rect.y))
-                break
+        # Ищем верхний объект под курсором, а если открыто модальное окно, то клики получает только оно
+        if self.modal is not None:
+            obj = self.modal if self.modal.rect.collidepoint(pos) else None
+        else:
+            obj = self.hit_test(pos)
+        if obj is None:
+            return
+
+        # Воспроизводим звук
+        self.channel.play(self.__click_sound)
+        # Вызываем обработчик клика и будим объект, чтобы он обновился
+        if self.profiler is None:
+            obj.click((pos[0] - obj.rect.x, pos[1] - obj.rect.y))
+        else:
+            start = time.perf_counter()
+            obj.click((pos[0] - obj.rect.x, pos[1] - obj.rect.y))
+            self.profiler.record(f"click {obj.name}", "object", start)
+        obj.wake()
+
+    def start_drag(self, obj: RoomObject, target: pygame.Rect, pos: tuple[int, int],
+                   axis: str | None = None, bounds: pygame.Rect | None = None):
+        """Начало перетаскивания, вызывается объектом из обработчика клика
+
+        :param obj: объект, который получает события перетаскивания
+        :param target: перетаскиваемая область в координатах объекта, двигается на месте
+        :param pos: позиция захвата в координатах объекта
+        :param axis: ось, вдоль которой можно двигать ("x" или "y"), None - любое направление
+        :param bounds: область в координатах объекта, за которую нельзя вытащить target"""
+
+        self.drag = Drag(obj, target, (pos[0] - target.x, pos[1] - target.y), axis, bounds)
+
+    def mouse_move(self, pos: tuple[int, int]) -> bool:
+        """Обработка движения мыши
+
+        :param pos: позиция курсора
+        :return: нужно ли показать курсор руки"""
+
+        # Если ничего не перетаскивается, то просто ищем объект под курсором
+        if self.drag is None:
+            return self.hover(pos)
+
+        obj = self.drag.obj
+        target = self.drag.target
+        x = pos[0] - obj.rect.x - self.drag.offset[0]
+        y = pos[1] - obj.rect.y - self.drag.offset[1]
+
+        # Применяем ограничения по оси и по области
+        if self.drag.axis != "y":
+            target.x = x
+        if self.drag.axis != "x":
+            target.y = y
+        if self.drag.bounds is not None:
+            target.clamp_ip(self.drag.bounds)
+
+        obj.drag(target, (x, y))
+        obj.wake()
+        return True
+
+    def mouse_up(self, pos: tuple[int, int]):
+        """Обработка отпускания кнопки мыши
+
+        :param pos: позиция курсора"""
+
+        self.end_drag()
+
+    def end_drag(self):
+        """Завершение перетаскивания, если оно идёт: объект получает событие конца перетаскивания
+
+        Вызывается при отпускании кнопки мыши, а также при повороте, открытии модального окна
+        и выгрузке стены, чтобы нельзя было двигать части объекта, которого не видно"""
+
+        if self.drag is None:
+            return
+
+        drag, self.drag = self.drag, None
+        drag.obj.drop(drag.target)
+        drag.obj.wake()
+
+    def hover(self, pos: tuple[int, int]) -> bool:
+        """Обработка движения курсора
+
+        :param pos: позиция курсора
+        :return: находится ли курсор над объектом, который обрабатывает клики"""
+
+        # Модальное окно само решает, что находится под курсором
+        if self.modal is not None:
+            self.hovered = self.modal
+            return self.modal.hover((pos[0] - self.modal.rect.x, pos[1] - self.modal.rect.y))
+
+        self.hovered = self.hit_test(pos)
+        return self.hovered is not None and self.hovered.is_clickable()
+
+    def hit_test(self, pos: tuple[int, int]) -> RoomObject | None:
+        """Поиск верхнего объекта под курсором, с которым можно взаимодействовать
+
+        :param pos: позиция курсора
+        :return: объект или None, если под курсором ничего нет"""
+
+        self.update_index()
+
+        # Оверлеи находятся над стенами и получают клики первыми, причём в порядке добавления
+        # (например, оверлей перехода во время затемнения закрывает стрелки, добавленные после него)
+        obj = self.overlay_grid.hit_test(pos, from_top=False)
+        if obj is None:
+            obj = self.wall_grids[self.current_wall].hit_test(pos)
+        return obj
+
+    def update_index(self):
+        """Обновление положения изменившихся объектов в сетках"""
+
+        for obj in self.unindexed_objects:
+            grid = self.object_grids.get(obj)
+            if grid is None:
+                continue
+
+            # Удалённые объекты убираем из сетки
+            if obj.alive():
+                grid.move(obj)
+            else:
+                grid.remove(obj)
+                del self.object_grids[obj]
+        self.unindexed_objects.clear()
 
     def add_objects(self, *objs: RoomObject, wall: int = None):
         """Добавление объекта в комнату
@@ -106,23 +848,49 @@ class Room:
         :param wall: стена, на которую добавляется объект
         :param objs: объекты, который добавляется в комнату"""
 
-        # Устанавливаем родительский объект для каждого объекта
+        # Устанавливаем родительский объект для каждого объекта и будим его для первого обновления
         for obj in objs:
             obj.room = self
+            obj.wall = None if wall is None else wall % 4
+            obj.wake()
+
+        # Объекты без имени называем по классу, стене и номеру на ней, чтобы различать их в замерах
+        group = self.overlays if wall is None else self.walls[wall % 4]
+        place = "overlay" if wall is None else f"wall {wall % 4}"
+        for i, obj in enumerate(objs, len(group)):
+            if obj.name is None:
+                obj.name = f"{type(obj).__name__} {place}#{i}"
 
         # Если стена не указана, то добавляем объекты в оверлеи
         if wall is None:
             self.overlays.add(*objs)
+            grid = self.overlay_grid
         # Иначе добавляем объекты на указанную стену
         else:
             self.walls[wall % 4].add(*objs)
+            grid = self.wall_grids[wall % 4]
+            self.invalidate_composite(wall % 4)
 
-    def register_message_handler(self, handler: Callable[[str, *Any], None]):
+        # Добавляем объекты в сетку в порядке отрисовки
+        for obj in objs:
+            grid.add(obj)
+            self.object_grids[obj] = grid
+
+    def register_message_handler(self, handler: Callable[[str, *Any], None], channel: str = "*"):
         """Регистрация обработчика сообщений
 
-        :param handler: обработчик сообщений"""
+        :param handler: обработчик сообщений, получает канал и сообщения
+        :param channel: идентификатор канала, "*" - все каналы"""
+
+        self.message_handlers.setdefault(channel, []).append(handler)
 
-        self.message_handlers.append(handler)
+    def defer_channel(self, channel: str, coalesce: bool = False):
+        """Включение отложенной доставки сообщений канала в начале следующего кадра
+
+        :param channel: идентификатор канала
+        :param coalesce: доставлять ли только последнее сообщение канала за кадр"""
+
+        self.deferred_channels[channel] = coalesce
 
     def send_message(self, channel: str, *messages: Any):
         """Отправка сообщения
@@ -130,14 +898,326 @@ class Room:
         :param channel: идентификатор канала
         :param messages: сообщения"""
 
-        for handler in self.message_handlers:
-            handler(channel, *messages)
+        sent_time = time.perf_counter()
+
+        # Если канал не отложенный, то доставляем сообщение сразу
+        if channel not in self.deferred_channels:
+            self.deliver_message(channel, messages, sent_time)
+            return
+
+        # Если сообщения канала объединяются, то заменяем ещё не доставленное сообщение
+        if self.deferred_channels[channel]:
+            for i, (queued_channel, _, queued_time) in enumerate(self.message_queue):
+                if queued_channel == channel:
+                    self.message_queue[i] = (channel, messages, queued_time)
+                    self.get_channel_stats(channel)['coalesced'] += 1
+                    return
+
+        self.message_queue.append((channel, messages, sent_time))
+
+    def dispatch_messages(self):
+        """Доставка отложенных сообщений"""
+
+        # Сообщения, отправленные обработчиками, будут доставлены в следующем кадре
+        queue, self.message_queue = self.message_queue, []
+        for channel, messages, sent_time in queue:
+            self.deliver_message(channel, messages, sent_time)
+
+    def deliver_message(self, channel: str, messages: tuple, sent_time: float):
+        """Вызов обработчиков сообщения
+
+        :param channel: идентификатор канала
+        :param messages: сообщения
+        :param sent_time: время отправки сообщения по time.perf_counter"""
+
+        # Будим объекты, которые ждут сообщений в этом канале
+        for obj in self.wake_channels.get(channel, ()):
+            obj.wake()
+
+        for handlers in (self.message_handlers.get(channel, ()), self.message_handlers.get("*", ())):
+            for handler in handlers:
+                if self.profiler is None:
+                    handler(channel, *messages)
+                else:
+                    start = time.perf_counter()
+                    handler(channel, *messages)
+                    self.profiler.record(f"message {channel}: {handler.__qualname__}", "message", start)
+
+        # Считаем время от отправки до конца обработки сообщения
+        latency = time.perf_counter() - sent_time
+        stats = self.get_channel_stats(channel)
+        stats['dispatched'] += 1
+        stats['latency_total'] += latency
+        stats['latency_max'] = max(stats['latency_max'], latency)
+
+    def get_channel_stats(self, channel: str) -> dict[str, Any]:
+        """Получение статистики доставки сообщений канала
+
+        :param channel: идентификатор канала
+        :return: количество доставленных и объединённых сообщений, суммарная и максимальная задержка в секундах"""
+
+        if channel not in self.channel_stats:
+            self.channel_stats[channel] = {'dispatched': 0, 'coalesced': 0, 'latency_total': 0.0, 'latency_max': 0.0}
+        return self.channel_stats[channel]
 
     def key_down(self, key):
         """Обработчик нажатия клавиши"""
         self.send_message("key_down", key)
 
 
+class Tween:
+    """Анимация одного свойства объекта"""
+
+    def __init__(self, obj: RoomObject, prop: str, target: Any, duration: float,
+                 easing: Callable[[float], float], delay: float, on_complete: Callable[[], None] | None):
+        """Создание анимации
+
+        :param obj: объект
+        :param prop: название свойства
+        :param target: конечное значение (число или кортеж чисел)
+        :param duration: длительность в секундах
+        :param easing: функция плавности
+        :param delay: задержка перед началом в секундах
+        :param on_complete: обработчик завершения"""
+
+        self.obj = obj
+        self.prop = prop
+        self.target = target
+        self.duration = duration
+        self.easing = easing
+        self.on_complete = on_complete
+
+        # Начальное значение запоминается в момент начала, поэтому до него время отрицательное
+        self.start = None
+        self.elapsed = -delay
+
+        self.getter = getattr(obj, "get_" + prop)
+        self.setter = getattr(obj, "set_" + prop)
+
+    def value(self, elapsed: float) -> Any:
+        """Значение свойства в заданный момент анимации
+
+        :param elapsed: время с начала анимации
+        :return: значение"""
+
+        progress = self.easing(min(1, elapsed / self.duration)) if self.duration > 0 else 1
+        if isinstance(self.target, tuple):
+            return tuple(a + (b - a) * progress for a, b in zip(self.start, self.target))
+        return self.start + (self.target - self.start) * progress
+
+    def advance(self, delta_time: float) -> bool:
+        """Продвижение анимации
+
+        :param delta_time: время, прошедшее с последнего обновления
+        :return: закончилась ли анимация"""
+
+        self.elapsed += delta_time
+        if self.elapsed < 0:
+            return False
+        if self.start is None:
+            self.start = self.getter()
+
+        self.setter(self.value(self.elapsed))
+        return self.elapsed >= self.duration
+
+    def interpolate(self, lag: float):
+        """Показ анимации на момент немного раньше последнего шага, меняется только изображение
+
+        :param lag: насколько раньше последнего шага, в секундах"""
+
+        if self.start is None or self.elapsed - lag < 0:
+            return
+
+        # Положение - часть логики объекта, поэтому двигается только изображение
+        value = self.value(self.elapsed - lag)
+        if self.prop == "position":
+            x, y = self.obj.rect.topleft
+            self.obj.set_draw_offset((round(value[0]) - x, round(value[1]) - y))
+        elif self.prop == "alpha":
+            self.setter(value)
+
+    def finish(self):
+        """Завершение анимации"""
+
+        self.obj.reset_draw_offset()
+        if self.on_complete is not None:
+            self.on_complete()
+
+
+class Drag:
+    """Состояние перетаскивания"""
+
+    def __init__(self, obj: RoomObject, target: pygame.Rect, offset: tuple[int, int],
+                 axis: str | None, bounds: pygame.Rect | None):
+        """Создание перетаскивания
+
+        :param obj: объект, который получает события перетаскивания
+        :param target: перетаскиваемая область в координатах объекта
+        :param offset: смещение курсора от левого верхнего угла target
+        :param axis: ось, вдоль которой можно двигать
+        :param bounds: область, за которую нельзя вытащить target"""
+
+        self.obj = obj
+        self.target = target
+        self.offset = offset
+        self.axis = axis
+        self.bounds = bounds
+
+
+class SpatialGrid:
+    """Равномерная сетка для быстрого поиска объектов по точке"""
+
+    def __init__(self, cell_size: int = 64):
+        """Создание сетки
+
+        :param cell_size: размер ячейки в пикселях"""
+
+        self.cell_size = cell_size
+
+        # Пары (порядковый номер, объект) в каждой ячейке, отсортированные по порядку отрисовки
+        self.cells = {}
+
+        # Порядковый номер, область и ячейки каждого объекта
+        self.order = {}
+        self.bounds = {}
+        self.object_cells = {}
+        self.counter = 0
+
+    def add(self, obj: RoomObject):
+        """Добавление объекта поверх уже добавленных
+
+        :param obj: объект"""
+
+        self.counter += 1
+        self.order[obj] = self.counter
+        self.place(obj)
+
+    def remove(self, obj: RoomObject):
+        """Удаление объекта из сетки
+
+        :param obj: объект"""
+
+        for cell in self.object_cells.pop(obj, ()):
+            self.cells[cell].remove((self.order[obj], obj))
+        self.order.pop(obj, None)
+        self.bounds.pop(obj, None)
+
+    def move(self, obj: RoomObject):
+        """Обновление ячеек объекта, если он сдвинулся или изменил размер
+
+        :param obj: объект"""
+
+        if obj in self.order and self.bounds.get(obj) != obj.get_draw_rect():
+            for cell in self.object_cells.pop(obj, ()):
+                self.cells[cell].remove((self.order[obj], obj))
+            self.place(obj)
+
+    def place(self, obj: RoomObject):
+        """Добавление объекта во все ячейки, которые пересекает его изображение
+
+        :param obj: объект"""
+
+        rect = obj.get_draw_rect()
+        self.bounds[obj] = rect
+
+        cells = []
+        entry = (self.order[obj], obj)
+        for x in range(rect.left // self.cell_size, (rect.right - 1) // self.cell_size + 1):
+            for y in range(rect.top // self.cell_size, (rect.bottom - 1) // self.cell_size + 1):
+                # Вставляем объект так, чтобы ячейка оставалась отсортированной по порядку отрисовки
+                bisect.insort(self.cells.setdefault((x, y), []), entry)
+                cells.append((x, y))
+        self.object_cells[obj] = cells
+
+    def hit_test(self, pos: tuple[int, int], from_top: bool = True) -> RoomObject | None:
+        """Поиск объекта в точке с попаданием по его пикселям
+
+        :param pos: координаты точки
+        :param from_top: проверять ли объекты сверху вниз, иначе в порядке добавления
+        :return: объект или None"""
+
+        objects = self.cells.get((pos[0] // self.cell_size, pos[1] // self.cell_size))
+        if not objects:
+            return None
+
+        # Проверяем объекты сверху вниз или в порядке добавления
+        for i in range(len(objects) - 1, -1, -1) if from_top else range(len(objects)):
+            obj = objects[i][1]
+            if not obj.passthrough and obj.visible and obj.hit(pos):
+                return obj
+        return None
+
+
+class Storage(dict):
+    """Хранилище состояния объекта, которое сообщает подписчикам об изменении значений"""
+
+    def __init__(self, *args, **kwargs):
+        """Создание хранилища"""
+
+        super().__init__(*args, **kwargs)
+
+        # Подписчики на изменения: ключ -> список функций, ключ None - подписка на все ключи
+        self.subscribers = {}
+
+    def subscribe(self, key: str | None, callback: Callable[[str, Any], None]):
+        """Подписка на изменение значения
+
+        :param key: ключ, изменения которого нужно отслеживать, или None для всех ключей
+        :param callback: функция, которая вызывается с ключом и новым значением"""
+
+        self.subscribers.setdefault(key, []).append(callback)
+
+    def notify(self, key: str, value: Any):
+        """Оповещение подписчиков об изменении значения
+
+        :param key: ключ
+        :param value: новое значение"""
+
+        for callback in self.subscribers.get(key, ()):
+            callback(key, value)
+        for callback in self.subscribers.get(None, ()):
+            callback(key, value)
+
+    def __setitem__(self, key: str, value: Any):
+        changed = key not in self or self[key] != value
+        super().__setitem__(key, value)
+        if changed:
+            self.notify(key, value)
+
+    def __delitem__(self, key: str):
+        super().__delitem__(key)
+        self.notify(key, None)
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def pop(self, key: str, *default: Any) -> Any:
+        if key not in self:
+            return super().pop(key, *default)
+        value = super().pop(key)
+        self.notify(key, None)
+        return value
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+    def replace(self, values: dict):
+        """Замена всех значений хранилища с сохранением подписчиков
+
+        :param values: новые значения"""
+
+        for key in [key for key in self if key not in values]:
+            del self[key]
+        self.update(values)
+
+
 class RoomObject(Sprite):
     """Объект, который находится в комнате"""
 
@@ -148,19 +1228,430 @@ class RoomObject(Sprite):
         :param pos: позиция объекта"""
 
         super().__init__()
+
+        # Изменилось ли изображение объекта с последней отрисовки
+        self.dirty = True
+
+        # Виден ли объект, невидимые объекты не рисуются и не получают кликов
+        self._visible = True
+
+        # Комната и стена, на которой находится объект (None - объект в оверлеях)
+        self.room = None
+        self.wall = None
+        self.mask = None
+
+        # Сдвиг изображения для плавного движения между шагами обновления и положение до последнего шага
+        self.draw_offset = (0, 0)
+
+        # Масштаб изображения и исходное изображение, которое масштабируется
+        self.scale = 1
+        self.unscaled_image = None
         self.image = image
         self.rect = self.image.get_rect(center=pos)
-        self.room = None
+        self.previous_position = self._rect.topleft
+
+        # Имя объекта в замерах профилировщика, если не задано, то его даёт комната при добавлении
+        self.name = None
 
         # Переменная, которая проходит ли клик сквозь объект
         self.passthrough = False
 
+        # Проверять ли попадание по непрозрачным пикселям, объекты со своими областями клика
+        # (например, верёвка лампы) и объекты, которые закрывают всё под собой, даже будучи прозрачными
+        # (например, оверлей перехода), проверяются по всей области изображения
+        self.pixel_hit = True
+
+        # Переменная, которая определяет, что объект меняется редко и его можно рисовать вместе с фоном стены
+        self.static = False
+
         # Хранилище состояния
-        self.storage = {}
+        self._storage = Storage()
 
         # Хуки для обработки событий
         self.update_hook = None
         self.click_hook = None
+        self.drag_hook = None
+        self.drop_hook = None
+
+        # Хук, который сообщает, нужно ли обновлять объект каждый кадр
+        self.needs_update_hook = None
+
+        # Хук, который составляет изображение объекта из значений хранилища по ключам image_keys,
+        # составленные изображения запоминаются для каждого набора значений
+        self.image_hook = None
+        self.image_keys = ()
+        self.image_state = None
+        self.composed_images = OrderedDict()
+        self.composed_images_limit = 16
+
+        # Ключи ресурсов, изображения которых объект отпустил при выгрузке стены: атрибут -> ключ
+        self.released_images = {}
+
+    @property
+    def image(self) -> pygame.Surface:
+        """Изображение объекта"""
+
+        return self._image
+
+    @image.setter
+    def image(self, image: pygame.Surface):
+        self._image = image
+        self.mark_dirty()
+
+    @property
+    def rect(self) -> pygame.Rect:
+        """Область, которую занимает объект"""
+
+        return self._rect
+
+    @rect.setter
+    def rect(self, rect: pygame.Rect):
+        self._rect = rect
+        self.mark_dirty()
+
+    @property
+    def visible(self) -> bool:
+        """Виден ли объект"""
+
+        return self._visible
+
+    @visible.setter
+    def visible(self, visible: bool):
+        if visible != self._visible:
+            self._visible = visible
+            self.mark_dirty()
+
+    def get_alpha(self) -> int:
+        """Получение итоговой непрозрачности объекта
+
+        :return: непрозрачность от 0 до 255"""
+
+        alpha = self._image.get_alpha()
+        return 255 if alpha is None else alpha
+
+    def is_culled(self) -> bool:
+        """Проверка, можно ли не рисовать объект: он скрыт, полностью прозрачен или пуст
+
+        :return: не нужно ли рисовать объект"""
+
+        return not self._visible or not self._image.get_width() or self.get_alpha() == 0
+
+    def get_draw_rect(self) -> pygame.Rect:
+        """Получение области экрана, которую занимает изображение объекта
+
+        Изображение рисуется от левого верхнего угла rect со сдвигом для плавного движения
+        и может быть больше rect
+
+        :return: область изображения"""
+
+        return pygame.Rect(
+            (self._rect.x + self.draw_offset[0], self._rect.y + self.draw_offset[1]), self._image.get_size()
+        )
+
+    def interpolate(self, alpha: float):
+        """Сдвиг изображения между положением до и после последнего шага обновления
+
+        :param alpha: доля шага, прошедшая после последнего обновления, от 0 до 1"""
+
+        x, y = self._rect.topleft
+        offset = (
+            round((self.previous_position[0] - x) * (1 - alpha)),
+            round((self.previous_position[1] - y) * (1 - alpha))
+        )
+        self.set_draw_offset(offset)
+
+    def set_draw_offset(self, offset: tuple[int, int]):
+        """Сдвиг изображения относительно rect
+
+        :param offset: сдвиг по x и y"""
+
+        if offset != self.draw_offset:
+            self.draw_offset = offset
+            self.mark_dirty()
+
+    def reset_draw_offset(self):
+        """Возврат изображения на место rect"""
+
+        self.set_draw_offset((0, 0))
+
+    def set_alpha(self, alpha: float):
+        """Установка прозрачности изображения объекта
+
+        Изображение должно принадлежать объекту, общие изображения из кэша менять нельзя
+
+        :param alpha: непрозрачность, значения за пределами 0-255 ограничиваются"""
+
+        alpha = max(0, min(255, round(alpha)))
+        if alpha != self._image.get_alpha():
+            self._image.set_alpha(alpha)
+            self.mark_dirty()
+
+    def get_position(self) -> tuple[int, int]:
+        """Получение положения левого верхнего угла объекта
+
+        :return: координаты"""
+
+        return self._rect.topleft
+
+    def set_position(self, position: tuple[float, float]):
+        """Перемещение левого верхнего угла объекта
+
+        :param position: координаты"""
+
+        position = (round(position[0]), round(position[1]))
+        if position != self._rect.topleft:
+            self.rect = pygame.Rect(position, self._rect.size)
+
+    def get_scale(self) -> float:
+        """Получение масштаба изображения объекта
+
+        :return: масштаб относительно исходного изображения"""
+
+        return self.scale
+
+    def set_scale(self, scale: float):
+        """Масштабирование изображения объекта относительно центра
+
+        :param scale: масштаб относительно исходного изображения"""
+
+        if scale == self.scale:
+            return
+        if self.unscaled_image is None:
+            self.unscaled_image = self._image
+        self.scale = scale
+
+        width, height = self.unscaled_image.get_size()
+        center = self._rect.center
+        size = (max(0, round(width * scale)), max(0, round(height * scale)))
+
+        # Сглаживание смешало бы прозрачный цвет с краями изображения и оставило цветную кайму,
+        # поэтому изображения с прозрачным цветом масштабируются без сглаживания
+        if scale == 1:
+            self.image = self.unscaled_image
+        elif self.unscaled_image.get_colorkey() is not None:
+            self.image = pygame.transform.scale(self.unscaled_image, size)
+        else:
+            self.image = pygame.transform.smoothscale(self.unscaled_image, size)
+        self.rect = self._image.get_rect(center=center)
+
+    def mark_dirty(self):
+        """Пометка объекта как изменившегося, нужна если изображение было изменено на месте"""
+
+        self.dirty = True
+        self.mask = None
+        if self.room is not None:
+            self.room.object_changed(self)
+
+    def wake(self):
+        """Пробуждение объекта, после чего он обновляется каждый кадр, пока ему это нужно"""
+
+        if self.room is not None and self not in self.room.awake_objects:
+            self.previous_position = self._rect.topleft
+            self.room.awake_objects[self] = None
+
+    def sleep(self):
+        """Усыпление объекта, спящие объекты не обновляются"""
+
+        if self.room is not None:
+            self.room.awake_objects.pop(self, None)
+
+        # Спящий объект рисуется там, где он находится
+        self.reset_draw_offset()
+
+    def wake_after(self, seconds: float):
+        """Пробуждение объекта через заданное время
+
+        :param seconds: время в секундах"""
+
+        if self.room is not None:
+            self.room.wake_after(self, seconds)
+
+    def kill(self):
+        """Удаление объекта из комнаты"""
+
+        if self.room is not None:
+            self.sleep()
+            self.room.object_changed(self)
+        super().kill()
+
+    def get_surfaces(self) -> list[pygame.Surface]:
+        """Получение всех изображений, которые хранит объект
+
+        :return: изображения из атрибутов объекта и списков в них и запомненные составленные изображения"""
+
+        surfaces = list(self.composed_images.values())
+        for value in vars(self).values():
+            if isinstance(value, pygame.Surface):
+                surfaces.append(value)
+            elif isinstance(value, list):
+                surfaces.extend(item for item in value if isinstance(item, pygame.Surface))
+        return surfaces
+
+    def release_images(self, assets: dict[int, tuple]):
+        """Освобождение изображений при выгрузке стены объекта
+
+        Изображения из кэша ресурсов заменяются их ключами, а составленные изображения удаляются.
+        Изображения, которые объект создал сам, остаются. restore_images загружает изображения обратно
+
+        :param assets: ключи ресурсов стены по id их изображений"""
+
+        for name, value in vars(self).items():
+            # Изображение с хуком будет составлено заново
+            if name == '_image' and self.image_hook is not None:
+                continue
+            if isinstance(value, pygame.Surface) and id(value) in assets:
+                self.released_images[name] = assets[id(value)]
+            elif isinstance(value, list) and value and all(
+                    isinstance(item, pygame.Surface) and id(item) in assets for item in value
+            ):
+                self.released_images[name] = [assets[id(item)] for item in value]
+
+        for name in self.released_images:
+            if name != '_image':
+                setattr(self, name, None)
+
+        # Пока стена выгружена, у объекта пустое изображение, поэтому он не рисуется и не получает кликов
+        if '_image' in self.released_images or self.image_hook is not None:
+            self.composed_images.clear()
+            self.image_state = None
+            self._image = pygame.Surface((0, 0))
+            self.mask = None
+            if self.room is not None:
+                self.room.object_changed(self)
+
+    def restore_images(self):
+        """Загрузка изображений, которые объект отпустил при выгрузке стены"""
+
+        released, self.released_images = self.released_images, {}
+        for name, key in released.items():
+            value = [load_asset(item) for item in key] if isinstance(key, list) else load_asset(key)
+            if name == '_image':
+                self.image = value
+            else:
+                setattr(self, name, value)
+
+        # Изображение с хуком составляем заново из восстановленных изображений
+        if self.image_state is None:
+            self.compose_image()
+
+    def hit(self, pos: tuple[int, int]) -> bool:
+        """Проверка попадания по непрозрачному пикселю изображения объекта
+        (или по всему изображению, если pixel_hit выключен, даже когда объект прозрачен)
+
+        :param pos: координаты точки на экране
+        :return: попадает ли точка в объект"""
+
+        # Проверяем ту же область, по которой объект добавлен в сетку
+        rect = self.get_draw_rect()
+        if not rect.collidepoint(pos):
+            return False
+        if not self.pixel_hit:
+            return True
+
+        # У полностью прозрачного объекта нет непрозрачных пикселей
+        if self.get_alpha() == 0:
+            return False
+        x, y = pos[0] - rect.x, pos[1] - rect.y
+
+        # Маска строится при первой проверке и сбрасывается, когда изображение меняется
+        if self.mask is None:
+            self.mask = pygame.mask.from_surface(self._image)
+        return bool(self.mask.get_at((x, y)))
+
+    def hover(self, pos: tuple[int, int]) -> bool:
+        """Обработка наведения курсора на модальное окно
+
+        :param pos: координаты курсора относительно объекта
+        :return: находится ли курсор над элементом, который обрабатывает клики"""
+
+        return self.is_clickable()
+
+    def is_clickable(self) -> bool:
+        """Проверка, обрабатывает ли объект клики
+
+        :return: есть ли у объекта обработчик клика"""
+
+        return self.click_hook is not None or type(self).click is not RoomObject.click
+
+    @property
+    def storage(self) -> Storage:
+        """Хранилище состояния объекта"""
+
+        return self._storage
+
+    @storage.setter
+    def storage(self, values: dict):
+        # Заменяем значения, а не само хранилище, чтобы не потерять подписчиков
+        self._storage.replace(values)
+
+    def call_hook(self, hook: Callable, *args: Any) -> Any:
+        """Вызов хука объекта с подсчётом вызовов в комнате
+
+        :param hook: хук
+        :param args: аргументы хука после объекта
+        :return: результат хука"""
+
+        if self.room is None:
+            return hook(self, *args)
+
+        self.room.hook_calls += 1
+        if self.room.profiler is None:
+            return hook(self, *args)
+
+        start = time.perf_counter()
+        result = hook(self, *args)
+        self.room.profiler.record(f"hook {getattr(hook, '__qualname__', type(hook).__name__)}", "hook", start)
+        return result
+
+    def subscribe(self, key: str | None, hook: Callable[[RoomObject, Any], None]):
+        """Подписка хука на изменение значения в хранилище объекта
+
+        Хук вызывается один раз при изменении значения, а не каждый кадр
+
+        :param key: ключ хранилища или None для всех ключей
+        :param hook: функция, которая вызывается с объектом и новым значением"""
+
+        self._storage.subscribe(key, lambda _, value: self.call_hook(hook, value))
+
+    def set_image_hook(self, keys: tuple[str, ...], hook: Callable[..., pygame.Surface]):
+        """Задание изображения объекта как функции от значений его хранилища
+
+        Хук вызывается с объектом и значениями хранилища по ключам keys и должен вернуть новое изображение,
+        не изменяя общие изображения. Изображение составляется заново, только когда эти значения меняются
+
+        :param keys: ключи хранилища, от которых зависит изображение
+        :param hook: функция, которая составляет изображение"""
+
+        self.image_keys = keys
+        self.image_hook = hook
+        self.image_state = None
+        self.composed_images.clear()
+        self.compose_image()
+
+        # Составляем изображение заново, когда меняется одно из значений
+        for key in keys:
+            self._storage.subscribe(key, lambda *_: self.compose_image())
+
+    def compose_image(self):
+        """Обновление изображения объекта, если изменились значения хранилища, от которых оно зависит"""
+
+        if self.image_hook is None:
+            return
+
+        state = tuple(self.storage.get(key) for key in self.image_keys)
+        if state == self.image_state:
+            return
+        self.image_state = state
+
+        # Берём изображение для этого состояния из запомненных или составляем его
+        if state in self.composed_images:
+            self.composed_images.move_to_end(state)
+        else:
+            self.composed_images[state] = self.call_hook(self.image_hook, *state)
+            if len(self.composed_images) > self.composed_images_limit:
+                self.composed_images.popitem(last=False)
+
+        self.image = self.composed_images[state]
 
     def update(self, delta_time: float):
         """Обновление объекта
@@ -168,10 +1659,36 @@ class RoomObject(Sprite):
         :param delta_time: время, прошедшее с последнего обновления"""
 
         if self.update_hook is not None:
-            self.update_hook(self, delta_time)
+            self.call_hook(self.update_hook, delta_time)
+
+    def needs_update(self) -> bool:
+        """Проверка, нужно ли обновлять объект каждый кадр
+
+        Объекты без анимации обновляются только после событий ввода
+
+        :return: нужно ли обновление"""
+
+        return self.needs_update_hook is not None and self.needs_update_hook(self)
 
     def click(self, pos: tuple[int, int]):
         """Функция, которая инициирует обработчик клика по объекту"""
 
         if self.click_hook is not None:
-            self.click_hook(self, pos)
+            self.call_hook(self.click_hook, pos)
+
+    def drag(self, target: pygame.Rect, position: tuple[int, int]):
+        """Функция, которая инициирует обработчик перемещения перетаскиваемой области
+
+        :param target: перетаскиваемая область в координатах объекта
+        :param position: положение target под курсором без ограничений"""
+
+        if self.drag_hook is not None:
+            self.call_hook(self.drag_hook, target, position)
+
+    def drop(self, target: pygame.Rect):
+        """Функция, которая инициирует обработчик конца перетаскивания
+
+        :param target: перетаскиваемая область в координатах объекта"""
+
+        if self.drop_hook is not None:
+            self.call_hook(self.drop_hook, target)
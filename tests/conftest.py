@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+import utils
+
+# Тесты запускаются без окна и звука
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(monkeypatch):
+    """Ресурсы ищутся от корня репозитория, а общий кэш и игровое время не переходят между тестами"""
+
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(utils, "simulated_ticks", None)
+    utils.asset_cache.clear()
+    yield
+    utils.asset_cache.clear()
+
+
+@pytest.fixture
+def game():
+    """Игра в безголовом режиме"""
+
+    from main import Game
+
+    return Game(headless=True)
@@ -0,0 +1,52 @@
+import os
+
+import pygame
+
+import bake
+import utils
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Манифест с одним изображением в двух размерах, чтобы подготовка шла быстро
+MANIFEST = {'images': {'paper.png': [[24, 24], [40, 30]]}}
+
+
+def use_build_dir(monkeypatch, tmp_path):
+    """Ресурсы берутся из репозитория, а кэш сборки создаётся во временной папке"""
+
+    os.symlink(os.path.join(ROOT, 'assets'), tmp_path / 'assets')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(bake, "load_manifest", lambda: MANIFEST)
+
+
+def test_bake_writes_every_manifest_size(monkeypatch, tmp_path):
+    use_build_dir(monkeypatch, tmp_path)
+    bake.bake()
+
+    for size in ((24, 24), (40, 30)):
+        path = utils.get_baked_path('paper.png', size)
+        assert path.startswith(str(tmp_path))
+        assert pygame.image.load(path).get_size() == size
+
+
+def test_bake_skips_up_to_date_images(monkeypatch, tmp_path, capsys):
+    use_build_dir(monkeypatch, tmp_path)
+    bake.bake()
+    assert capsys.readouterr().out.count("paper.png") == 2
+
+    bake.bake()
+    assert capsys.readouterr().out == ""
+
+
+def test_scaled_image_is_loaded_from_build_cache(monkeypatch, tmp_path):
+    use_build_dir(monkeypatch, tmp_path)
+    bake.bake()
+    scaled = []
+    monkeypatch.setattr(pygame.transform, "scale", lambda *args: scaled.append(args))
+
+    assert utils.load_scaled_image('paper.png', (24, 24)).get_size() == (24, 24)
+    assert scaled == []
+
+    # Размер, которого нет в кэше сборки, получается уменьшением исходного изображения
+    utils.load_scaled_image('paper.png', (10, 10))
+    assert len(scaled) == 1
@@ -0,0 +1,22 @@
+from benchmarks.suite import run_suite, find_regressions
+
+
+def test_run_suite_reports_every_scenario():
+    results = run_suite(2)
+
+    assert set(results) == {'cold_start_ms', 'walls', 'rotation', 'pause_menu', 'inventory', 'peak_surface_bytes'}
+    assert len(results['walls']) == 4
+    for wall in results['walls']:
+        assert set(wall) == {'update', 'draw', 'frame', 'full_redraw', 'composite_rebuild'}
+        assert set(wall['full_redraw']) == {'mean_ms', 'p95_ms', 'max_ms'}
+        # Перерисовка всего экрана действительно что-то рисует, в отличие от кадров без изменений
+        assert wall['composite_rebuild']['mean_ms'] > wall['draw']['mean_ms']
+    assert results['inventory']['items'] == 8
+    assert results['peak_surface_bytes'] > 0
+
+
+def test_find_regressions_ignores_noise_and_counts():
+    baseline = {'walls': [{'draw': {'mean_ms': 2.0, 'max_ms': 1.0}}], 'rotation': {'frames': 10, 'total_ms': 0.1}}
+    current = {'walls': [{'draw': {'mean_ms': 3.0, 'max_ms': 9.0}}], 'rotation': {'frames': 40, 'total_ms': 0.3}}
+
+    assert find_regressions(current, baseline, 0.2) == ["walls.0.draw.mean_ms: 2.000 -> 3.000 (+50%)"]
@@ -0,0 +1,153 @@
+import pygame
+
+import main
+import utils
+from replay import state_checksum
+from room import RoomObject
+from ui import CompletionUI
+
+
+def test_loading_screen_loads_every_startup_asset(monkeypatch):
+    misses = []
+    quest_room = main.QuestRoom
+
+    def counting_room():
+        start = utils.asset_cache.misses
+        room = quest_room()
+        misses.append(utils.asset_cache.misses - start)
+        return room
+
+    # Комната на старте загружает первую стену и её соседей, всё это уже должно быть в кэше
+    monkeypatch.setattr(main, "QuestRoom", counting_room)
+    game = main.Game(headless=True)
+
+    assert sorted(game.room.resident_walls) == [0, 1, 3]
+    assert misses == [0]
+
+
+def test_headless_time_follows_frames(game):
+    start = utils.get_ticks()
+    game.step(30)
+    assert utils.get_ticks() - start == 500
+
+    game.run(frames=30)
+    assert game.frame_index == 60
+    assert utils.get_ticks() - start == 1000
+
+
+def play_session(game) -> str:
+    """Поворот, клик по раковине и обратный поворот с ожиданием анимаций
+
+    :return: контрольная сумма состояния после сессии"""
+
+    game.step(5)
+    game.inject(pygame.KEYDOWN, key=pygame.K_RIGHT)
+    game.step(40)
+    game.inject(pygame.KEYDOWN, key=pygame.K_LEFT)
+    game.step(40)
+    game.inject(pygame.MOUSEBUTTONDOWN, pos=(560, 305), button=1)
+    game.inject(pygame.MOUSEBUTTONUP, pos=(560, 305), button=1)
+    game.step(40)
+    return state_checksum(game.room)
+
+
+def test_headless_sessions_are_deterministic():
+    first = main.Game(headless=True)
+    checksum = play_session(first)
+    screen = pygame.image.tobytes(first.screen, "RGB")
+    assert first.room.current_wall == 0
+    assert any(obj.storage.get('running') for obj in first.room.walls[0])
+
+    second = main.Game(headless=True)
+    assert play_session(second) == checksum
+    assert pygame.image.tobytes(second.screen, "RGB") == screen
+
+
+def test_wait_for_event_keeps_event_order(game):
+    calls = []
+    game.room.click = lambda pos: calls.append(("down", pos))
+    game.room.mouse_up = lambda pos: calls.append(("up", pos))
+    game.room.key_down = lambda key: calls.append(("key", key))
+
+    game.inject(pygame.MOUSEBUTTONDOWN, pos=(10, 20), button=1)
+    game.inject(pygame.MOUSEBUTTONUP, pos=(10, 20), button=1)
+    game.inject(pygame.KEYDOWN, key=pygame.K_LEFT)
+    game.inject(pygame.KEYDOWN, key=pygame.K_RIGHT)
+    game.wait_for_event()
+    game.events()
+
+    assert calls == [("down", (10, 20)), ("up", (10, 20)), ("key", pygame.K_LEFT), ("key", pygame.K_RIGHT)]
+
+
+
+def test_fixed_timestep_runs_whole_ticks(game):
+    ticks = []
+    game.room.update = ticks.append
+    game.tick = 1 / 64
+    game.accumulator = 0
+
+    game.delta_time = 2.5 / 64
+    game.update()
+    assert len(ticks) == 2
+    assert game.accumulator == 0.5 / 64
+
+    game.delta_time = 0.5 / 64
+    game.update()
+    assert len(ticks) == 3
+    assert game.accumulator == 0
+    assert all(tick == game.tick for tick in ticks)
+
+
+def test_fixed_timestep_limits_catch_up(game):
+    ticks = []
+    game.room.update = ticks.append
+    game.accumulator = 0
+
+    game.delta_time = 1
+    game.update()
+
+    assert len(ticks) == game.max_catch_up
+    assert game.accumulator < game.tick
+
+
+def test_moving_object_is_drawn_between_ticks(game):
+    room = game.room
+    game.tick = 1 / 64
+    game.step(2)
+    game.accumulator = 0
+
+    obj = RoomObject(pygame.Surface((10, 10)), (105, 105))
+    obj.update_hook = lambda obj, _: setattr(obj, 'rect', obj.rect.move(40, 0))
+    obj.needs_update_hook = lambda _: True
+    room.add_objects(obj, wall=room.current_wall)
+
+    # После шага осталась четверть шага, поэтому объект рисуется на три четверти пути назад
+    game.delta_time = 1.25 / 64
+    game.update()
+    assert obj.rect.x == 140
+    assert obj.draw_offset == (-30, 0)
+    assert obj.get_draw_rect().x == 110
+
+
+def test_play_time_excludes_pause_menu(game):
+    room = game.room
+    start = room.get_play_time()
+    game.step(60)
+
+    game.inject(pygame.KEYDOWN, key=pygame.K_ESCAPE)
+    game.step(120)
+    assert room.paused
+    paused = room.get_play_time()
+    game.step(60)
+    assert room.get_play_time() == paused
+
+    game.inject(pygame.KEYDOWN, key=pygame.K_ESCAPE)
+    game.step(60)
+    assert not room.paused
+    assert abs(room.get_play_time() - start - 2000) <= 2 * 1000 / 60
+
+    # Время в окне завершения считается по тем же часам, а окно завершения тоже ставит комнату на паузу
+    completion = next(obj for obj in room.overlays if isinstance(obj, CompletionUI))
+    completion.complete()
+    assert room.modal is completion
+    assert room.pause_start is not None
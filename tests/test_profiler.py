@@ -0,0 +1,33 @@
+import pytest
+
+from main import Game
+from profiler import Profiler
+
+
+def test_profiler_stats_and_worst():
+    profiler = Profiler(window=3)
+    for duration in (0.001, 0.002, 0.003, 0.004):
+        profiler.record("update a", "object", 0, duration)
+    profiler.record("update b", "object", 0, 0.001)
+    profiler.record("draw", "phase", 0, 1)
+
+    stats = profiler.stats("update a")
+    assert stats['count'] == 3
+    assert stats['mean_ms'] == pytest.approx(3)
+    assert stats['max_ms'] == pytest.approx(4)
+    assert [name for name, _ in profiler.worst()] == ["update a", "update b"]
+    assert sum(count for _, count in profiler.histogram("update a")) == 3
+
+
+def test_profiler_names_each_object():
+    game = Game(headless=True, profile=True)
+    room = game.room
+    game.step(2)
+
+    names = [obj.name for wall in room.walls for obj in wall] + [obj.name for obj in room.overlays]
+    assert None not in names
+    assert len(set(names)) == len(names)
+
+    # Объекты одного класса на стене замеряются отдельно
+    updates = [name for name in game.profiler.samples if name.startswith("update RoomObject wall 0#")]
+    assert len(updates) == len(room.walls[0])
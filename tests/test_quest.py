@@ -0,0 +1,132 @@
+import random
+
+from quest import BookPuzzle
+from ui import PauseMenu
+
+
+def get_puzzle(game) -> BookPuzzle:
+    """Головоломка с книгами на стене 3, к которой повёрнут игрок"""
+
+    room = game.room
+    room.rotate(3)
+    game.step(2)
+    return next(obj for obj in room.walls[3] if isinstance(obj, BookPuzzle))
+
+
+def drag_book(room, puzzle: BookPuzzle, index: int, x: int):
+    """Перетаскивание книги мышью так, чтобы её левый край оказался в точке x полки"""
+
+    book = puzzle.books[index].rect
+    grab = (puzzle.rect.x + book.centerx, puzzle.rect.y + book.centery)
+    release = (grab[0] + x - book.x, grab[1])
+    room.click(grab)
+    room.mouse_move(release)
+    room.mouse_up(release)
+
+
+def assert_consistent(puzzle: BookPuzzle):
+    """Счётчик книг не на своих местах совпадает с пересчётом, а книги стоят вплотную"""
+
+    assert puzzle.misplaced == sum(book.right_x != i for i, book in enumerate(puzzle.books))
+    x = 0
+    for book in puzzle.books:
+        assert book.rect.x == x
+        x += book.rect.width
+
+
+def test_random_drags_keep_misplaced_counter_in_sync(game):
+    room = game.room
+    puzzle = get_puzzle(game)
+    rng = random.Random(17)
+    orders = set()
+
+    for _ in range(50):
+        if puzzle.storage.get('solved', False):
+            break
+        drag_book(room, puzzle, rng.randrange(len(puzzle.books)), rng.randrange(-40, puzzle.rect.width + 40))
+        assert room.drag is None
+        assert_consistent(puzzle)
+        orders.add(tuple(book.right_x for book in puzzle.books))
+
+    assert len(orders) > 5
+
+
+def test_sorting_books_solves_puzzle(game):
+    room = game.room
+    puzzle = get_puzzle(game)
+
+    for i in range(len(puzzle.books)):
+        j = next(j for j, book in enumerate(puzzle.books) if book.right_x == i)
+        if j != i:
+            drag_book(room, puzzle, j, puzzle.books[i].rect.x - 1)
+        assert puzzle.books[i].right_x == i
+
+    assert puzzle.misplaced == 0
+    assert puzzle.storage['solved']
+    assert puzzle.books[0].image is puzzle.solved_image
+
+    # Решённая головоломка больше не даёт взять книгу
+    drag_book(room, puzzle, 1, 0)
+    assert room.drag is None
+    assert [book.right_x for book in puzzle.books] == [0, 1, 2, 3]
+
+
+def grab_book(room, puzzle: BookPuzzle, index: int, dx: int):
+    """Захват книги мышью и сдвиг её на dx без отпускания кнопки"""
+
+    book = puzzle.books[index].rect
+    grab = (puzzle.rect.x + book.centerx, puzzle.rect.y + book.centery)
+    room.click(grab)
+    room.mouse_move((grab[0] + dx, grab[1]))
+    assert room.drag is not None
+    return grab[0] + dx, grab[1]
+
+
+def test_rotation_ends_drag(game):
+    room = game.room
+    puzzle = get_puzzle(game)
+    pos = grab_book(room, puzzle, 0, 30)
+
+    room.rotate(1)
+    assert room.drag is None
+    assert puzzle.grabbed_book is None
+    assert_consistent(puzzle)
+
+    # Движение мыши на другой стене не переставляет книги головоломки, которой не видно
+    order = [book.right_x for book in puzzle.books]
+    room.mouse_move((pos[0] + 200, pos[1]))
+    room.mouse_up((pos[0] + 200, pos[1]))
+    assert [book.right_x for book in puzzle.books] == order
+
+
+def test_drag_survives_unloading_of_its_wall(game):
+    room = game.room
+    puzzle = get_puzzle(game)
+    pos = grab_book(room, puzzle, 1, -20)
+
+    # Со стены 1 стена 3 напротив и выгружается вместе с изображениями книг
+    room.rotate(1)
+    room.rotate(1)
+    game.step(2)
+    assert 3 not in room.resident_walls
+
+    room.mouse_move((pos[0] + 100, pos[1]))
+    room.mouse_up((pos[0] + 100, pos[1]))
+    game.step(2)
+    assert room.drag is None
+
+    room.rotate(2)
+    game.step(2)
+    assert_consistent(puzzle)
+    assert all(book.image is not None for book in puzzle.books)
+
+
+def test_modal_ends_drag(game):
+    room = game.room
+    puzzle = get_puzzle(game)
+    grab_book(room, puzzle, 2, 25)
+
+    next(obj for obj in room.overlays if isinstance(obj, PauseMenu)).toggle()
+    assert room.drag is None
+    assert puzzle.grabbed_book is None
+    assert_consistent(puzzle)
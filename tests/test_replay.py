@@ -0,0 +1,55 @@
+import pygame
+
+from inventory import Item
+from main import Game
+from replay import InputReplay, state_checksum
+
+
+def record_session(path: str, delta_time: float) -> Game:
+    """Запись короткой игры: поворот и клик по месту кусочка картинки во время поворота"""
+
+    game = Game(headless=True, delta_time=delta_time, record=path)
+    game.step(2)
+    game.inject(pygame.KEYDOWN, key=pygame.K_RIGHT)
+    game.step(25)
+    game.inject(pygame.MOUSEBUTTONDOWN, pos=(600, 400), button=1)
+    game.inject(pygame.MOUSEBUTTONUP, pos=(600, 400), button=1)
+    game.step(60)
+    game.recorder.close(game.frame_index, game.room)
+    return game
+
+
+def test_replay_matches_recording_at_custom_delta_time(tmp_path):
+    path = str(tmp_path / "session.rec")
+    recorded = record_session(path, 1 / 120)
+
+    checksum, expected = Game(headless=True).replay(path)
+
+    assert expected == state_checksum(recorded.room)
+    assert checksum == expected
+
+
+def test_replay_reproduces_frame_times(tmp_path):
+    path = str(tmp_path / "session.rec")
+    record_session(path, 1 / 144)
+
+    replay = InputReplay(path)
+
+    assert replay.frames == 87
+    assert all(replay.timings[frame][0] == 1 / 144 for frame in range(1, replay.frames + 1))
+    assert replay.timings[87][1] == round(87 / 144 * 1000)
+
+
+def test_state_checksum_tracks_storage_and_inventory(game):
+    room = game.room
+    initial = state_checksum(room)
+    game.step(10)
+    assert state_checksum(room) == initial
+
+    sink = next(obj for obj in room.walls[0] if obj.click_hook == room.click_sink)
+    sink.storage['running'] = True
+    running = state_checksum(room)
+    assert running != initial
+
+    room.inventory.add(Item("tea", "Чай", pygame.Surface((1, 1))))
+    assert state_checksum(room) not in (initial, running)
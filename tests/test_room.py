@@ -0,0 +1,609 @@
+import pygame
+
+import utils
+from room import RoomObject, SpatialGrid, Storage, linear, ease_in, ease_out, ease_in_out
+from utils import get_manifest_keys
+
+DOOR = ('image', 'door.png', (312, 545))
+
+
+def test_startup_manifest_has_only_first_wall_and_shared_assets():
+    keys = get_manifest_keys(walls=(0,))
+
+    assert ('image', 'backgrounds/wall_0.png') in keys
+    assert ('image', 'kran_on.png', (64, 75)) in keys
+    assert ('image', 'left_arrow.png', (32, 32)) in keys
+    assert ('image', 'key.png') in keys
+    assert ('image', 'backgrounds/wall_2.png') not in keys
+    assert DOOR not in keys
+    assert set(keys) < set(get_manifest_keys())
+
+
+def test_walls_stay_within_residency_budget(game):
+    room = game.room
+
+    for _ in range(8):
+        room.rotate(1)
+        game.step(2)
+
+        assert len(room.resident_walls) == 3
+        assert room.backgrounds[(room.current_wall + 2) % 4] is None
+        assert room.get_residency_size() <= room.residency_budget
+
+
+def test_unloaded_wall_releases_and_restores_images(game):
+    room = game.room
+    door = next(obj for obj in room.walls[3] if obj.image is utils.asset_cache.entries[DOOR][0])
+
+    # Со стены 1 стена 3 напротив и выгружается
+    room.rotate(1)
+    game.step(2)
+    assert DOOR not in utils.asset_cache.entries
+    assert door.image.get_size() == (0, 0)
+    assert door.is_culled()
+
+    room.rotate(2)
+    game.step(2)
+    assert door.image is utils.asset_cache.entries[DOOR][0]
+    assert not door.is_culled()
+
+
+def test_unloaded_wall_keeps_object_state(game):
+    room = game.room
+    room.rotate(2)
+    game.step(2)
+    lamp = next(obj for obj in room.walls[2] if obj.click_hook == room.click_lamp)
+    lamp.storage['on'] = True
+    assert lamp.image is lamp.on_image
+
+    # Со стены 0 стена 2 напротив и выгружается
+    room.rotate(2)
+    game.step(2)
+    assert lamp.on_image is None
+
+    room.rotate(2)
+    game.step(2)
+    assert lamp.storage['on']
+    assert lamp.image is lamp.on_image is utils.asset_cache.entries[('image', 'lamp_on.png', (100, 150))][0]
+
+
+def make_object(size, pos, alpha_hole=False):
+    """Объект со сплошным изображением, у которого может быть прозрачная середина"""
+
+    image = pygame.Surface(size, pygame.SRCALPHA, 32)
+    image.fill((255, 255, 255, 255))
+    if alpha_hole:
+        image.fill((0, 0, 0, 0), image.get_rect().inflate(-size[0] // 2, -size[1] // 2))
+    obj = RoomObject(image, pos)
+    obj.click_hook = lambda *_: None
+    return obj
+
+
+def test_spatial_grid_returns_topmost_opaque_object():
+    grid = SpatialGrid(cell_size=32)
+    bottom = make_object((100, 100), (50, 50))
+    top = make_object((100, 100), (50, 50), alpha_hole=True)
+    grid.add(bottom)
+    grid.add(top)
+
+    assert grid.hit_test((5, 5)) is top
+    assert grid.hit_test((50, 50)) is bottom
+    assert grid.hit_test((150, 150)) is None
+    assert grid.hit_test((5, 5), from_top=False) is bottom
+
+    grid.remove(top)
+    assert grid.hit_test((5, 5)) is bottom
+
+
+def test_spatial_grid_follows_moved_object():
+    grid = SpatialGrid(cell_size=32)
+    obj = make_object((20, 20), (10, 10))
+    grid.add(obj)
+
+    obj.rect = obj.rect.move(200, 0)
+    grid.move(obj)
+
+    assert grid.hit_test((10, 10)) is None
+    assert grid.hit_test((210, 10)) is obj
+
+
+def test_mask_and_grid_use_the_draw_rect():
+    grid = SpatialGrid(cell_size=32)
+    obj = make_object((20, 20), (10, 10))
+    grid.add(obj)
+
+    obj.set_draw_offset((100, 0))
+    grid.move(obj)
+
+    assert obj.hit((110, 10))
+    assert not obj.hit((10, 10))
+    assert grid.hit_test((110, 10)) is obj
+
+
+def test_lamp_cord_is_clickable_over_its_whole_region(game):
+    room = game.room
+    room.rotate(2)
+    game.step(2)
+    lamp = next(obj for obj in room.walls[2] if obj.click_hook == room.click_lamp)
+
+    for x in range(71, 90):
+        for y in range(101, 140):
+            assert room.hit_test((lamp.rect.x + x, lamp.rect.y + y)) is lamp
+
+
+def test_transparent_transition_overlay_blocks_arrows(game):
+    room = game.room
+    arrow = room.hit_test((48, 360))
+    assert arrow is not None and arrow.is_clickable()
+
+    # Затемнение только началось, оверлей ещё полностью прозрачен
+    room.key_down(pygame.K_RIGHT)
+    overlay = room.hit_test((48, 360))
+    assert overlay is not arrow
+    assert overlay.get_alpha() == 0
+
+
+def test_transparent_parts_of_overlay_pass_clicks_to_wall(game):
+    room = game.room
+    overlay = make_object((200, 200), (540, 300), alpha_hole=True)
+    below = make_object((40, 40), (540, 300))
+    room.add_objects(overlay)
+    room.add_objects(below, wall=0)
+
+    assert room.hit_test((540, 300)) is below
+    assert room.hit_test((445, 205)) is overlay
+
+
+def test_idle_frame_redraws_nothing(game):
+    room = game.room
+    game.step(30)
+
+    assert room.draw(game.screen) == []
+
+
+def test_moved_object_redraws_old_and_new_area(game):
+    room = game.room
+    obj = make_object((20, 20), (300, 300))
+    room.add_objects(obj, wall=0)
+    game.step(30)
+    old = obj.get_draw_rect()
+
+    obj.rect = obj.rect.move(100, 0)
+    rects = room.draw(game.screen)
+
+    assert sorted(map(tuple, rects)) == sorted([tuple(old), tuple(obj.get_draw_rect())])
+    # На старом месте снова фон стены, на новом - объект
+    assert game.screen.get_at(old.center) == room.get_composite().get_at(old.center)
+    assert game.screen.get_at(obj.rect.center)[:3] == (255, 255, 255)
+
+
+def test_overlapping_damage_is_merged(game):
+    room = game.room
+    obj = make_object((20, 20), (300, 300))
+    room.add_objects(obj, wall=0)
+    game.step(30)
+    old = obj.get_draw_rect()
+
+    obj.rect = obj.rect.move(10, 0)
+    assert room.draw(game.screen) == [old.union(obj.get_draw_rect())]
+
+
+def test_damage_covers_image_larger_than_rect(game):
+    room = game.room
+    obj = make_object((40, 20), (300, 300))
+    obj.rect = pygame.Rect(obj.rect.topleft, (20, 20))
+    room.add_objects(obj, wall=0)
+    game.step(30)
+
+    obj.mark_dirty()
+    assert room.draw(game.screen) == [pygame.Rect(obj.rect.topleft, (40, 20))]
+
+
+def test_hidden_object_is_not_drawn_or_clicked(game):
+    room = game.room
+    obj = make_object((20, 20), (300, 300))
+    room.add_objects(obj, wall=0)
+    game.step(30)
+    assert room.hit_test((300, 300)) is obj
+
+    obj.visible = False
+    assert room.draw(game.screen) == [obj.get_draw_rect()]
+    assert game.screen.get_at((300, 300)) == room.get_composite().get_at((300, 300))
+    assert obj not in room.drawn_rects
+    assert room.hit_test((300, 300)) is not obj
+
+    # Скрытый объект больше ничего не перерисовывает, пока снова не появится
+    obj.mark_dirty()
+    assert room.draw(game.screen) == []
+    obj.visible = True
+    assert room.draw(game.screen) == [obj.get_draw_rect()]
+    assert room.hit_test((300, 300)) is obj
+
+
+def test_transparent_object_is_culled(game):
+    room = game.room
+    obj = make_object((20, 20), (300, 300))
+    obj.static = True
+    room.add_objects(obj, wall=0)
+    game.step(30)
+    assert obj in room.baked_objects[0]
+
+    obj.set_alpha(0)
+    room.draw(game.screen)
+    assert obj.is_culled()
+    assert obj not in room.baked_objects[0]
+    assert game.screen.get_at((300, 300)) == room.get_composite().get_at((300, 300))
+    assert room.hit_test((300, 300)) is not obj
+
+
+def add_static(room, wall, color, pos=(540, 100)):
+    """Неподвижный объект сплошного цвета, который рисуется в изображение стены"""
+
+    image = pygame.Surface((20, 20))
+    image.fill(color)
+    obj = RoomObject(image, pos)
+    obj.static = True
+    room.add_objects(obj, wall=wall)
+    return obj
+
+
+def test_composite_is_kept_per_wall_and_redrawn_in_place(game):
+    room = game.room
+    game.step(2)
+    first = room.composites[0]
+
+    # Поворот туда и обратно не пересобирает изображение первой стены
+    room.rotate(1)
+    game.step(2)
+    room.rotate(-1)
+    game.step(2)
+    assert room.composites[0] is first
+    assert room.composite_valid[0]
+
+    # Сброшенное изображение рисуется заново в ту же поверхность
+    room.invalidate_composite()
+    game.step(1)
+    assert room.composites[0] is first
+    assert room.composite_valid[0]
+
+
+def test_baked_object_is_drawn_at_its_draw_rect(game):
+    room = game.room
+    obj = add_static(room, 0, (255, 0, 0))
+    game.step(2)
+
+    # Сдвиг задаётся после шага, иначе его заменит сдвиг плавного движения
+    obj.set_draw_offset((40, 0))
+    room.draw(game.screen)
+
+    assert obj in room.baked_objects[0]
+    assert game.screen.get_at((obj.rect.x + 45, obj.rect.y + 5))[:3] == (255, 0, 0)
+    assert room.composites[0].get_at((obj.rect.x + 45, obj.rect.y + 5))[:3] == (255, 0, 0)
+
+
+def test_change_on_hidden_wall_rebuilds_its_composite(game):
+    room = game.room
+    obj = add_static(room, 1, (255, 0, 0))
+    room.rotate(1)
+    game.step(2)
+    assert obj in room.baked_objects[1]
+
+    # Объект меняется, пока его стена не видна
+    room.rotate(-1)
+    game.step(2)
+    image = pygame.Surface((20, 20))
+    image.fill((0, 0, 255))
+    obj.image = image
+    game.step(1)
+    assert not room.composite_valid[1]
+
+    room.rotate(1)
+    game.step(2)
+    assert game.screen.get_at(obj.rect.center)[:3] == (0, 0, 255)
+
+
+def test_unloaded_wall_drops_its_composite(game):
+    room = game.room
+    room.rotate(1)
+    game.step(2)
+
+    # Со стены 2 стена 0 напротив и выгружается
+    room.rotate(1)
+    game.step(2)
+    assert room.composites[0] is None
+    assert room.composites[1] is not None
+
+
+def test_storage_notifies_only_on_change():
+    storage = Storage()
+    changes = []
+    every = []
+    storage.subscribe('on', lambda key, value: changes.append(value))
+    storage.subscribe(None, lambda key, value: every.append((key, value)))
+
+    storage['on'] = True
+    storage['on'] = True
+    storage['other'] = 1
+    storage.setdefault('on', False)
+    del storage['on']
+    storage.pop('missing', None)
+
+    assert changes == [True, None]
+    assert every == [('on', True), ('other', 1), ('on', None)]
+
+
+def test_storage_replace_keeps_subscribers():
+    obj = make_object((10, 10), (5, 5))
+    values = []
+    obj.subscribe('digit', lambda _, value: values.append(value))
+
+    obj.storage = {'digit': 1}
+    obj.storage = {'digit': 2, 'other': True}
+    obj.storage = {}
+
+    assert values == [1, 2, None]
+    assert dict(obj.storage) == {}
+
+
+def add_composed(calls):
+    """Объект, изображение которого составляется по ключу 'on', вызовы хука записываются в calls"""
+
+    obj = make_object((10, 10), (5, 5))
+
+    def compose(obj, on):
+        calls.append(on)
+        image = pygame.Surface((10, 10))
+        image.fill((255, 255, 0) if on else (0, 0, 255))
+        return image
+
+    obj.set_image_hook(('on',), compose)
+    return obj
+
+
+def test_image_hook_is_memoised_per_state():
+    calls = []
+    obj = add_composed(calls)
+    off = obj.image
+
+    obj.storage['on'] = True
+    on = obj.image
+    obj.storage['other'] = 1
+    obj.storage['on'] = None
+    obj.storage['on'] = True
+
+    # Хук вызван по разу для каждого состояния, а при возврате к состоянию берётся то же изображение
+    assert calls == [None, True]
+    assert obj.image is on
+    obj.storage['on'] = None
+    assert obj.image is off
+    assert calls == [None, True]
+
+
+def test_image_hook_forgets_least_recently_used_states():
+    calls = []
+    obj = add_composed(calls)
+    obj.composed_images_limit = 2
+
+    obj.storage['on'] = True
+    obj.storage['on'] = False
+    obj.storage['on'] = None
+
+    assert list(obj.composed_images) == [(False,), (None,)]
+    assert calls == [None, True, False, None]
+
+
+def test_unchanged_state_calls_no_hooks_per_frame(game):
+    room = game.room
+    game.step(30)
+
+    for _ in range(10):
+        game.step(1)
+        assert room.hook_calls_per_frame == 0
+
+
+def test_hook_calls_are_counted_per_drawn_frame(game):
+    room = game.room
+    game.tick = 1 / 64
+    game.fixed_delta_time = 3 / 64
+    game.step(30)
+    obj = add_counter(room, frames=100)
+
+    # Каждый кадр проходит три шага обновления, и все они попадают в счётчик кадра
+    game.step(2)
+    assert obj.updates == 6
+    assert room.hook_calls_per_frame == 3
+
+    # Кадр без шагов обновления не вызывает хуков
+    game.fixed_delta_time = 0
+    game.step(1)
+    assert room.hook_calls_per_frame == 0
+
+
+def add_counter(room, wall=0, frames=0):
+    """Объект, который считает свои обновления и просит обновлять себя ещё frames кадров"""
+
+    obj = make_object((10, 10), (5, 5))
+    obj.updates = 0
+    obj.frames = frames
+
+    def update(obj, _):
+        obj.updates += 1
+        obj.frames -= 1
+
+    obj.update_hook = update
+    obj.needs_update_hook = lambda obj: obj.frames > 0
+    room.add_objects(obj, wall=wall)
+    return obj
+
+
+def test_idle_objects_fall_asleep(game):
+    room = game.room
+    game.step(5)
+    obj = add_counter(room, frames=3)
+
+    for _ in range(6):
+        room.update(1 / 60)
+
+    assert obj.updates == 3
+    assert obj not in room.awake_objects
+
+
+def test_objects_on_hidden_walls_are_not_updated(game):
+    room = game.room
+    obj = add_counter(room, wall=2)
+
+    room.update(1 / 60)
+    assert obj.updates == 0
+    assert obj in room.awake_objects
+
+    room.rotate(2)
+    room.update(1 / 60)
+    assert obj.updates == 1
+    assert obj not in room.awake_objects
+
+
+def test_wake_after_uses_game_time(game):
+    room = game.room
+    obj = add_counter(room)
+    room.update(1 / 60)
+    assert obj.updates == 1
+
+    obj.wake_after(0.1)
+    assert room.time_until_wake() == 100
+    room.update(1 / 60)
+    assert obj.updates == 1
+
+    utils.simulated_ticks += 100
+    assert room.needs_update()
+    room.update(1 / 60)
+    assert obj.updates == 2
+    assert room.time_until_wake() is None
+
+
+def test_wake_on_channel(game):
+    room = game.room
+    obj = add_counter(room)
+    room.update(1 / 60)
+
+    room.wake_on("bell", obj)
+    room.send_message("bell")
+    room.update(1 / 60)
+
+    assert obj.updates == 2
+
+
+def test_messages_reach_channel_and_wildcard_handlers(game):
+    room = game.room
+    received = []
+    room.register_message_handler(lambda channel, *messages: received.append(("ping", messages)), "ping")
+    room.register_message_handler(lambda channel, *messages: received.append(("*", channel)))
+
+    room.send_message("ping", 1, 2)
+    room.send_message("other")
+
+    assert received == [("ping", (1, 2)), ("*", "ping"), ("*", "other")]
+    assert room.get_channel_stats("ping")['dispatched'] == 1
+
+
+def test_deferred_channel_delivers_next_frame_and_coalesces(game):
+    room = game.room
+    received = []
+    room.register_message_handler(lambda channel, value: received.append((channel, value)), "queued")
+    room.register_message_handler(lambda channel, value: received.append((channel, value)), "latest")
+    room.defer_channel("queued")
+    room.defer_channel("latest", coalesce=True)
+
+    for value in range(3):
+        room.send_message("queued", value)
+        room.send_message("latest", value)
+    assert received == []
+    assert room.needs_update()
+
+    room.update(1 / 60)
+
+    assert received == [("queued", 0), ("latest", 2), ("queued", 1), ("queued", 2)]
+    stats = room.get_channel_stats("latest")
+    assert (stats['dispatched'], stats['coalesced']) == (1, 2)
+
+
+def test_easing_curves_keep_their_ends():
+    for easing in (linear, ease_in, ease_out, ease_in_out):
+        assert easing(0) == 0
+        assert easing(1) == 1
+    assert ease_in(0.5) < 0.5 < ease_out(0.5)
+    assert ease_in_out(0.5) == 0.5
+
+
+def test_tween_moves_object_and_calls_on_complete_once(game):
+    room = game.room
+    obj = make_object((10, 10), (5, 5))
+    room.add_objects(obj, wall=room.current_wall)
+    done = []
+
+    room.animate(obj, "position", (80, 0), 0.5, delay=0.25, on_complete=lambda: done.append(obj.rect.topleft))
+    positions = []
+    for _ in range(8):
+        room.update(1 / 8)
+        positions.append(obj.rect.topleft)
+
+    assert positions[:4] == [(0, 0), (0, 0), (20, 0), (40, 0)]
+    assert positions[5:] == [(80, 0)] * 3
+    assert done == [(80, 0)]
+    assert not room.tweens
+
+
+def test_tween_callback_can_start_next_tween(game):
+    room = game.room
+    obj = make_object((10, 10), (5, 5))
+    room.add_objects(obj, wall=room.current_wall)
+    obj.image.set_alpha(255)
+
+    room.animate(obj, "alpha", 0, 0.25, on_complete=lambda: room.animate(obj, "alpha", 255, 0.25))
+    alphas = []
+    for _ in range(4):
+        room.update(1 / 8)
+        alphas.append(obj.get_alpha())
+
+    assert alphas[1] == 0
+    assert alphas[3] == 255
+    assert not room.tweens
+
+
+def test_stop_animations_skips_on_complete(game):
+    room = game.room
+    obj = make_object((10, 10), (5, 5))
+    room.add_objects(obj, wall=room.current_wall)
+    done = []
+
+    room.animate(obj, "position", (80, 0), 0.5, on_complete=lambda: done.append(True))
+    room.update(1 / 8)
+    room.stop_animations(obj)
+    room.update(1 / 8)
+
+    assert obj.rect.topleft == (20, 0)
+    assert done == []
+    assert not room.tweens
+
+
+def test_scale_tween_keeps_color_key_edges_clean(game):
+    room = game.room
+    image = pygame.Surface((20, 20)).convert()
+    image.fill(utils.COLOR_KEY)
+    image.fill((0, 200, 0), (5, 5, 10, 10))
+    image.set_colorkey(utils.COLOR_KEY, pygame.RLEACCEL)
+    obj = RoomObject(image, (100, 100))
+    room.add_objects(obj, wall=room.current_wall)
+
+    room.animate(obj, "scale", 1.5, 0.25)
+    for _ in range(2):
+        room.update(1 / 8)
+
+    # Масштабируется исходное изображение вокруг центра, и в нём нет смешанных с прозрачным цветом пикселей
+    assert obj.get_scale() == 1.5
+    assert obj.image.get_size() == (30, 30)
+    assert obj.rect.center == (100, 100)
+    colors = {tuple(obj.image.get_at((x, y)))[:3] for x in range(30) for y in range(30)}
+    assert colors == {utils.COLOR_KEY, (0, 200, 0)}
+
+    obj.set_scale(1)
+    assert obj.image is image
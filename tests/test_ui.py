@@ -0,0 +1,90 @@
+import pygame
+
+from inventory import Item
+from ui import InventoryUI, PauseMenu
+
+
+def get_overlay(room, cls):
+    """Оверлей комнаты нужного класса"""
+
+    return next(obj for obj in room.overlays if isinstance(obj, cls))
+
+
+def paper_item(uid: str) -> Item:
+    """Предмет со сплошным изображением"""
+
+    image = pygame.Surface((64, 64))
+    image.fill((200, 200, 200))
+    return Item(uid, uid, image)
+
+
+def test_inventory_version_counts_changes(game):
+    inventory = game.room.inventory
+    version = inventory.version
+
+    inventory.add(paper_item("a"))
+    inventory.add(paper_item("a"))
+    inventory.select(0)
+    inventory.remove("missing")
+    inventory.remove_selected()
+
+    # Повторное добавление и удаление несуществующего предмета ничего не меняют
+    assert inventory.version == version + 3
+
+
+def test_inventory_ui_sleeps_until_inventory_changes(game):
+    room = game.room
+    inv_ui = get_overlay(room, InventoryUI)
+    game.step(30)
+    assert inv_ui not in room.awake_objects
+    assert inv_ui.drawn_version == room.inventory.version
+
+    room.inventory.add(paper_item("a"))
+    game.step(1)
+    assert inv_ui.drawn_version == room.inventory.version
+
+    game.step(30)
+    assert inv_ui not in room.awake_objects
+
+
+def test_inventory_ui_reuses_thumbnails(game):
+    room = game.room
+    inv_ui = get_overlay(room, InventoryUI)
+    item = paper_item("a")
+    room.inventory.add(item)
+    game.step(1)
+    thumbnail = inv_ui.get_thumbnail(item)
+
+    # Выбор предмета перерисовывает интерфейс, но не уменьшает изображение заново
+    room.inventory.select(0)
+    game.step(1)
+    assert inv_ui.get_thumbnail(item) is thumbnail
+    assert len(inv_ui.thumbnails) == 1
+    assert inv_ui.surface.get_at((10, 10))[:3] != (0, 0, 0)
+
+
+def test_pause_menu_draws_only_when_it_changes(game):
+    room = game.room
+    menu = get_overlay(room, PauseMenu)
+    game.step(30)
+
+    # Первый кадр рисует затемнённый снимок целиком, дальше без изменений ничего не рисуется
+    menu.toggle()
+    assert room.draw(game.screen) is None
+    snapshot = room.modal_snapshot
+    for _ in range(3):
+        assert room.draw(game.screen) == []
+    assert room.modal_snapshot is snapshot
+
+    # Наведение на кнопку перерисовывает только меню, повторное наведение на неё же - ничего
+    button = (menu.rect.x + 10, menu.rect.y + 95)
+    assert room.mouse_move(button)
+    assert room.draw(game.screen) == [menu.get_draw_rect()]
+    assert room.mouse_move((button[0] + 5, button[1]))
+    assert room.draw(game.screen) == []
+
+    # После закрытия меню экран перерисовывается целиком, а потом снова только изменения
+    menu.toggle()
+    assert room.modal is None
+    assert room.draw(game.screen) is None
+    assert room.draw(game.screen) == []
@@ -0,0 +1,178 @@
+import threading
+
+import pygame
+import pytest
+
+import utils
+from utils import AssetLoader
+
+
+def load_all(loader: AssetLoader):
+    """Ожидание загрузки всех ресурсов"""
+
+    while not loader.finished:
+        loader.poll()
+
+
+def test_asset_loader_names_missing_asset():
+    loader = AssetLoader([('image', 'missing.png')], workers=1)
+
+    with pytest.raises(RuntimeError, match="missing.png"):
+        load_all(loader)
+
+
+def test_asset_loader_falls_back_to_main_thread(monkeypatch):
+    def broken_decode(key):
+        raise OSError("decoder failed")
+
+    monkeypatch.setattr(utils, "convert_images", False)
+    monkeypatch.setattr(utils, "decode_asset", broken_decode)
+    loader = AssetLoader([('image', 'paper.png')], workers=1)
+    load_all(loader)
+
+    assert loader.loaded == 1
+    assert ('image', 'paper.png') in utils.asset_cache.entries
+
+
+def test_asset_loader_creates_fonts_on_main_thread(monkeypatch):
+    threads = []
+    font = pygame.font.Font
+
+    def recording_font(*args):
+        threads.append(threading.current_thread())
+        return font(*args)
+
+    pygame.font.init()
+    monkeypatch.setattr(pygame.font, "Font", recording_font)
+    loader = AssetLoader([('font', 'arkhip.ttf', 24), ('font', 'arkhip.ttf', 48)], workers=2)
+    load_all(loader)
+
+    assert threads == [threading.main_thread()] * 2
+    assert utils.asset_cache.entries[('font', 'arkhip.ttf', 48)][0].size("0")[1] > 24
+
+
+def load(cache: utils.AssetCache, key: str, size: int = 10) -> str:
+    """Получение из кэша ресурса, который загружается как ключ в верхнем регистре"""
+
+    return cache.get(key, lambda: key.upper(), lambda _: size)
+
+
+def test_asset_cache_hits_and_evicts_least_recently_used():
+    cache = utils.AssetCache(30)
+    load(cache, "a")
+    load(cache, "b")
+    load(cache, "c")
+    assert load(cache, "a") == "A"
+
+    # "b" использовался давнее всех
+    load(cache, "d")
+    assert list(cache.entries) == ["c", "a", "d"]
+    assert cache.used == 30
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 4
+
+
+def test_asset_cache_keeps_pinned_assets_until_fully_unpinned():
+    cache = utils.AssetCache(20)
+    load(cache, "a")
+    cache.pin("a")
+    cache.pin("a")
+    load(cache, "b")
+    load(cache, "c")
+    assert "a" in cache.entries
+
+    assert not cache.unpin("a")
+    assert "a" in cache.entries
+    assert cache.unpin("a")
+
+    # Откреплённый ресурс снова вытесняется первым, раз он использовался давнее всех
+    load(cache, "d")
+    assert list(cache.entries) == ["c", "d"]
+
+
+def test_asset_cache_records_requested_keys():
+    cache = utils.AssetCache(100)
+    load(cache, "a")
+    with cache.record() as keys:
+        load(cache, "a")
+        load(cache, "b", 7)
+    load(cache, "c")
+
+    assert keys == {"a", "b"}
+    assert cache.get_size(keys) == 17
+
+
+def test_text_cache_hits_and_evicts_least_recently_used():
+    pygame.font.init()
+    cache = utils.TextCache(2)
+    first = cache.render("arkhip.ttf", 24, "один", (255, 255, 255))
+    cache.render("arkhip.ttf", 24, "два", (255, 255, 255))
+
+    assert cache.render("arkhip.ttf", 24, "один", (255, 255, 255)) is first
+    # Другой цвет - другая запись, и она вытесняет давно не использованную строку "два"
+    cache.render("arkhip.ttf", 24, "один", (0, 0, 0))
+
+    assert [key[2:4] for key in cache.entries] == [("один", (255, 255, 255)), ("один", (0, 0, 0))]
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 3
+
+
+def test_text_cache_glyphs_render_each_char_once():
+    pygame.font.init()
+    cache = utils.TextCache(2)
+    target = pygame.Surface((200, 50), pygame.SRCALPHA, 32)
+
+    cache.blit_glyphs(target, (0, 0), "arkhip.ttf", 24, "909", (255, 255, 255))
+    cache.blit_glyphs(target, (0, 0), "arkhip.ttf", 24, "099", (255, 255, 255))
+
+    assert cache.glyph_misses == 2
+    assert cache.glyph_hits == 4
+    assert not cache.entries
+    # Посимвольная строка шириной совпадает с отрисованной целиком
+    width = sum(glyph.get_width() for glyph in cache.glyphs[("arkhip.ttf", 24, (255, 255, 255))].values())
+    assert width == cache.render("arkhip.ttf", 24, "09", (255, 255, 255)).get_width()
+
+
+def rgba_image(alphas) -> pygame.Surface:
+    """Изображение с попиксельной прозрачностью из полос с заданной непрозрачностью"""
+
+    image = pygame.Surface((len(alphas) * 4, 4), pygame.SRCALPHA, 32)
+    for i, alpha in enumerate(alphas):
+        image.fill((0, 200, 0, alpha), (i * 4, 0, 4, 4))
+    return image
+
+
+def test_convert_image_picks_cheapest_format(game):
+    opaque = utils.convert_image(rgba_image([255, 255]))
+    assert not opaque.get_flags() & pygame.SRCALPHA
+    assert opaque.get_colorkey() is None
+
+    keyed = utils.convert_image(rgba_image([255, 0]))
+    assert not keyed.get_flags() & pygame.SRCALPHA
+    assert keyed.get_colorkey()[:3] == utils.COLOR_KEY
+    assert keyed.get_at((0, 0))[:3] == (0, 200, 0)
+    assert keyed.get_at((4, 0))[:3] == utils.COLOR_KEY
+
+    translucent = utils.convert_image(rgba_image([255, 128]))
+    assert translucent.get_flags() & pygame.SRCALPHA
+    assert translucent.get_at((4, 0)).a == 128
+
+
+def test_convert_image_keeps_alpha_when_key_color_is_used(game):
+    image = rgba_image([255, 0])
+    image.fill((*utils.COLOR_KEY, 255), (0, 0, 1, 1))
+
+    assert utils.convert_image(image).get_flags() & pygame.SRCALPHA
+
+
+def test_images_loaded_before_window_are_converted_later(game, monkeypatch):
+    with monkeypatch.context() as patch:
+        patch.setattr(pygame.display, "get_surface", lambda: None)
+        image = utils.load_image("paper.png", (17, 17))
+    assert utils.pending_conversion == [('image', 'paper.png', (17, 17))]
+
+    utils.convert_pending_images()
+    assert not utils.pending_conversion
+    converted = utils.load_image("paper.png", (17, 17))
+    assert converted is not image
+    assert converted.get_bitsize() == game.screen.get_bitsize()
@@ -2,57 +2,44 @@ import sys
 
 import pygame
 
+from inventory import Item
+from profiler import Profiler
 from room import RoomObject, Room
-from utils import load_image, load_font
+from utils import load_image, load_font, render_text
 
 
 class TextOverlay(RoomObject):
     """Оверлей для отображения текста (Например: названий предметов, диалогов)"""
 
+    # Скорость появления и исчезновения (единиц непрозрачности в секунду) и время показа текста в секундах
+    fade_speed = 255 * 6
+    hold_time = 5 / 3
+
     def __init__(self):
         """Создание оверлея с текстом"""
 
-        self.font = load_font("arkhip.ttf", 24)
         self.surface = pygame.Surface((1086, 48))
         self.surface.fill((0, 0, 0))
         self.surface.set_alpha(0)
-        self.alpha = 0
-        self.alpha_speed = 0
-        self.alpha_target = 0
 
         super().__init__(self.surface, (543, 24))
 
         self.passthrough = True
 
-    def update(self, delta_time: float):
-        """Обновление оверлея текста
-
-        :param delta_time: время, прошедшее с последнего обновления"""
-
-        # Обновляем прозрачность
-        self.alpha += self.alpha_speed * delta_time
-        self.surface.set_alpha(self.alpha)
-
-        # Если прозрачность достигла цели
-        if (self.alpha_speed > 0 and self.alpha > self.alpha_target) or \
-                (self.alpha_speed < 0 and self.alpha < self.alpha_target):
-            # Если цель - полная непрозрачность
-            if self.alpha_target > 0:
-                # Запускаем обратную анимацию
-                self.alpha_speed = -self.alpha_speed
-                self.alpha_target = 0
-            else:
-                # Иначе останавливаем анимацию
-                self.alpha_speed = 0
-                self.passthrough = True
-
     def display(self, text: str):
-        """Запуск анимации перехода"""
+        """Показ текста с плавным появлением и исчезновением
+
+        :param text: текст"""
 
-        self.alpha_speed = 255 * 6
-        self.alpha_target = 255 * 6
         self.surface.fill((0, 0, 0))
-        self.surface.blit(self.font.render(text, True, (255, 255, 255)), (8, 8))
+        self.surface.blit(render_text("arkhip.ttf", 24, text), (8, 8))
+        self.mark_dirty()
+
+        # Появление начинается с текущей прозрачности, если прошлый текст ещё виден
+        self.room.stop_animations(self)
+        self.room.animate(self, "alpha", 255, (255 - self.get_alpha()) / self.fade_speed)
+        self.room.animate(self, "alpha", 0, 255 / self.fade_speed,
+                          delay=(255 - self.get_alpha()) / self.fade_speed + self.hold_time)
 
 
 class InventoryUI(RoomObject):
@@ -72,25 +59,55 @@ class InventoryUI(RoomObject):
         self.room = room
         self.cell_size = self.height / self.inventory.size - 16
 
+        # Версия инвентаря, которая сейчас нарисована, и уменьшенные изображения предметов
+        self.drawn_version = None
+        self.thumbnails = {}
+
         super().__init__(self.surface, (self.x, self.y))
 
+        # Интерфейс спит, пока инвентарь не изменится
+        room.wake_on("inventory", self)
+
     def update(self, delta_time: float):
         """Обновление интерфейса инвентаря
 
         :param delta_time: время, прошедшее с последнего обновления"""
 
+        # Если инвентарь не менялся, то перерисовывать нечего
+        if self.drawn_version == self.inventory.version:
+            return
+        self.drawn_version = self.inventory.version
+
         # Очищаем поверхность
         self.surface.fill((0, 0, 0))
+        self.mark_dirty()
 
         # Перебираем все предметы в инвентаре
         for i, item in enumerate(self.inventory.items):
             # Рисуем предмет
-            img = pygame.transform.scale(item.image, (int(self.cell_size) - 4, int(self.cell_size) - 4))
+            img = self.get_thumbnail(item)
             pos = (10, 10 + i * (self.cell_size + 16))
             if self.inventory.selected == i:
                 self.surface.fill((96, 96, 96), (pos[0] - 2, pos[1] - 2, self.cell_size, self.cell_size))
             self.surface.blit(img, pos)
 
+    def needs_update(self) -> bool:
+        """Интерфейс нужно обновить, только если инвентарь изменился"""
+
+        return self.drawn_version != self.inventory.version
+
+    def get_thumbnail(self, item: Item) -> pygame.Surface:
+        """Получение уменьшенного изображения предмета для ячейки инвентаря
+
+        :param item: предмет
+        :return: изображение размером с ячейку"""
+
+        size = (int(self.cell_size) - 4, int(self.cell_size) - 4)
+        key = (item.uid, size)
+        if key not in self.thumbnails:
+            self.thumbnails[key] = pygame.transform.scale(item.image, size)
+        return self.thumbnails[key]
+
     def click(self, pos: tuple[int, int]):
         """Обработка клика по интерфейсу инвентаря
 
@@ -111,6 +128,9 @@ class InventoryUI(RoomObject):
 class TransitionOverlay(RoomObject):
     """Оверлей перехода между комнатами"""
 
+    # Скорость затемнения и осветления в единицах непрозрачности в секунду
+    fade_speed = 255 * 6
+
     def __init__(self, room: Room):
         """Создание оверлея перехода
 
@@ -120,46 +140,37 @@ class TransitionOverlay(RoomObject):
         self.surface = pygame.Surface((1086, 720))
         self.surface.fill((0, 0, 0))
         self.surface.set_alpha(0)
-        self.alpha = 0
-        self.alpha_speed = 0
-        self.alpha_target = 0
-        self.rotation_target = 0
 
         super().__init__(self.surface, (543, 360))
 
+        # Во время перехода оверлей закрывает клики всей областью, даже пока он ещё прозрачен
+        self.pixel_hit = False
         self.passthrough = True
 
-    def update(self, delta_time: float):
-        """Обновление оверлея перехода
+    def start(self, target: int):
+        """Запуск анимации перехода
 
-        :param delta_time: время, прошедшее с последнего обновления"""
+        :param target: на сколько стен повернуть игрока"""
 
-        # Обновляем прозрачность
-        self.alpha += self.alpha_speed * delta_time
-        self.surface.set_alpha(self.alpha)
-
-        # Если прозрачность достигла цели
-        if (self.alpha_speed > 0 and self.alpha > self.alpha_target) or \
-                (self.alpha_speed < 0 and self.alpha < self.alpha_target):
-            # Если цель - полная непрозрачность
-            if self.alpha_target > 0:
-                # Запускаем обратную анимацию
-                self.alpha_speed = -self.alpha_speed
-                self.alpha_target = 0
-                # Поворачиваем игрока
-                self.room.rotate(self.rotation_target)
-            else:
-                # Иначе останавливаем анимацию
-                self.alpha_speed = 0
-                self.passthrough = True
+        self.passthrough = False
 
-    def start(self, target: int):
-        """Запуск анимации перехода"""
+        # Затемняем экран с текущей прозрачности, поворачиваем игрока и осветляем экран
+        self.room.stop_animations(self)
+        self.room.animate(self, "alpha", 255, (255 - self.get_alpha()) / self.fade_speed,
+                          on_complete=lambda: self.finish(target))
 
-        self.alpha_speed = 255 * 6
-        self.alpha_target = 255
-        self.rotation_target = target
-        self.passthrough = False
+    def finish(self, target: int):
+        """Поворот игрока на пике затемнения и осветление экрана
+
+        :param target: на сколько стен повернуть игрока"""
+
+        self.room.rotate(target)
+        self.room.animate(self, "alpha", 0, 255 / self.fade_speed, on_complete=self.stop)
+
+    def stop(self):
+        """Завершение перехода"""
+
+        self.passthrough = True
 
 
 class PauseMenu(RoomObject):
@@ -168,41 +179,74 @@ class PauseMenu(RoomObject):
     def __init__(self):
         """Создание меню паузы"""
 
-        self.surface = pygame.Surface((1086, 720), pygame.SRCALPHA, 32)
-        self.surface.fill((0, 0, 0, 172))
-        self.surface.set_alpha(0)
-
-        # Заголовок
-        self.surface.blit(load_font("arkhip.ttf", 64).render("Пауза", True, (255, 255, 255)), (140, 180))
+        # Меню рисуется поверх затемнённого снимка сцены, поэтому его фон прозрачный,
+        # а размер ограничен заголовком и кнопками, чтобы при наведении перерисовывалось меньше
+        self.surface = pygame.Surface((270, 210), pygame.SRCALPHA, 32)
 
         # Кнопки
-        f = load_font("arkhip.ttf", 24)
         self.buttons = []
-
         for i, b in enumerate([
             "Продолжить",
             "Громкость музыки",
             "Громкость звуков",
             "Выйти"
         ]):
-            pos = (140, 270 + i * 30)
-            img = f.render(b, True, (255, 255, 255))
-            self.surface.blit(img, pos)
-            self.buttons.append((b, pos, img))
+            pos = (0, 90 + i * 30)
+            img = render_text("arkhip.ttf", 24, b)
+            hover_img = render_text("arkhip.ttf", 24, b, (255, 220, 128))
+            self.buttons.append((b, pos, img, hover_img))
+
+        # Кнопка под курсором
+        self.hovered = None
+        self.render()
 
         # Остальные параметры
-        super().__init__(self.surface, (543, 360))
+        super().__init__(self.surface, (275, 285))
 
         self.visible = False
         self.passthrough = True
 
+    def render(self):
+        """Отрисовка заголовка и кнопок, кнопка под курсором подсвечивается"""
+
+        self.surface.fill((0, 0, 0, 0))
+
+        # Заголовок
+        self.surface.blit(render_text("arkhip.ttf", 64, "Пауза"), (0, 0))
+
+        # Кнопки
+        for i, (b, pos, img, hover_img) in enumerate(self.buttons):
+            self.surface.blit(hover_img if i == self.hovered else img, pos)
+
     def toggle(self):
         """Переключение видимости меню паузы"""
 
         self.visible = not self.visible
         self.passthrough = not self.visible
-        self.surface.set_alpha(255 if self.visible else 0)
-        self.room.paused = self.visible
+        self.mark_dirty()
+        if self.visible:
+            self.room.open_modal(self)
+        else:
+            self.room.close_modal()
+
+    def hover(self, pos: tuple[int, int]) -> bool:
+        """Подсветка кнопки под курсором
+
+        :param pos: позиция курсора
+        :return: находится ли курсор над кнопкой"""
+
+        hovered = None
+        for i, (b, p, img, hover_img) in enumerate(self.buttons):
+            if img.get_rect(topleft=p).collidepoint(pos):
+                hovered = i
+                break
+
+        # Перерисовываем меню, только если подсвеченная кнопка изменилась
+        if hovered != self.hovered:
+            self.hovered = hovered
+            self.render()
+            self.mark_dirty()
+        return hovered is not None
 
     def click(self, pos: tuple[int, int]):
         """Обработка клика по меню паузы
@@ -212,7 +256,7 @@ class PauseMenu(RoomObject):
         if not self.visible:
             return
 
-        for b, p, i in self.buttons:
+        for b, p, i, _ in self.buttons:
             if i.get_rect(topleft=p).collidepoint(pos):
                 if b == "Продолжить":
                     self.toggle()
@@ -229,37 +273,84 @@ class CompletionUI(RoomObject):
     def __init__(self):
         """Создание интерфейса завершения комнаты"""
 
-        # Загрузка изображений
+        # Интерфейс рисуется поверх затемнённого снимка сцены, поэтому его фон прозрачный
         self.surface = pygame.Surface((1086, 720), pygame.SRCALPHA, 32)
-        self.surface.fill((0, 0, 0, 172))
-        self.surface.set_alpha(0)
 
         # Остальные параметры
         super().__init__(self.surface, (543, 360))
 
         self.visible = False
         self.passthrough = True
-        self.time = 0
+
+    def complete(self):
+        """Завершение уровня"""
+
+        self.visible = True
+        self.passthrough = False
+
+        # Игра не обновляется, когда ничего не происходит, поэтому время считается по часам комнаты,
+        # которые не идут, пока открыто меню паузы
+        time = round(self.room.get_play_time() / 1000, 2)
+        self.surface.blit(render_text("arkhip.ttf", 64, "Комната пройдена"), (140, 180))
+        self.surface.blit(render_text("arkhip.ttf", 24, "Время: " + str(time) + " секунд"), (140, 270))
+        self.surface.blit(render_text("arkhip.ttf", 24, "Нажмите пробел, чтобы продолжить"), (140, 300))
+
+        self.mark_dirty()
+        self.room.open_modal(self)
+
+
+class ProfilerOverlay(RoomObject):
+    """Оверлей профилировщика, который показывает самые долгие участки кода"""
+
+    def __init__(self, profiler: Profiler, lines: int = 10):
+        """Создание оверлея профилировщика
+
+        :param profiler: профилировщик
+        :param lines: количество показываемых участков"""
+
+        self.profiler = profiler
+        self.lines = lines
+        self.surface = pygame.Surface((520, 24 + lines * 16), pygame.SRCALPHA, 32)
+
+        # Время до следующего обновления текста в секундах
+        self.refresh_interval = 0.5
+        self.refresh_time = 0
+
+        super().__init__(self.surface, (8 + 260, 56 + self.surface.get_height() // 2))
+
+        self.visible = False
+        self.passthrough = True
 
     def update(self, delta_time: float):
-        """Обновление интерфейса
+        """Обновление текста оверлея раз в полсекунды
 
         :param delta_time: время, прошедшее с последнего обновления"""
 
-        self.time += delta_time
+        self.refresh_time -= delta_time
+        if self.refresh_time > 0:
+            return
+        self.refresh_time = self.refresh_interval
 
-    def complete(self):
-        """Завершение уровня"""
+        # Текст рисуется шрифтом напрямую, чтобы постоянно меняющиеся строки не вытесняли кэш текста
+        font = load_font("arkhip.ttf", 12)
+        self.surface.fill((0, 0, 0, 192))
+        self.surface.blit(font.render("среднее, мс  максимум, мс  сумма, мс", True, (255, 255, 255)), (8, 4))
+        for i, (name, stats) in enumerate(self.profiler.worst(self.lines)):
+            text = f"{stats['mean_ms']:8.3f}{stats['max_ms']:9.3f}{stats['total_ms']:10.2f}   {name}"
+            self.surface.blit(font.render(text, True, (255, 255, 255)), (8, 20 + i * 16))
+        self.mark_dirty()
 
-        self.visible = True
-        self.passthrough = False
-        self.surface.set_alpha(255)
+    def needs_update(self) -> bool:
+        """Оверлей обновляется, пока он показан"""
 
-        self.surface.blit(load_font("arkhip.ttf", 64).render("Комната пройдена", True, (255, 255, 255)), (140, 180))
-        self.surface.blit(load_font("arkhip.ttf", 24).render("Время: " + str(round(self.time, 2)) + " секунд", True, (255, 255, 255)), (140, 270))
-        self.surface.blit(load_font("arkhip.ttf", 24).render("Нажмите пробел, чтобы продолжить", True, (255, 255, 255)), (140, 300))
+        return self.visible
 
-        self.room.paused = True
+    def toggle(self):
+        """Показ или скрытие оверлея"""
+
+        self.visible = not self.visible
+        self.refresh_time = 0
+        self.wake()
 
 
 def apply_ui(room: Room):
@@ -268,13 +359,14 @@ def apply_ui(room: Room):
     :param room: комната в которой будет отрисован интерфейс"""
 
     # Загрузка иконки стрелочки, которая используется для переключения стен
-    arrow_image = load_image("left_arrow.png")
-    arrow_image = pygame.transform.scale(arrow_image, (32, 32))
+    arrow_image = load_image("left_arrow.png", (32, 32))
 
     # Создания оверлея с текстом
     text_overlay = TextOverlay()
-    room.register_message_handler(lambda channel, text, *_:
-                                  text_overlay.display(str(text)) if (channel == "text") else None)
+    room.register_message_handler(lambda _, text, *__: text_overlay.display(str(text)), "text")
+
+    # Подряд идущие надписи показываются только последней, поэтому доставляем их раз в кадр
+    room.defer_channel("text", coalesce=True)
 
     # Создание инвентаря
     inv_ui = InventoryUI(room)
@@ -282,30 +374,31 @@ def apply_ui(room: Room):
     # Создание меню паузы
     pause_menu = PauseMenu()
 
-    def pause(channel, key, *_):
-        if channel == "key_down" and key == pygame.K_ESCAPE:
+    def pause(_, key, *__):
+        # Пауза не открывается поверх другого модального окна (например, экрана завершения)
+        if key == pygame.K_ESCAPE and room.modal in (None, pause_menu):
             pause_menu.toggle()
 
-    room.register_message_handler(pause)
+    room.register_message_handler(pause, "key_down")
 
     # Создание оверлея перехода
     transition_overlay = TransitionOverlay(room)
 
-    def rotate(channel, key, *_):
-        if channel == "key_down" and transition_overlay.passthrough:
+    def rotate(_, key, *__):
+        if transition_overlay.passthrough and room.modal is None:
             if key == pygame.K_LEFT:
                 transition_overlay.start(-1)
             elif key == pygame.K_RIGHT:
                 transition_overlay.start(1)
 
-    room.register_message_handler(rotate)
+    room.register_message_handler(rotate, "key_down")
 
     # Создание оверлея завершения уровня
     completion_ui = CompletionUI()
-    room.register_message_handler(lambda channel, *_: completion_ui.complete() if (channel == "complete") else None)
-    room.register_message_handler(lambda channel, key: sys.exit(0) if (
-            channel == "key_down" and key == pygame.K_SPACE and completion_ui.visible
-    ) else None)
+    room.register_message_handler(lambda *_: completion_ui.complete(), "complete")
+    room.register_message_handler(lambda _, key, *__: sys.exit(0) if (
+            key == pygame.K_SPACE and completion_ui.visible
+    ) else None, "key_down")
 
     # Создание стрелочки поворота против часовой стрелки
     left_arrow = RoomObject(arrow_image, (48, 360))
@@ -317,3 +410,16 @@ def apply_ui(room: Room):
 
     # Добавление объектов в оверлей
     room.add_objects(transition_overlay, text_overlay, left_arrow, right_arrow, inv_ui, pause_menu, completion_ui)
+
+
+def apply_profiler_ui(room: Room, profiler: Profiler):
+    """Включение профилировщика в комнате с оверлеем, который показывается по F3
+
+    :param room: комната
+    :param profiler: профилировщик"""
+
+    room.profiler = profiler
+    profiler_overlay = ProfilerOverlay(profiler)
+    room.register_message_handler(lambda _, key, *__: profiler_overlay.toggle() if key == pygame.K_F3 else None,
+                                  "key_down")
+    room.add_objects(profiler_overlay)
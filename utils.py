@@ -1,57 +1,361 @@
+import io
+import json
 import os
 import sys
+import time
+from collections import OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from typing import Any, Callable, Hashable
+
 import pygame
 
 
-def get_resource_path(asset_type, asset_name):
-    """Получает путь к ресурсу"""
+class AssetCache:
+    """Общий кэш загруженных ресурсов с ограничением по памяти и вытеснением давно не используемых (LRU)"""
+
+    def __init__(self, budget: int):
+        """Создание кэша
+
+        :param budget: максимальный объём памяти в байтах, который могут занимать незакреплённые ресурсы"""
+
+        self.budget = budget
+
+        # Записи кэша в порядке последнего использования: ключ -> (ресурс, размер в байтах)
+        self.entries = OrderedDict()
+        self.used = 0
+
+        # Количество закреплений каждого ресурса, закреплённые ресурсы никогда не вытесняются
+        self.pinned = Counter()
+
+        # Множества, в которые записываются ключи запрошенных ресурсов
+        self.recorders = []
+
+        # Счётчики попаданий и промахов
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, loader: Callable[[], Any], size: Callable[[Any], int]) -> Any:
+        """Получение ресурса из кэша или его загрузка
+
+        :param key: ключ ресурса
+        :param loader: функция, которая загружает ресурс
+        :param size: функция, которая оценивает размер ресурса в байтах
+        :return: ресурс"""
+
+        for recorder in self.recorders:
+            recorder.add(key)
+
+        # Если ресурс уже есть в кэше, то помечаем его как недавно использованный
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+        # Иначе загружаем ресурс и добавляем его в кэш
+        self.misses += 1
+        asset = loader()
+        self.put(key, asset, size(asset))
+        return asset
+
+    def put(self, key: Hashable, asset: Any, nbytes: int):
+        """Добавление ресурса в кэш
+
+        :param key: ключ ресурса
+        :param asset: ресурс
+        :param nbytes: размер ресурса в байтах"""
+
+        if key in self.entries:
+            self.used -= self.entries[key][1]
+        self.entries[key] = (asset, nbytes)
+        self.entries.move_to_end(key)
+        self.used += nbytes
+        self.evict()
+
+    def evict(self):
+        """Вытеснение давно не используемых ресурсов, пока кэш не уложится в бюджет"""
+
+        # Перебираем ресурсы начиная с самого давно использованного
+        for key in list(self.entries):
+            if self.used <= self.budget:
+                break
+            if key in self.pinned:
+                continue
+            self.used -= self.entries.pop(key)[1]
+
+    def discard(self, key: Hashable):
+        """Удаление ресурса из кэша, если он не закреплён
+
+        :param key: ключ ресурса"""
+
+        if key in self.entries and key not in self.pinned:
+            self.used -= self.entries.pop(key)[1]
+
+    def pin(self, key: Hashable):
+        """Закрепление ресурса в кэше, чтобы он не вытеснялся
+
+        Ресурс можно закрепить несколько раз, тогда его нужно столько же раз открепить
+
+        :param key: ключ ресурса"""
+
+        self.pinned[key] += 1
+
+    def unpin(self, key: Hashable) -> bool:
+        """Открепление ресурса, после чего он снова может быть вытеснен
+
+        :param key: ключ ресурса
+        :return: откреплён ли ресурс полностью"""
+
+        self.pinned[key] -= 1
+        if self.pinned[key] > 0:
+            return False
+
+        del self.pinned[key]
+        self.evict()
+        return True
+
+    @contextmanager
+    def record(self):
+        """Запись ключей всех ресурсов, запрошенных внутри блока with
+
+        :return: множество, в которое записываются ключи"""
+
+        keys = set()
+        self.recorders.append(keys)
+        try:
+            yield keys
+        finally:
+            self.recorders.remove(keys)
+
+    def get_size(self, keys) -> int:
+        """Подсчёт памяти, которую занимают ресурсы
+
+        :param keys: ключи ресурсов
+        :return: размер ресурсов в байтах, которые есть в кэше"""
+
+        return sum(self.entries[key][1] for key in keys if key in self.entries)
+
+    def clear(self):
+        """Очистка кэша (закреплённые ресурсы тоже удаляются)"""
+
+        self.entries.clear()
+        self.pinned.clear()
+        self.used = 0
+
+    def stats(self) -> dict:
+        """Статистика кэша
+
+        :return: словарь с количеством попаданий, промахов, записей и занятой памятью"""
+
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0,
+            'entries': len(self.entries),
+            'pinned': len(self.pinned),
+            'used': self.used,
+            'budget': self.budget
+        }
+
+
+# Кэш ресурсов, общий для всей игры
+asset_cache = AssetCache(64 * 1024 * 1024)
+
+# Приводить ли загруженные изображения к формату экрана
+convert_images = True
+
+# Ключи изображений, загруженных до создания окна, которые нужно привести к формату экрана
+pending_conversion = []
+
+# Цвет, который используется как прозрачный для изображений с полностью прозрачными или непрозрачными пикселями
+COLOR_KEY = (255, 0, 255)
+
+# Время симуляции в миллисекундах для безголового режима, None - используются настоящие часы
+simulated_ticks = None
+
+
+def get_ticks() -> int:
+    """Получение игрового времени
+
+    :return: время в миллисекундах с запуска игры или время симуляции в безголовом режиме"""
+
+    if simulated_ticks is not None:
+        return simulated_ticks
+    return pygame.time.get_ticks()
+
+
+def get_base_path():
+    """Получает путь к папке, в которой лежат ресурсы и кэш сборки"""
 
     # Если программа запущена из exe-файла
     try:
         # То путь к ресурсам - в временной папке из переменной окружения
-        base_path = sys._MEIPASS
+        return sys._MEIPASS
     except Exception:
         # Если не удалось загрузить - ресурсы лежат в рабочей директории
-        base_path = os.path.abspath(".")
+        return os.path.abspath(".")
+
+
+def get_resource_path(asset_type, asset_name):
+    """Получает путь к ресурсу"""
 
     # Возвращаем путь к ресурсу
-    return os.path.join(base_path, 'assets', f'{asset_type}s', asset_name)
+    return os.path.join(get_base_path(), 'assets', f'{asset_type}s', asset_name)
+
+
+def get_baked_path(asset_name, size):
+    """Получает путь к заранее уменьшенному изображению в кэше сборки
+
+    :param asset_name: название изображения
+    :param size: размер, до которого уменьшено изображение"""
+
+    name, _ = os.path.splitext(asset_name)
+    return os.path.join(get_base_path(), 'build', 'baked', 'images', f'{name}@{size[0]}x{size[1]}.png')
+
+
+def get_surface_size(surface: pygame.Surface) -> int:
+    """Оценивает размер изображения в байтах"""
+
+    return surface.get_pitch() * surface.get_height()
+
+
+def get_sound_size(sound: pygame.mixer.Sound) -> int:
+    """Оценивает размер декодированного звука в байтах"""
+
+    frequency, size, channels = pygame.mixer.get_init() or (44100, -16, 2)
+    return int(sound.get_length() * frequency * channels * abs(size) // 8)
+
 
+def convert_image(image: pygame.Surface) -> pygame.Surface:
+    """Приводит изображение к формату экрана, чтобы его отрисовка не требовала преобразования пикселей
 
-def load_image(asset_name):
-    """Загружает изображение"""
+    :param image: изображение
+    :return: изображение в формате экрана"""
+
+    # Если у изображения нет попиксельной прозрачности, то оно непрозрачное
+    if not image.get_flags() & pygame.SRCALPHA:
+        return image.convert()
+
+    width, height = image.get_size()
+    visible = pygame.mask.from_surface(image, 0).count()
+    opaque = pygame.mask.from_surface(image, 254).count()
+
+    # Если все пиксели непрозрачные, то прозрачность не нужна
+    if opaque == width * height:
+        return image.convert()
+
+    # Если пиксели либо полностью прозрачные, либо непрозрачные, и цвет прозрачности не используется,
+    # то заменяем прозрачность цветовым ключом, который рисуется быстрее
+    if visible == opaque and not pygame.mask.from_threshold(image, (*COLOR_KEY, 255), (1, 1, 1, 255)).count():
+        keyed = pygame.Surface((width, height)).convert()
+        keyed.fill(COLOR_KEY)
+        keyed.blit(image, (0, 0))
+        keyed.set_colorkey(COLOR_KEY, pygame.RLEACCEL)
+        return keyed
+
+    # Иначе оставляем попиксельную прозрачность
+    return image.convert_alpha()
+
+
+def prepare_image(key, image: pygame.Surface) -> pygame.Surface:
+    """Приводит загруженное изображение к формату экрана, а если окна ещё нет - откладывает это
+
+    :param key: ключ изображения в кэше
+    :param image: загруженное изображение
+    :return: изображение"""
+
+    if not convert_images:
+        return image
+
+    # Если окно ещё не создано, то запоминаем изображение, чтобы преобразовать его позже
+    if pygame.display.get_surface() is None:
+        pending_conversion.append(key)
+        return image
+
+    return convert_image(image)
+
+
+def convert_pending_images():
+    """Приводит к формату экрана изображения, загруженные до создания окна
+
+    Вызывается после pygame.display.set_mode. Объекты, которые уже получили изображение, продолжают
+    использовать исходное, а все следующие загрузки получат преобразованное"""
+
+    for key in pending_conversion:
+        # Изображение могло быть вытеснено из кэша
+        if key not in asset_cache.entries:
+            continue
+        image = convert_image(asset_cache.entries[key][0])
+        asset_cache.put(key, image, get_surface_size(image))
+    pending_conversion.clear()
+
+
+def load_image(asset_name, size=None):
+    """Загружает изображение
+
+    Изображение кэшируется и общее для всех вызовов, поэтому перед изменением его нужно скопировать
+
+    :param asset_name: название изображения
+    :param size: размер, до которого нужно уменьшить изображение (если не указан - исходный размер)"""
+
+    # Если размер указан, то берём заранее уменьшенное изображение
+    if size is not None:
+        size = (int(size[0]), int(size[1]))
+        key = ('image', asset_name, size)
+        return asset_cache.get(key, lambda: prepare_image(key, load_scaled_image(asset_name, size)), get_surface_size)
 
     # Получаем путь к ресурсу
     asset_path = get_resource_path('image', asset_name)
 
-    # Загружаем изображение
-    image = pygame.image.load(asset_path)
+    # Загружаем изображение (или берём его из кэша)
+    key = ('image', asset_name)
+    image = asset_cache.get(key, lambda: prepare_image(key, pygame.image.load(asset_path)), get_surface_size)
 
     # Возвращаем загруженное изображение
     return image
 
 
+def load_scaled_image(asset_name, size):
+    """Загружает изображение нужного размера из кэша сборки, а если его там нет - уменьшает исходное"""
+
+    # Если изображение было подготовлено командой bake.py, то загружаем его
+    baked_path = get_baked_path(asset_name, size)
+    if os.path.exists(baked_path):
+        return pygame.image.load(baked_path)
+
+    # Иначе загружаем исходное изображение без сохранения в кэш и уменьшаем его
+    return pygame.transform.scale(pygame.image.load(get_resource_path('image', asset_name)), size)
+
+
 def load_sound(asset_name):
     """Загружает звук"""
 
     # Получаем путь к ресурсу
     asset_path = get_resource_path('sound', asset_name)
 
-    # Загружаем звук
-    sound = pygame.mixer.Sound(asset_path)
+    # Загружаем звук (или берём его из кэша)
+    sound = asset_cache.get(('sound', asset_name), lambda: pygame.mixer.Sound(asset_path), get_sound_size)
 
     # Возвращаем загруженный звук
     return sound
 
 
-def load_music(asset_name):
-    """Загружает музыку"""
+def load_music(asset_name) -> bool:
+    """Загружает музыку
+
+    :return: была ли музыка загружена"""
 
     # Получаем путь к ресурсу
     asset_path = get_resource_path('music', asset_name)
 
+    # Если файла с музыкой нет, то играем без неё
+    if not os.path.exists(asset_path):
+        return False
+
     # Загружаем музыку
     pygame.mixer.music.load(asset_path)
+    return True
 
 
 def load_font(asset_name, size):
@@ -60,8 +364,330 @@ def load_font(asset_name, size):
     # Получаем путь к ресурсу
     asset_path = get_resource_path('font', asset_name)
 
-    # Загружаем шрифт
-    font = pygame.font.Font(asset_path, size)
+    # Загружаем шрифт (или берём его из кэша), размер шрифта оцениваем по размеру файла
+    font = asset_cache.get(
+        ('font', asset_name, size),
+        lambda: pygame.font.Font(asset_path, size),
+        lambda _: os.path.getsize(asset_path)
+    )
 
     # Возвращаем загруженный шрифт
-    return font
\ No newline at end of file
+    return font
+
+
+def load_manifest() -> dict:
+    """Загрузка манифеста ресурсов
+
+    :return: словарь с исходными изображениями, фонами стен, изображениями и их размерами в игре,
+        изображениями каждой стены, звуками и шрифтами"""
+
+    with open(os.path.join(get_base_path(), 'assets', 'manifest.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def get_manifest_keys(walls: tuple[int, ...] = None) -> list[tuple]:
+    """Получение ключей ресурсов из манифеста
+
+    :param walls: стены, ресурсы которых нужны, None - все стены. Общие ресурсы, которые
+        не относятся ни к одной стене, нужны всегда
+    :return: список ключей ресурсов"""
+
+    manifest = load_manifest()
+
+    # Изображения, которые используются только на ненужных стенах, пропускаем
+    skipped = set()
+    if walls is not None:
+        for wall, names in manifest['walls'].items():
+            if int(wall) not in walls:
+                skipped.update(names)
+        for wall in walls:
+            skipped.difference_update(manifest['walls'][str(wall)])
+
+    keys = [('image', name) for name in manifest['sources']]
+    keys.extend(
+        ('image', name) for wall, name in enumerate(manifest['backgrounds']) if walls is None or wall in walls
+    )
+    for name, sizes in manifest['images'].items():
+        if name not in skipped:
+            keys.extend(('image', name, tuple(size)) for size in sizes)
+    keys.extend(('sound', name) for name in manifest['sounds'])
+    for name, sizes in manifest['fonts'].items():
+        keys.extend(('font', name, size) for size in sizes)
+    return keys
+
+
+def decode_asset(key: tuple):
+    """Чтение и декодирование ресурса, выполняется в фоновом потоке
+
+    Шрифты только читаются: FreeType не потокобезопасен, поэтому шрифт создаётся в основном потоке
+
+    :param key: ключ ресурса
+    :return: декодированный ресурс и время декодирования в секундах"""
+
+    start = time.perf_counter()
+    asset_type, asset_name = key[:2]
+
+    if asset_type == 'image' and len(key) > 2:
+        # Изображение нужного размера берём из кэша сборки, а если его нет - уменьшаем исходное
+        asset = load_scaled_image(asset_name, key[2])
+    elif asset_type == 'image':
+        with open(get_resource_path('image', asset_name), 'rb') as f:
+            asset = pygame.image.load(io.BytesIO(f.read()), asset_name)
+    elif asset_type == 'sound':
+        with open(get_resource_path('sound', asset_name), 'rb') as f:
+            asset = pygame.mixer.Sound(io.BytesIO(f.read()))
+    else:
+        with open(get_resource_path('font', asset_name), 'rb') as f:
+            asset = f.read()
+
+    return asset, time.perf_counter() - start
+
+
+class AssetLoader:
+    """Параллельная загрузка ресурсов в кэш
+
+    Чтение файлов и декодирование выполняется в фоновых потоках, а в основном потоке ресурсы только
+    приводятся к формату экрана, шрифты создаются из прочитанных файлов, и всё добавляется в кэш
+    при вызове poll"""
+
+    def __init__(self, keys: list[tuple], workers: int = None):
+        """Запуск загрузки
+
+        :param keys: ключи ресурсов
+        :param workers: количество фоновых потоков (по умолчанию - по количеству ядер процессора)"""
+
+        # Загружаем только те ресурсы, которых ещё нет в кэше
+        keys = [key for key in keys if key not in asset_cache.entries]
+
+        self.total = len(keys)
+        self.loaded = 0
+
+        # Время загрузки каждого ресурса в секундах
+        self.timings = {}
+
+        self.executor = ThreadPoolExecutor(workers or os.cpu_count())
+        self.futures = {self.executor.submit(decode_asset, key): key for key in keys}
+
+    def poll(self) -> float:
+        """Добавление в кэш ресурсов, которые уже декодированы
+
+        :return: доля загруженных ресурсов от 0 до 1"""
+
+        for future in [future for future in self.futures if future.done()]:
+            key = self.futures.pop(future)
+            try:
+                asset, decode_time = future.result()
+            except Exception:
+                # Если ресурс не удалось декодировать в фоне, то загружаем его в основном потоке
+                start = time.perf_counter()
+                self.load_directly(key)
+                self.timings[key] = time.perf_counter() - start
+                self.loaded += 1
+                continue
+
+            # Приводим изображения к формату экрана и создаём шрифты (это можно делать только в основном потоке)
+            start = time.perf_counter()
+            if key[0] == 'image':
+                asset = prepare_image(key, asset)
+                asset_cache.put(key, asset, get_surface_size(asset))
+            elif key[0] == 'sound':
+                asset_cache.put(key, asset, get_sound_size(asset))
+            else:
+                asset_cache.put(key, pygame.font.Font(io.BytesIO(asset), key[2]), len(asset))
+
+            self.timings[key] = decode_time + time.perf_counter() - start
+            self.loaded += 1
+
+        # Когда всё загружено, останавливаем потоки
+        if not self.futures:
+            self.executor.shutdown()
+
+        return self.loaded / self.total if self.total else 1
+
+    def wait(self, timeout: float):
+        """Ожидание, пока хотя бы один ресурс не будет декодирован, но не дольше timeout
+
+        Пока основной поток ждёт, фоновые потоки не делят с ним процессор
+
+        :param timeout: максимальное время ожидания в секундах"""
+
+        if self.futures:
+            wait(self.futures, timeout, FIRST_COMPLETED)
+
+    def load_directly(self, key: tuple):
+        """Загрузка ресурса в основном потоке
+
+        :param key: ключ ресурса"""
+
+        try:
+            load_asset(key)
+        except Exception as error:
+            # Остальные ресурсы уже не нужны, а в ошибке указываем, какой ресурс не загрузился
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            path = get_resource_path(key[0], key[1])
+            raise RuntimeError(f"Не удалось загрузить ресурс {' '.join(map(str, key))} ({path}): {error}") from error
+
+    @property
+    def finished(self) -> bool:
+        """Загружены ли все ресурсы"""
+
+        return not self.futures
+
+    def report(self) -> str:
+        """Отчёт о времени загрузки ресурсов, начиная с самых долгих
+
+        :return: текст отчёта"""
+
+        lines = []
+        for key, seconds in sorted(self.timings.items(), key=lambda item: item[1], reverse=True):
+            lines.append(f"{seconds * 1000:8.2f} мс  {' '.join(map(str, key))}")
+        return "\n".join(lines)
+
+
+class TextCache:
+    """Кэш отрисованного текста с вытеснением давно не используемого (LRU)
+    и набором отдельных символов для коротких строк, например цифр кода"""
+
+    def __init__(self, capacity: int):
+        """Создание кэша
+
+        :param capacity: максимальное количество отрисованных строк в кэше"""
+
+        self.capacity = capacity
+
+        # Отрисованные строки в порядке последнего использования: ключ -> изображение
+        self.entries = OrderedDict()
+
+        # Отрисованные символы: (шрифт, размер, цвет) -> {символ: изображение}
+        self.glyphs = {}
+
+        # Счётчики попаданий и промахов для строк и для символов
+        self.hits = 0
+        self.misses = 0
+        self.glyph_hits = 0
+        self.glyph_misses = 0
+
+    def render(self, font_name: str, size: int, text: str, color, antialias: bool = True) -> pygame.Surface:
+        """Отрисовка строки или получение её из кэша
+
+        Изображение общее для всех вызовов, поэтому его нельзя изменять
+
+        :param font_name: название шрифта
+        :param size: размер шрифта
+        :param text: текст
+        :param color: цвет текста
+        :param antialias: сглаживать ли текст
+        :return: изображение с текстом"""
+
+        key = (font_name, size, text, tuple(color), antialias)
+
+        # Если строка уже отрисована, то помечаем её как недавно использованную
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        # Иначе отрисовываем строку и вытесняем самую давно использованную, если кэш переполнен
+        self.misses += 1
+        image = prepare_text(load_font(font_name, size).render(text, antialias, color))
+        self.entries[key] = image
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        return image
+
+    def blit_glyphs(self, target: pygame.Surface, pos: tuple[int, int], font_name: str, size: int, text: str, color):
+        """Отрисовка строки посимвольно из набора символов, без создания новых изображений
+
+        Подходит для коротких строк из небольшого набора символов, например цифр
+
+        :param target: изображение, на котором рисуется строка
+        :param pos: позиция левого верхнего угла строки
+        :param font_name: название шрифта
+        :param size: размер шрифта
+        :param text: текст
+        :param color: цвет текста"""
+
+        atlas = self.glyphs.setdefault((font_name, size, tuple(color)), {})
+        x, y = pos
+
+        for char in text:
+            glyph = atlas.get(char)
+            if glyph is None:
+                self.glyph_misses += 1
+                glyph = atlas[char] = prepare_text(load_font(font_name, size).render(char, True, color))
+            else:
+                self.glyph_hits += 1
+            target.blit(glyph, (x, y))
+            x += glyph.get_width()
+
+    def stats(self) -> dict:
+        """Статистика кэша
+
+        :return: словарь с попаданиями и промахами для строк и символов"""
+
+        total = self.hits + self.misses
+        glyph_total = self.glyph_hits + self.glyph_misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0,
+            'entries': len(self.entries),
+            'capacity': self.capacity,
+            'glyph_hits': self.glyph_hits,
+            'glyph_misses': self.glyph_misses,
+            'glyph_hit_rate': self.glyph_hits / glyph_total if glyph_total else 0,
+            'glyphs': sum(len(atlas) for atlas in self.glyphs.values())
+        }
+
+
+def prepare_text(image: pygame.Surface) -> pygame.Surface:
+    """Приводит изображение с текстом к формату экрана, если окно уже создано"""
+
+    if convert_images and pygame.display.get_surface() is not None:
+        return image.convert_alpha()
+    return image
+
+
+# Кэш отрисованного текста, общий для всей игры
+text_cache = TextCache(256)
+
+
+def render_text(font_name, size, text, color=(255, 255, 255), antialias=True):
+    """Отрисовывает текст (или берёт его из кэша)"""
+
+    return text_cache.render(font_name, size, text, color, antialias)
+
+
+def blit_glyphs(target, pos, font_name, size, text, color=(255, 255, 255)):
+    """Рисует короткий текст посимвольно из кэша символов"""
+
+    text_cache.blit_glyphs(target, pos, font_name, size, text, color)
+
+
+# Функции загрузки для каждого типа ресурса, используются при предзагрузке
+ASSET_LOADERS = {
+    'image': load_image,
+    'sound': load_sound,
+    'font': load_font
+}
+
+
+def load_asset(key: tuple):
+    """Загрузка ресурса по ключу кэша (или получение его из кэша)
+
+    :param key: ключ ресурса, например ('image', 'paper.png', (24, 24))
+    :return: ресурс"""
+
+    return ASSET_LOADERS[key[0]](*key[1:])
+
+
+def preload_assets(*keys: tuple, pin: bool = False):
+    """Предзагрузка ресурсов в кэш
+
+    :param keys: ключи ресурсов, например ('image', 'paper.png') или ('font', 'arkhip.ttf', 24)
+    :param pin: закрепить ли ресурсы в кэше"""
+
+    for key in keys:
+        load_asset(key)
+        if pin:
+            asset_cache.pin(key)